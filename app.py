@@ -1,11 +1,21 @@
+import contextvars
 import os
+import tempfile
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import pandas as pd
 from dotenv import load_dotenv
 
-from nlsql import nl_to_sql
-from db import run_query
+from nlsql import nl_to_sql, template_stats
+from arrow_results import EXPORT_FORMATS
+from db import (data_version, fetch_page, get_query_engine, iter_arrow, PAGE_SIZE, QueryControl, QueryBudgetExceeded,
+                QueryCancelled)
+from fewshot_library import get_library
+from llm import get_backend
+from result_store import ResultStore
+import tracing
 
 load_dotenv()
 
@@ -27,43 +37,265 @@ with st.expander("Examples you can click", expanded=True):
 
 query = st.text_area("Your question", value=st.session_state.get('user_query', ''), height=100, placeholder="e.g., Which landlords generated the most revenue this year?")
 
-colA, colB = st.columns([1,1])
+colA, colB, colC = st.columns([1,1,1])
 with colA:
     run_btn = st.button("Generate SQL & Run", type="primary")
 with colB:
     show_sql_box = st.checkbox("Show generated SQL", value=True)
+with colC:
+    show_diagnostics = st.checkbox("Show diagnostics", value=False)
 
+@st.cache_resource
+def _metrics_server():
+    """Expose Prometheus metrics on METRICS_PORT (if set) once per server process."""
+    return tracing.start_metrics_server()
+
+
+@st.cache_resource
+def _shared_resources():
+    """Model client, query engine and few-shot index, built once per server process."""
+    return get_backend(), get_query_engine(), get_library()
+
+
+_shared_resources()
+
+
+_metrics_server()
+
+
+@st.cache_resource
+def _query_executor() -> ThreadPoolExecutor:
+    """Shared pool so queries run off the script thread and can be cancelled."""
+    return ThreadPoolExecutor(max_workers=int(os.getenv("QUERY_WORKERS", "8")), thread_name_prefix="query")
+
+
+NO_SORT = "(query order)"
+
+
+def _result_store() -> ResultStore:
+    """This session's recent answers and fetched pages."""
+    if 'result_store' not in st.session_state:
+        st.session_state['result_store'] = ResultStore()
+    return st.session_state['result_store']
+
+
+def _active_entry():
+    return _result_store().get(st.session_state.get('active_entry'))
+
+
+def _change_page(delta: int):
+    entry = _active_entry()
+    if entry is not None:
+        entry.page = max(0, entry.page + delta)
+    st.session_state.pop('query_stopped', None)
+
+
+def _change_sort():
+    entry = _active_entry()
+    if entry is not None:
+        column = st.session_state.get('sort_by')
+        entry.sort_by = None if column == NO_SORT else column
+        entry.descending = st.session_state.get('sort_desc', False)
+        entry.page = 0
+    st.session_state.pop('query_stopped', None)
+
+
+def _change_entry():
+    st.session_state['active_entry'] = st.session_state.get('history')
+    st.session_state.pop('query_stopped', None)
+
+
+def _cancel_query():
+    control = st.session_state.get('query_control')
+    if control is not None:
+        control.cancel()
+
+
+def _submit(fn, *args, **kwargs):
+    """Start fn(*args, **kwargs, control=...) on the pool; a Cancel click can interrupt it."""
+    previous = st.session_state.get('query_control')
+    if previous is not None:
+        # A rerun abandoned the previous query; don't let it keep a worker busy
+        previous.cancel()
+    control = QueryControl()
+    st.session_state['query_control'] = control
+    # copy_context carries the active trace into the worker thread
+    return _query_executor().submit(contextvars.copy_context().run, fn, *args, control=control, **kwargs)
+
+
+def _wait(future):
+    """Poll a submitted query, showing elapsed time and a Cancel button."""
+    control = st.session_state['query_control']
+    status = st.empty()
+    cancel_slot = st.empty()
+    cancel_slot.button("Cancel query", on_click=_cancel_query)
+    while not future.done():
+        # Each st call gives Streamlit a chance to stop this run when Cancel is clicked
+        status.caption(f"Running query… {time.monotonic() - control.started:.1f}s")
+        time.sleep(0.1)
+    status.empty()
+    cancel_slot.empty()
+    return future.result()
+
+
+def _run_cancellable(fn, *args, **kwargs):
+    return _wait(_submit(fn, *args, **kwargs))
+
+
+def _export(sql: str, fmt: str, control: QueryControl, params=None):
+    """Stream the full result into a temp file on disk, with no DataFrame copy."""
+    control.max_rows = None  # exports are not bounded by the display row budget
+    writer, _ = EXPORT_FORMATS[fmt]
+    out = tempfile.TemporaryFile(buffering=0)
+    for chunk in writer(iter_arrow(sql, params=params, control=control)):
+        out.write(chunk)
+    out.seek(0)
+    return out
+
+
+# A trace covers the run that answers a new question; later reruns (paging) are not traced
+trace = None
 if run_btn and query.strip():
-    with st.spinner("Thinking (Gemini → SQL) and querying DB..."):
+    trace = tracing.Trace(query.strip())
+    st.session_state['trace'] = trace
+    sql_preview = st.empty()
+
+    def _prefetch(early):
+        """The SQL is ready while the model is still writing its notes: show it and start page one."""
+        if show_sql_box:
+            sql_preview.code(early['sql'], language='sql')
+        future = _submit(fetch_page, early['sql'], 0, PAGE_SIZE)
+        st.session_state['prefetch'] = (early['sql'], future, st.session_state['query_control'])
+
+    def _drop_prefetch():
+        """The answer was rejected or failed after page one started: stop that query."""
+        prefetch = st.session_state.pop('prefetch', None)
+        if prefetch is not None:
+            prefetch[2].cancel()
+            if st.session_state.get('query_control') is prefetch[2]:
+                # Not a user cancel; the next answer shouldn't report it as one
+                st.session_state.pop('query_control')
+
+    _drop_prefetch()
+    with st.spinner("Thinking (Gemini → SQL) and querying DB..."), tracing.use_trace(trace):
         try:
-            result = nl_to_sql(query.strip())
+            result = nl_to_sql(query.strip(), on_sql=_prefetch)
+            sql_preview.empty()
             if not result or not result.get('sql'):
+                _drop_prefetch()
+                st.session_state.pop('active_entry', None)
                 st.error("Sorry, unable to answer at this point in time.")
             else:
-                sql = result['sql']
-                notes = result.get('notes', '')
-                conf = result.get('confidence', 0.0)
-                if show_sql_box:
-                    st.code(sql, language='sql')
-                    st.caption(f"Model confidence: {conf:.2f} — {notes}")
-
-                try:
-                    df = run_query(sql)
-                    if df.empty:
-                        st.warning("No rows found.")
-                    else:
-                        st.success(f"Returned {len(df)} row(s).")
-                        st.dataframe(df, use_container_width=True)
-                except Exception as db_ex:
-                    st.error("Sorry, unable to answer at this point in time.")
-                    st.stop()
+                entry = _result_store().add(query.strip(), result)
+                st.session_state['active_entry'] = entry.entry_id
+                st.session_state.pop('query_stopped', None)
         except Exception as e:
+            _drop_prefetch()
             st.error("Sorry, unable to answer at this point in time.")
             st.caption(str(e))
             st.caption(traceback.format_exc())
 elif run_btn:
     st.warning("Please enter a question.")
 
+store = _result_store()
+if len(store.entries()) > 1:
+    st.session_state['history'] = st.session_state.get('active_entry')
+    st.selectbox("Recent questions", [e.entry_id for e in store.entries()], key='history',
+                 format_func=lambda entry_id: store.get(entry_id).question, on_change=_change_entry)
+
+entry = _active_entry()
+if entry:
+    sql = entry.sql
+    if show_sql_box:
+        st.code(sql, language='sql')
+        if entry.params:
+            st.caption("Parameters: " + ", ".join(f":{name} = {value!r}" for name, value in entry.params.items()))
+        st.caption(f"Model confidence: {entry.confidence:.2f} — {entry.notes}")
+
+    control = st.session_state.get('query_control')
+    if control is not None and control.cancelled.is_set():
+        st.session_state['query_stopped'] = "Query cancelled."
+        st.session_state.pop('query_control', None)
+
+    page = None
+    if st.session_state.get('query_stopped'):
+        st.warning(st.session_state['query_stopped'])
+    else:
+        version = data_version()
+        page = store.page(entry, version)
+        try:
+            if page is None:
+                prefetch = st.session_state.pop('prefetch', None)
+                with tracing.use_trace(trace):
+                    if prefetch is not None and prefetch[0] == sql and entry.page == 0 and entry.sort_by is None:
+                        page = _wait(prefetch[1])
+                    else:
+                        page = _run_cancellable(fetch_page, sql, entry.page, PAGE_SIZE, order_by=entry.sort_by,
+                                                descending=entry.descending, params=entry.params)
+                store.put_page(entry, version, page)
+        except QueryCancelled as ex:
+            st.session_state['query_stopped'] = f"Query cancelled. {ex}"
+            st.warning(st.session_state['query_stopped'])
+        except QueryBudgetExceeded as ex:
+            st.session_state['query_stopped'] = f"The query was too expensive and was stopped. {ex}"
+            st.warning(st.session_state['query_stopped'])
+        except Exception as db_ex:
+            st.error("Sorry, unable to answer at this point in time.")
+
+    if page is None:
+        pass
+    elif page.df.empty and page.page == 0:
+        st.warning("No rows found.")
+    else:
+        first = page.page * page.page_size + 1
+        last = first + len(page.df) - 1
+        more = " (more available)" if page.has_more else ""
+        st.success(f"Showing rows {first}–{last}{more}.")
+        # Sorting runs in SQL over the whole result, not just this page
+        sort_col, desc_col = st.columns([3, 1])
+        st.session_state['sort_by'] = entry.sort_by or NO_SORT
+        st.session_state['sort_desc'] = entry.descending
+        with sort_col:
+            st.selectbox("Sort by", [NO_SORT] + entry.columns, key='sort_by', on_change=_change_sort)
+        with desc_col:
+            st.checkbox("Descending", key='sort_desc', on_change=_change_sort, disabled=entry.sort_by is None)
+        with tracing.use_trace(trace), tracing.span("render", rows=len(page.df)):
+            st.dataframe(page.df, use_container_width=True)
+        prev_col, next_col = st.columns([1, 1])
+        with prev_col:
+            st.button("◀ Previous page", on_click=_change_page, args=(-1,), disabled=page.page == 0)
+        with next_col:
+            st.button("Next page ▶", on_click=_change_page, args=(1,), disabled=not page.has_more)
+
+        with st.expander("Download full result"):
+            fmt = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+            if st.button("Prepare download"):
+                try:
+                    export = _run_cancellable(_export, sql, fmt, params=entry.params)
+                    st.download_button(f"Download result.{fmt}", export, file_name=f"result.{fmt}",
+                                       mime=EXPORT_FORMATS[fmt][1])
+                except QueryBudgetExceeded as ex:
+                    st.warning(f"Export stopped. {ex}")
+
+if trace is not None:
+    trace.finish()
+
+last_trace = st.session_state.get('trace')
+if show_diagnostics and last_trace is not None:
+    with st.expander("Diagnostics — latest question", expanded=True):
+        if last_trace.error:
+            st.error(last_trace.error)
+        totals = last_trace.stage_totals()
+        if totals:
+            st.caption(f"Total {last_trace.duration_ms or sum(totals.values()):.1f} ms · "
+                       + " · ".join(f"{k}: {v}" for k, v in last_trace.attrs.items()))
+            st.bar_chart(pd.DataFrame({"ms": totals}))
+            st.dataframe(pd.DataFrame(last_trace.spans), use_container_width=True)
+        st.caption(f"Session result store: {_result_store().stats()}")
+        st.caption(f"SQL templates (LLM bypass): {template_stats()}")
+        with st.expander("Prometheus metrics (this process)"):
+            st.code(tracing.render_prometheus(), language="text")
+
 st.divider()
 st.markdown(
     """
@@ -0,0 +1,198 @@
+# arrow_results.py
+"""Columnar (Apache Arrow) result building and streaming export.
+
+SQLite hands back untyped tuples: DECIMAL columns come back as a mix of int
+and float, and dates come back as text. BatchBuilder turns each fetchmany()
+chunk into a typed RecordBatch. It types a result column by the model
+column of the same name (DECIMAL → float64 or decimal128, Date → date32,
+DateTime → timestamp) when the first batch's values fit that type; a
+computed value aliased to a model column name keeps its own type. Other
+columns are inferred from the first batch, and ISO date strings are
+promoted to date32. The schema is fixed by the first
+batch; a later value that does not fit is cast to it.
+
+write_csv/write_parquet turn a batch iterator into a byte stream, so an
+export never holds more than one batch (plus a Parquet row group) in memory.
+"""
+import io
+import os
+import re
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Sequence
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Build query DataFrames through Arrow (typed columns) instead of row tuples
+ARROW_RESULTS = os.getenv("ARROW_RESULTS", "1") != "0"
+ARROW_BATCH_ROWS = int(os.getenv("ARROW_BATCH_ROWS", "65536"))
+# "float64" (default) or "decimal128" for money columns such as rent_price and amount
+ARROW_DECIMAL = os.getenv("ARROW_DECIMAL", "float64")
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_column_types: Optional[Dict[str, pa.DataType]] = None
+
+
+def _arrow_type(col_type) -> Optional[pa.DataType]:
+    from sqlalchemy import DECIMAL, Date, DateTime, Enum, Integer, String, Text
+
+    if isinstance(col_type, DECIMAL):
+        if ARROW_DECIMAL == "decimal128":
+            return pa.decimal128(col_type.precision or 38, col_type.scale or 0)
+        return pa.float64()
+    if isinstance(col_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(col_type, Date):
+        return pa.date32()
+    if isinstance(col_type, Integer):
+        return pa.int64()
+    if isinstance(col_type, (String, Text, Enum)):
+        return pa.string()
+    return None
+
+
+def column_types() -> Dict[str, pa.DataType]:
+    """Arrow type per model column name (names whose type differs between tables are left out)."""
+    global _column_types
+    if _column_types is None:
+        from models import Base
+
+        types: Dict[str, Any] = {}
+        for table in Base.metadata.sorted_tables:
+            for col in table.columns:
+                typ = _arrow_type(col.type)
+                if col.name in types and types[col.name] != typ:
+                    typ = None
+                types[col.name] = typ
+        _column_types = {name: typ for name, typ in types.items() if typ is not None}
+    return _column_types
+
+
+def _to_type(values: Sequence[Any], typ: pa.DataType) -> pa.Array:
+    """Values as an array of `typ`, tolerating SQLite's per-value typing."""
+    try:
+        if pa.types.is_decimal(typ) or pa.types.is_temporal(typ):
+            # From doubles / ISO text via Arrow casts
+            return pa.array(values).cast(typ)
+        return pa.array(values, type=typ)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        pass
+    try:
+        return pa.array(values).cast(typ, safe=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        if pa.types.is_string(typ):
+            return pa.array([None if v is None else str(v) for v in values], type=typ)
+        raise
+
+
+def _fits(values: Sequence[Any], typ: pa.DataType) -> bool:
+    try:
+        _to_type(values, typ)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        return False
+    return True
+
+
+def _infer(name: str, values: Sequence[Any]) -> pa.DataType:
+    """The model column's type when the values fit it, else the values' own type.
+
+    A computed value aliased to a model column name (strftime(...) AS
+    payment_date) keeps the type of what it holds.
+    """
+    typ = column_types().get(name)
+    if typ is not None and _fits(values, typ):
+        return typ
+    try:
+        inferred = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    if pa.types.is_null(inferred):
+        return pa.string()
+    if pa.types.is_string(inferred):
+        present = [v for v in values if v is not None]
+        if present and all(_ISO_DATE.match(v) for v in present):
+            return pa.date32()
+    return inferred
+
+
+class BatchBuilder:
+    """Turns row tuples from one cursor into RecordBatches with a stable schema."""
+
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+        self.schema: Optional[pa.Schema] = None
+
+    def build(self, rows: List[tuple]) -> pa.RecordBatch:
+        by_column = list(zip(*rows)) if rows else [() for _ in self.columns]
+        if self.schema is None:
+            self.schema = pa.schema([(name, _infer(name, values)) for name, values in zip(self.columns, by_column)])
+        arrays = [_to_type(values, field.type) for field, values in zip(self.schema, by_column)]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+    def empty(self) -> pa.RecordBatch:
+        if self.schema is None:
+            self.schema = pa.schema([(name, column_types().get(name, pa.string())) for name in self.columns])
+        return pa.RecordBatch.from_pylist([], schema=self.schema)
+
+
+def to_pandas(table: pa.Table) -> pd.DataFrame:
+    """DataFrame for display; dates stay datetime.date, decimals stay Decimal."""
+    return table.to_pandas(date_as_object=True)
+
+
+def write_csv(batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """CSV bytes, one chunk per batch; the header comes with the first one."""
+    header = True
+    for batch in batches:
+        buf = io.BytesIO()
+        pa_csv.write_csv(batch, buf, pa_csv.WriteOptions(include_header=header))
+        header = False
+        yield buf.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file object whose contents are taken out after each row group."""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.chunks.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def write_parquet(batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """Parquet bytes: one row group per batch, flushed as it is written."""
+    sink = _Sink()
+    writer: Optional[pq.ParquetWriter] = None
+    try:
+        for batch in batches:
+            if writer is None:
+                writer = pq.ParquetWriter(sink, batch.schema, compression="zstd")
+            writer.write_batch(batch)
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        if writer is not None:
+            writer.close()
+    data = sink.take()
+    if data:
+        yield data
+
+
+EXPORT_FORMATS = {
+    "csv": (write_csv, "text/csv"),
+    "parquet": (write_parquet, "application/vnd.apache.parquet"),
+}
@@ -0,0 +1,232 @@
+# batch.py
+"""Run a JSONL file of questions through nl_to_sql + run_query concurrently.
+
+Input lines look like requests.jsonl: {"request_id": ..., "title": ..., "body": ...}
+(a "question" field, if present, wins over "body"). Each finished question is
+appended to the output JSONL as soon as it completes, so an interrupted run
+(Ctrl-C drops the queued questions instead of waiting for them) can be
+restarted with the same arguments and only unfinished questions are sent to
+the LLM again. A restart first rewrites the output to one line per
+request_id, dropping llm_error records because those questions are retried,
+so the file never holds two results for one question.
+
+    python batch.py questions.jsonl -o results.jsonl --concurrency 8 --rate 2
+"""
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Optional, Dict, Any, List, Set
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+def retry_with_backoff(fn, retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+    """Call fn(), retrying on exceptions with exponential backoff and full jitter."""
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception:
+            if attempt >= retries:
+                raise
+            time.sleep(random.uniform(0, min(max_delay, base_delay * (2 ** attempt))))
+            attempt += 1
+
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            text = item.get("question") or item.get("body") or item.get("title")
+            if not text:
+                continue
+            qid = str(item.get("request_id") or item.get("id") or lineno)
+            questions.append({"request_id": qid, "question": text})
+    return questions
+
+
+def compact_checkpoint(path: str) -> Set[str]:
+    """Rewrite the output file to its finished records, one per request_id, and return their ids.
+
+    The last record per id wins; llm_error records (retried on resume) and a
+    torn last line are dropped.
+    """
+    if not os.path.exists(path):
+        return set()
+    records: Dict[str, str] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") != "llm_error":
+                records[record["request_id"]] = json.dumps(record, default=str)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(line + "\n" for line in records.values())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return set(records)
+
+
+def _execute(record: Dict[str, Any], max_rows: int) -> Dict[str, Any]:
+    from db import run_query
+
+    started = time.perf_counter()
+    try:
+        df = run_query(record["sql"], params=record.get("params"))
+    except Exception as e:
+        record.update(status="sql_error", error=str(e))
+    else:
+        record.update(
+            status="ok",
+            row_count=len(df),
+            columns=list(df.columns),
+            rows=json.loads(df.head(max_rows).to_json(orient="values", date_format="iso")),
+        )
+    record["execute_seconds"] = round(time.perf_counter() - started, 4)
+    return record
+
+
+def run_batch(input_path: str, output_path: str, concurrency: int = 4, rate: float = 2.0,
+              burst: Optional[float] = None, retries: int = 3, sql_workers: int = 2,
+              max_rows: int = 200) -> Dict[str, int]:
+    """Translate and execute every question in `input_path`, appending to `output_path`.
+
+    `output_path` ends up with exactly one line per finished request_id (see
+    compact_checkpoint). On KeyboardInterrupt the queued questions are
+    cancelled instead of awaited, and the interrupt is re-raised.
+    """
+    from nlsql import nl_to_sql
+
+    questions = load_questions(input_path)
+    done = compact_checkpoint(output_path)
+    pending = [q for q in questions if q["request_id"] not in done]
+    bucket = TokenBucket(rate, burst)
+    write_lock = threading.Lock()
+    summary = {"total": len(questions), "skipped": len(questions) - len(pending)}
+
+    def translate(q: Dict[str, str]) -> Dict[str, Any]:
+        record: Dict[str, Any] = dict(q)
+        started = time.perf_counter()
+
+        def call():
+            bucket.acquire()
+            return nl_to_sql(q["question"], raise_errors=True)
+
+        try:
+            result = retry_with_backoff(call, retries=retries)
+        except Exception as e:
+            record.update(status="llm_error", error=str(e))
+            result = None
+        else:
+            if not result or not result.get("sql"):
+                record["status"] = "unanswerable"
+            else:
+                record.update(sql=result["sql"], confidence=result.get("confidence"), notes=result.get("notes"))
+                if result.get("params"):
+                    record["params"] = result["params"]
+        record["translate_seconds"] = round(time.perf_counter() - started, 4)
+        return record
+
+    out = open(output_path, "a", encoding="utf-8")
+    llm_pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm")
+    sql_pool = ThreadPoolExecutor(max_workers=sql_workers, thread_name_prefix="sql")
+
+    def write(record: Dict[str, Any]) -> None:
+        with write_lock:
+            if out.closed:
+                # Finished after an interrupt; the next run does it again
+                return
+            out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            summary[record["status"]] = summary.get(record["status"], 0) + 1
+
+    try:
+        executions = []
+        for fut in as_completed([llm_pool.submit(translate, q) for q in pending]):
+            record = fut.result()
+            if "sql" in record:
+                execution = sql_pool.submit(_execute, record, max_rows)
+                execution.add_done_callback(lambda f: f.cancelled() or write(f.result()))
+                executions.append(execution)
+            else:
+                write(record)
+        wait(executions)
+    except KeyboardInterrupt:
+        # Don't wait for every queued translation; what is written so far is the checkpoint
+        llm_pool.shutdown(wait=False, cancel_futures=True)
+        sql_pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    else:
+        llm_pool.shutdown()
+        sql_pool.shutdown()
+    finally:
+        with write_lock:
+            out.close()
+
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Batch NL→SQL over a JSONL file of questions.")
+    parser.add_argument("input", help="JSONL file with request_id/title/body (or question) per line")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="JSONL output / checkpoint file")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent LLM calls")
+    parser.add_argument("--rate", type=float, default=2.0, help="LLM calls per second (0 disables the limit)")
+    parser.add_argument("--burst", type=float, default=None, help="Token bucket capacity")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per LLM call on errors")
+    parser.add_argument("--sql-workers", type=int, default=2, help="Concurrent SQL executions")
+    parser.add_argument("--max-rows", type=int, default=200, help="Rows stored per result")
+    args = parser.parse_args(argv)
+
+    try:
+        summary = run_batch(args.input, args.output, concurrency=args.concurrency, rate=args.rate,
+                            burst=args.burst, retries=args.retries, sql_workers=args.sql_workers,
+                            max_rows=args.max_rows)
+    except KeyboardInterrupt:
+        print(f"Interrupted; run the same command again to resume from {args.output}")
+        raise SystemExit(130)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
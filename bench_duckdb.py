@@ -0,0 +1,175 @@
+# bench_duckdb.py
+"""SQLite vs DuckDB on aggregate queries, by scale factor.
+
+For each scale factor, bulk-seeds a database (reused from --workdir, the
+same files bench_e2e.py and bench_fts.py use) and builds DuckDB's source
+for it: the Parquet copy (timed) or an ATTACH of the file. It then times
+each query on both engines: the few-shot aggregates, month, stay-length and
+window queries that lean on strftime/julianday, and a point lookup for
+contrast. Every query is checked for the same rows on both engines, and
+the report says whether db.run_query would send it to DuckDB.
+
+    python bench_duckdb.py --scale-factors 1 10 --repeat 5 -o bench_duckdb.json
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+
+import duckdb_backend
+from prompts import FEWSHOTS
+from sql_guard import ALLOWED_TABLES, table_aliases, tokenize
+
+QUERIES: Dict[str, str] = {
+    "monthly_revenue": """SELECT strftime('%Y-%m', payment_date) AS month, COUNT(*) AS payments,
+       ROUND(SUM(amount), 2) AS revenue
+FROM payments WHERE status = 'successful'
+GROUP BY month ORDER BY month""",
+    "stay_length_by_city": """SELECT p.city, COUNT(*) AS bookings,
+       ROUND(AVG(julianday(b.end_date) - julianday(b.start_date)), 2) AS avg_nights
+FROM bookings b JOIN properties p ON p.property_id = b.property_id
+WHERE b.status IN ('confirmed', 'completed')
+GROUP BY p.city ORDER BY bookings DESC, p.city LIMIT 20""",
+    "rent_rank_in_city": """SELECT property_id, city, rent_price,
+       RANK() OVER (PARTITION BY city ORDER BY rent_price DESC) AS city_rank
+FROM properties ORDER BY city, city_rank, property_id LIMIT 50""",
+    "tenant_payment_days": """SELECT tenant_id, COUNT(DISTINCT date(payment_date)) AS days,
+       MAX(payment_date) AS last_payment
+FROM payments GROUP BY tenant_id ORDER BY days DESC, tenant_id LIMIT 20""",
+    "point_lookup": "SELECT * FROM payments WHERE payment_id = 42",
+}
+
+
+def seeded_db(workdir: str, scale_factor: float, workers: Optional[int]) -> str:
+    path = os.path.join(workdir, f"bench_sf{scale_factor:g}.db")
+    if not os.path.exists(path):
+        from sqlalchemy import create_engine
+
+        from models import Base
+        from seed import seed_bulk
+
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+        seed_bulk(engine, scale_factor=scale_factor, workers=workers)
+        engine.dispose()
+    return path
+
+
+def queries() -> Dict[str, str]:
+    """The few-shot aggregates DuckDB can read, then QUERIES."""
+    out = {}
+    for n, ex in enumerate(FEWSHOTS):
+        tokens = tokenize(ex["sql"])
+        if duckdb_backend.is_analytic(tokens) and duckdb_backend.readable_tables(tokens):
+            out[f"fewshot_{n}"] = ex["sql"]
+    out.update(QUERIES)
+    return out
+
+
+def timed(run: Callable[[], List[tuple]], repeat: int) -> Tuple[float, List[tuple]]:
+    runs, rows = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = run()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs), rows
+
+
+def _value(v: Any) -> Any:
+    return v if v is None or isinstance(v, (int, float, str)) else str(v)
+
+
+def same_rows(a: List[tuple], b: List[tuple]) -> bool:
+    """Equal as multisets, floats to 1e-9 relative (the engines sum in different orders)."""
+    if len(a) != len(b):
+        return False
+    key = lambda row: [(v is None, str(type(v)), v if not isinstance(v, float) else round(v, 6)) for v in row]
+    for x, y in zip(sorted(([_value(v) for v in r] for r in a), key=key),
+                    sorted(([_value(v) for v in r] for r in b), key=key)):
+        for u, v in zip(x, y):
+            if isinstance(u, float) or isinstance(v, float):
+                if u is None or v is None or not math.isclose(u, v, rel_tol=1e-9, abs_tol=1e-9):
+                    return False
+            elif u != v:
+                return False
+    return True
+
+
+def routed(conn: sqlite3.Connection, sql: str, table_rows: Dict[str, int]) -> bool:
+    """What db.duckdb_route decides, apart from the Parquet copy being current."""
+    tokens = tokenize(sql)
+    if not duckdb_backend.is_analytic(tokens) or not duckdb_backend.readable_tables(tokens):
+        return False
+    try:
+        duckdb_backend.translate(sql)
+    except duckdb_backend.Untranslatable:
+        return False
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    return duckdb_backend.plan_cost(plan, table_rows, table_aliases(tokens)) >= duckdb_backend.DUCKDB_MIN_COST
+
+
+def bench(path: str, source: str, parquet_dir: str, repeat: int) -> Dict[str, Any]:
+    engine = duckdb_backend.Engine(path, source=source, directory=parquet_dir)
+    sync_s = None
+    if engine.mirror is not None:
+        started = time.perf_counter()
+        engine.mirror.sync()
+        sync_s = time.perf_counter() - started
+    conn = sqlite3.connect(path)
+    table_rows = {t: conn.execute(f"SELECT MAX(rowid) FROM {t}").fetchone()[0] or 0
+                  for t in sorted(ALLOWED_TABLES - duckdb_backend.VIRTUAL_TABLES)}
+    results = []
+    for name, sql in queries().items():
+        translated = duckdb_backend.translate(sql)
+        sqlite_s, sqlite_rows = timed(lambda: conn.execute(sql).fetchall(), repeat)
+        duck_s, duck_rows = timed(lambda: [tuple(r.values()) for r in
+                                           pa.Table.from_batches(list(engine.batches(translated))).to_pylist()],
+                                  repeat)
+        results.append({"query": name, "rows": len(sqlite_rows), "routed": routed(conn, sql, table_rows),
+                        "sqlite_ms": round(sqlite_s * 1000, 3), "duckdb_ms": round(duck_s * 1000, 3),
+                        "speedup": round(sqlite_s / duck_s, 2) if duck_s else None,
+                        "same_rows": same_rows(sqlite_rows, duck_rows)})
+    conn.close()
+    return {"source": source, "table_rows": table_rows,
+            "sync_s": round(sync_s, 3) if sync_s is not None else None, "queries": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale-factors", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--source", choices=["parquet", "attach"], default=duckdb_backend.DUCKDB_SOURCE)
+    parser.add_argument("--workers", type=int, default=None, help="Seeding processes")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "nlsql_bench"))
+    parser.add_argument("-o", "--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    if not duckdb_backend.available():
+        parser.error("the duckdb package is not installed (pip install duckdb)")
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {}
+    for sf in args.scale_factors:
+        path = seeded_db(args.workdir, sf, args.workers)
+        result = bench(path, args.source, os.path.join(args.workdir, f"parquet_sf{sf:g}"), args.repeat)
+        report[f"{sf:g}"] = result
+        sync = f", Parquet copy in {result['sync_s']:.2f}s" if result["sync_s"] is not None else ""
+        print(f"SF {sf:g} ({result['table_rows']['payments']} payments{sync})")
+        for r in result["queries"]:
+            print(f"  {r['query']:<22} {r['rows']:>6} rows  SQLite {r['sqlite_ms']:9.3f} ms  "
+                  f"DuckDB {r['duckdb_ms']:8.3f} ms  x{r['speedup']:<6} "
+                  f"{'routed' if r['routed'] else 'SQLite'}{'' if r['same_rows'] else '  ROWS DIFFER'}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# bench_e2e.py
+"""End-to-end pipeline latency with the replayable stub model.
+
+Runs every question of the corpus (the FEWSHOTS plus JSONL question files
+such as requests.jsonl) through build_prompt → LLM → _json_from_text →
+validation → cost guard → run_query, against databases bulk-seeded at
+each scale factor. Reports p50/p95/p99 per stage and rows/sec, and writes
+everything to a JSON file so runs from different commits can be compared.
+
+    python bench_e2e.py --scale-factors 0.1 1 10 --repeat 3 -o bench_e2e.json
+    python bench_e2e.py --scale-factors 1 --compare bench_e2e.json
+
+Each scale factor runs in a fresh subprocess (DATABASE_URL points at its
+database and the result cache is off, so run_query really executes).
+Seeded databases are kept in --workdir and reused by later runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Dict, List, Any
+
+import numpy as np
+
+STAGES = ["build_prompt", "llm", "parse", "validate", "cost_guard", "run_query", "total"]
+
+
+def load_corpus(paths: List[str]) -> List[str]:
+    from batch import load_questions
+    from prompts import FEWSHOTS
+
+    corpus = [ex["nl"] for ex in FEWSHOTS]
+    for path in paths:
+        if os.path.exists(path):
+            corpus += [q["question"] for q in load_questions(path)]
+    return corpus
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"n": 0}
+    ms = np.array(samples) * 1000
+    return {
+        "n": len(samples),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+
+def run_corpus(corpus: List[str], repeat: int, responses: Optional[str], latency: float) -> Dict[str, Any]:
+    """Time each stage for every question (runs inside the per-database subprocess)."""
+    import db
+    from llm import StubBackend
+    from nlsql import MAX_RESULT_ROWS, _json_from_text, _passes_cost_guard, build_prompt_with_stats
+    from sql_guard import SQLValidationError, validate_sql
+
+    backend = StubBackend(path=responses, latency=latency)
+    timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    outcomes = {"answered": 0, "unanswerable": 0, "rejected": 0, "failed": 0}
+    rows = 0
+
+    def timed(stage: str, fn, *args):
+        started = time.perf_counter()
+        value = fn(*args)
+        timings[stage].append(time.perf_counter() - started)
+        return value
+
+    for _ in range(repeat):
+        for question in corpus:
+            started = time.perf_counter()
+            prompt, _ = timed("build_prompt", build_prompt_with_stats, question)
+            text = timed("llm", backend.generate, prompt)
+            data = timed("parse", _json_from_text, text or "")
+            if not data or not isinstance(data.get("sql"), str):
+                outcomes["unanswerable"] += 1
+                continue
+            try:
+                sql = timed("validate", validate_sql, data["sql"], MAX_RESULT_ROWS)
+            except SQLValidationError:
+                outcomes["rejected"] += 1
+                continue
+            if not timed("cost_guard", _passes_cost_guard, sql):
+                outcomes["rejected"] += 1
+                continue
+            try:
+                df = timed("run_query", db.run_query, sql)
+            except Exception as e:
+                print(f"Query failed: {e}", file=sys.stderr)
+                outcomes["failed"] += 1
+                continue
+            timings["total"].append(time.perf_counter() - started)
+            outcomes["answered"] += 1
+            rows += len(df)
+
+    query_seconds = sum(timings["run_query"])
+    return {
+        "questions": len(corpus) * repeat,
+        "outcomes": outcomes,
+        "rows": rows,
+        "rows_per_sec": round(rows / query_seconds, 1) if query_seconds else None,
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+    }
+
+
+def seeded_db(workdir: str, scale_factor: float, workers: Optional[int]) -> str:
+    path = os.path.join(workdir, f"bench_sf{scale_factor:g}.db")
+    if not os.path.exists(path):
+        from sqlalchemy import create_engine
+
+        from models import Base
+        from seed import seed_bulk
+
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+        seed_bulk(engine, scale_factor=scale_factor, workers=workers)
+        engine.dispose()
+    return path
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], previous_path: str) -> None:
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\nvs {previous_path} (commit {previous.get('commit')}):")
+    for sf, result in current["results"].items():
+        before = previous.get("results", {}).get(sf)
+        if not before:
+            continue
+        for stage in STAGES:
+            new, old = result["stages"][stage].get("p95_ms"), before["stages"].get(stage, {}).get("p95_ms")
+            if new is not None and old:
+                print(f"  SF {sf:>6} {stage:<12} p95 {old:9.3f} → {new:9.3f} ms ({(new - old) / old * 100:+.1f}%)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale-factors", type=float, nargs="+", default=[0.1, 1, 10])
+    parser.add_argument("--questions", nargs="*", default=["requests.jsonl"], help="Extra JSONL question files")
+    parser.add_argument("--responses", default=None, help="Recorded stub responses (JSONL)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated model round trip (s)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="Seeding processes")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "nlsql_bench"))
+    parser.add_argument("-o", "--output", default="bench_e2e.json")
+    parser.add_argument("--compare", default=None, help="Earlier output file to diff p95s against")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.questions)
+    if args.worker:
+        # Child process: DATABASE_URL already points at the seeded database
+        print(json.dumps(run_corpus(corpus, args.repeat, args.responses, args.llm_latency)))
+        return
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"repeat": args.repeat, "llm_latency": args.llm_latency, "corpus": len(corpus),
+                   "questions": args.questions, "responses": args.responses},
+        "results": {},
+    }
+    for sf in args.scale_factors:
+        path = seeded_db(args.workdir, sf, args.workers)
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", RESULT_CACHE="0", WORKLOAD_LOG="0")
+        cmd = [sys.executable, __file__, "--worker", "1", "--repeat", str(args.repeat),
+               "--llm-latency", str(args.llm_latency), "--questions", *args.questions]
+        if args.responses:
+            cmd += ["--responses", args.responses]
+        out = subprocess.run(cmd, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        report["results"][f"{sf:g}"] = result
+        stages = result["stages"]
+        print(f"SF {sf:g}: {result['outcomes']} rows/s={result['rows_per_sec']}")
+        for stage in STAGES:
+            s = stages[stage]
+            if s["n"]:
+                print(f"  {stage:<12} p50 {s['p50_ms']:9.3f}  p95 {s['p95_ms']:9.3f}  p99 {s['p99_ms']:9.3f} ms")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# bench_fts.py
+"""LIKE scans vs FTS5 lookups on property descriptions and review comments.
+
+For each scale factor, bulk-seeds a database (reused from --workdir, the
+same files bench_e2e.py uses) and builds the text_search indexes. It then
+picks a common and a rare word from each text column's data and times two
+query shapes both ways: a match count, and the top 10 rows (LIKE with a
+LIMIT vs MATCH ordered by bm25).
+
+    python bench_fts.py --scale-factors 1 10 --repeat 5 -o bench_fts.json
+
+LIKE '%word%' matches substrings while MATCH matches stemmed tokens, so the
+match counts are reported too; they are close but not identical.
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import text_search
+
+_WORD = re.compile(r"[a-z]{5,}")
+
+
+def seeded_db(workdir: str, scale_factor: float, workers: Optional[int]) -> str:
+    path = os.path.join(workdir, f"bench_sf{scale_factor:g}.db")
+    if not os.path.exists(path):
+        from sqlalchemy import create_engine
+
+        from models import Base
+        from seed import seed_bulk
+
+        engine = create_engine(f"sqlite:///{path}")
+        Base.metadata.create_all(engine)
+        seed_bulk(engine, scale_factor=scale_factor, workers=workers)
+        engine.dispose()
+    return path
+
+
+def pick_terms(conn: sqlite3.Connection, ix: text_search.TextIndex) -> Dict[str, str]:
+    """The most frequent word and one found in ~0.1% of the rows (document frequency)."""
+    docs = Counter()
+    rows = 0
+    for values in conn.execute(f"SELECT {', '.join(ix.columns)} FROM {ix.table}"):
+        rows += 1
+        docs.update(set(_WORD.findall(" ".join(v for v in values if v).lower())))
+    ranked = docs.most_common()
+    target = max(1, rows // 1000)
+    rare = min(ranked, key=lambda item: (abs(item[1] - target), item[0]))[0]
+    return {"common": ranked[0][0], "rare": rare}
+
+
+def queries(ix: text_search.TextIndex, term: str) -> Dict[str, Tuple[str, str]]:
+    like = " OR ".join(f"{c} LIKE '%{term}%'" for c in ix.columns)
+    cols = ", ".join(f"t.{c}" for c in ix.columns)
+    return {
+        "count": (f"SELECT COUNT(*) FROM {ix.table} WHERE {like}",
+                  f"SELECT COUNT(*) FROM {ix.name} WHERE {ix.name} MATCH '{term}'"),
+        "top10": (f"SELECT {ix.pk}, {', '.join(ix.columns)} FROM {ix.table} WHERE {like} LIMIT 10",
+                  f"SELECT t.{ix.pk}, {cols} FROM {ix.name} JOIN {ix.table} t ON t.{ix.pk} = {ix.name}.rowid "
+                  f"WHERE {ix.name} MATCH '{term}' ORDER BY bm25({ix.name}) LIMIT 10"),
+    }
+
+
+def timed(conn: sqlite3.Connection, sql: str, repeat: int) -> Tuple[float, list]:
+    runs, rows = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = conn.execute(sql).fetchall()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs), rows
+
+
+def bench(path: str, repeat: int) -> List[Dict[str, object]]:
+    conn = sqlite3.connect(path)
+    text_search.install(conn)
+    results = []
+    for ix in text_search.INDEX_LIST:
+        rows = conn.execute(f"SELECT COUNT(*) FROM {ix.table}").fetchone()[0]
+        for kind, term in pick_terms(conn, ix).items():
+            for shape, (like_sql, fts_sql) in queries(ix, term).items():
+                like_s, like_rows = timed(conn, like_sql, repeat)
+                fts_s, fts_rows = timed(conn, fts_sql, repeat)
+                result = {"index": ix.name, "rows": rows, "term": term, "kind": kind, "query": shape,
+                          "like_ms": round(like_s * 1000, 3), "fts_ms": round(fts_s * 1000, 3),
+                          "speedup": round(like_s / fts_s, 2) if fts_s else None}
+                if shape == "count":
+                    result.update(like_matches=like_rows[0][0], fts_matches=fts_rows[0][0])
+                results.append(result)
+    conn.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale-factors", type=float, nargs="+", default=[1, 10])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None, help="Seeding processes")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "nlsql_bench"))
+    parser.add_argument("-o", "--output", default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    report = {}
+    for sf in args.scale_factors:
+        results = bench(seeded_db(args.workdir, sf, args.workers), args.repeat)
+        report[f"{sf:g}"] = results
+        print(f"SF {sf:g}")
+        for r in results:
+            matches = f"  matches {r['like_matches']}/{r['fts_matches']}" if r["query"] == "count" else ""
+            print(f"  {r['index']:<15} {r['kind']:<6} {r['term']:<12} {r['query']:<6} "
+                  f"LIKE {r['like_ms']:9.3f} ms  FTS {r['fts_ms']:8.3f} ms  x{r['speedup']}{matches}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench_indexes.py
+"""Query latency before and after the index advisor's recommendations.
+
+Copies the database, scales bookings and payments up by --scale (new rows
+point at existing properties/tenants and at the copied bookings, so joins
+stay valid), times each few-shot query, applies the advisor's indexes plus
+the ones declared in models.py, and times the queries again.
+
+    python bench_indexes.py --db rental_app.db --scale 2000 --repeat 5
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from index_advisor import IndexAdvisor, apply_indexes, migrate_model_indexes
+from prompts import FEWSHOTS
+
+
+def scale_up(path: str, factor: int) -> None:
+    conn = sqlite3.connect(path)
+    with conn:
+        nb = conn.execute("SELECT MAX(booking_id) FROM bookings").fetchone()[0] or 0
+        np_ = conn.execute("SELECT MAX(payment_id) FROM payments").fetchone()[0] or 0
+        for k in range(1, factor):
+            conn.execute(
+                """INSERT INTO bookings (booking_id, property_id, tenant_id, start_date, end_date, status, created_at)
+                   SELECT booking_id + ?, property_id, tenant_id, start_date, end_date, status, created_at
+                   FROM bookings WHERE booking_id <= ?""",
+                (k * nb, nb),
+            )
+            conn.execute(
+                """INSERT INTO payments (payment_id, booking_id, tenant_id, amount, payment_date, status, method)
+                   SELECT payment_id + ?, booking_id + ?, tenant_id, amount, payment_date, status, method
+                   FROM payments WHERE payment_id <= ?""",
+                (k * np_, k * nb, np_),
+            )
+    conn.close()
+
+
+def time_queries(path: str, queries, repeat: int):
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    out = []
+    for sql in queries:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            conn.execute(sql).fetchall()
+            runs.append(time.perf_counter() - start)
+        out.append(statistics.median(runs))
+    conn.close()
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="rental_app.db")
+    parser.add_argument("--scale", type=int, default=2000, help="Multiply bookings/payments by this factor")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_indexes_")
+    path = os.path.join(workdir, "scaled.db")
+    try:
+        shutil.copy(args.db, path)
+        scale_up(path, args.scale)
+        queries = [ex["sql"] for ex in FEWSHOTS]
+        before = time_queries(path, queries, args.repeat)
+
+        advisor = IndexAdvisor(path)
+        recs = advisor.recommend([(sql, 1) for sql in queries])
+        advisor.live.close()
+        apply_indexes(path, recs)
+        migrated = migrate_model_indexes(path)
+        after = time_queries(path, queries, args.repeat)
+
+        print(json.dumps({"scale": args.scale, "advised": [c.name for c in recs], "migrated": migrated}))
+        for ex, b, a in zip(FEWSHOTS, before, after):
+            print(json.dumps({"query": ex["nl"][:60], "before_ms": round(b * 1000, 2),
+                              "after_ms": round(a * 1000, 2), "speedup": round(b / a, 1) if a else None}))
+        print(json.dumps({"total_before_ms": round(sum(before) * 1000, 1),
+                          "total_after_ms": round(sum(after) * 1000, 1)}))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
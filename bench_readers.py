@@ -0,0 +1,63 @@
+# bench_readers.py
+"""Read throughput as the number of concurrent readers grows.
+
+Compares the default engine (create_engine(DATABASE_URL)) with the tuned
+read-only profile (db.create_read_engine) by running the few-shot queries
+in a loop from N threads for a fixed duration per step.
+
+    python bench_readers.py --db rental_app.db --threads 1 2 4 8 16 --seconds 5
+"""
+import argparse
+import json
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from db import create_read_engine
+from prompts import FEWSHOTS
+
+
+def run_step(engine, queries, threads: int, seconds: float) -> float:
+    done = [0] * threads
+    stop = time.monotonic() + seconds
+
+    def worker(i: int) -> None:
+        n = 0
+        while time.monotonic() < stop:
+            with engine.connect() as conn:
+                conn.execute(text(queries[n % len(queries)])).fetchall()
+            n += 1
+        done[i] = n
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(done) / seconds
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="rental_app.db")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    queries = [ex["sql"] for ex in FEWSHOTS]
+    engines = {
+        "default": create_engine(f"sqlite:///{args.db}", future=True),
+        "read_profile": create_read_engine(args.db, pool_size=max(args.threads)),
+    }
+    results = []
+    for threads in args.threads:
+        row = {"threads": threads}
+        for name, engine in engines.items():
+            row[f"{name}_qps"] = round(run_step(engine, queries, threads, args.seconds), 1)
+        results.append(row)
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
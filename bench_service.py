@@ -0,0 +1,125 @@
+# bench_service.py
+"""Load test for service.py against the local stub model.
+
+Starts `uvicorn service:app` with LLM_BACKEND=stub (unless --url points at
+a running server) and fires /ask requests for the few-shot questions from
+--concurrency async clients for --seconds. Reports throughput, latency
+percentiles (time to the last NDJSON line), streamed rows and the status
+mix, including 503s from backpressure.
+
+    python bench_service.py --concurrency 64 --seconds 10 --llm-latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+import numpy as np
+
+from prompts import FEWSHOTS
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{url}/healthz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"service at {url} did not become ready")
+
+
+async def run_load(url: str, concurrency: int, seconds: float, max_rows: int) -> Dict[str, object]:
+    questions = [ex["nl"] for ex in FEWSHOTS]
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    rows = 0
+    stop = time.monotonic() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        async def worker(i: int) -> None:
+            nonlocal rows
+            n = i
+            while time.monotonic() < stop:
+                question = questions[n % len(questions)]
+                n += 1
+                started = time.perf_counter()
+                try:
+                    async with client.stream("POST", "/ask", json={"question": question, "max_rows": max_rows}) as resp:
+                        last = None
+                        async for line in resp.aiter_lines():
+                            if line:
+                                last = line
+                        status = str(resp.status_code)
+                        if resp.status_code == 200 and last:
+                            tail = json.loads(last)
+                            rows += tail.get("rows", 0)
+                            if "error" in tail:
+                                status = "200-stopped"
+                except httpx.TransportError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == "503":
+                    await asyncio.sleep(0.05)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "rows": rows,
+        "statuses": statuses,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="Existing service (default: start one)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Simulated stub round trip (s)")
+    parser.add_argument("--max-rows", type=int, default=100)
+    parser.add_argument("--caches", action="store_true", help="Keep the translation/result caches on")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        url = f"http://127.0.0.1:{args.port}"
+        env = dict(os.environ, LLM_BACKEND="stub", LLM_STUB_LATENCY=str(args.llm_latency), WORKLOAD_LOG="0")
+        if not args.caches:
+            env.update(NLSQL_CACHE="0", RESULT_CACHE="0")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "service:app", "--port", str(args.port), "--log-level", "warning"],
+            env=env,
+        )
+    try:
+        asyncio.run(wait_ready(url))
+        for concurrency in args.concurrency:
+            print(json.dumps(asyncio.run(run_load(url, concurrency, args.seconds, args.max_rows))))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# bench_startup.py
+"""Cold-start benchmark: time `import nlsql, db` in fresh interpreters.
+
+The "eager" case reproduces what importing used to cost (Gemini SDK import,
+client configuration, model construction and engine creation at import
+time); the "lazy" case is the current modules. Each case runs in a new
+subprocess so nothing is shared between samples.
+
+    python bench_startup.py --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+CASES = {
+    "eager": (
+        "import os, nlsql, db\n"
+        "import google.generativeai as genai\n"
+        "genai.configure(api_key=os.getenv('GOOGLE_API_KEY') or 'bench')\n"
+        "genai.GenerativeModel(os.getenv('MODEL_NAME', 'gemini-1.5-flash'))\n"
+        "db.get_engine()\n"
+    ),
+    "lazy": "import nlsql, db\n",
+}
+
+
+def time_case(code: str, runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    results = {}
+    for name, code in CASES.items():
+        samples = time_case(code, args.runs)
+        results[name] = {"median_s": round(statistics.median(samples), 4), "min_s": round(min(samples), 4)}
+    results["speedup"] = round(results["eager"]["median_s"] / results["lazy"]["median_s"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
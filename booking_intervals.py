@@ -0,0 +1,148 @@
+# booking_intervals.py
+"""R*Tree interval index over bookings: property × booked days.
+
+booking_intervals is a 2-D rtree_i32 virtual table with one row per
+booking. It stores the booking_id, the property as the one-wide range
+[property_id, property_id_hi], and the stay as [start_day, end_day]. Days
+are CAST(julianday(date) AS INTEGER). The status is an auxiliary column.
+"Bookings of these properties overlapping [s, e]" then becomes one range
+search on the R*Tree instead of a scan of bookings:
+
+    SELECT ... FROM booking_intervals bi
+    WHERE bi.start_day <= :e AND bi.end_day >= :s
+      AND bi.property_id IN (SELECT property_id FROM properties WHERE city = :city)
+
+and the days a booking covers inside the window are
+MIN(bi.end_day, :e) - MAX(bi.start_day, :s) + 1.
+
+Triggers on bookings keep the index in sync. Bookings with a missing date
+or property, or with end_date before start_date, are left out; an R*Tree
+cannot store an empty or inverted range.
+
+    python booking_intervals.py --install    # create and fill the index, add its triggers
+    python booking_intervals.py --check      # compare the index with bookings
+"""
+import argparse
+import sqlite3
+import time
+from typing import Dict
+
+TABLE = "booking_intervals"
+DDL = (f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING rtree_i32("
+       "booking_id, property_id, property_id_hi, start_day, end_day, +status)")
+
+_DAY = "CAST(julianday({}) AS INTEGER)"
+_INDEXABLE = ("{row}.property_id IS NOT NULL AND {row}.start_date IS NOT NULL AND {row}.end_date IS NOT NULL "
+              "AND {row}.end_date >= {row}.start_date")
+
+
+def _row_select(row: str) -> str:
+    return (f"SELECT {row}.booking_id, {row}.property_id, {row}.property_id, "
+            f"{_DAY.format(row + '.start_date')}, {_DAY.format(row + '.end_date')}, {row}.status")
+
+
+def _fresh() -> str:
+    """The index contents computed from bookings."""
+    return f"{_row_select('bookings')} FROM bookings WHERE {_INDEXABLE.format(row='bookings')}"
+
+
+def trigger_ddl() -> Dict[str, str]:
+    """Trigger name → CREATE TRIGGER statement."""
+    insert = f"INSERT INTO {TABLE} {_row_select('NEW')} WHERE {_INDEXABLE.format(row='NEW')}"
+    delete = f"DELETE FROM {TABLE} WHERE booking_id = OLD.booking_id"
+    return {
+        f"trg_{TABLE}_ins": f"CREATE TRIGGER trg_{TABLE}_ins AFTER INSERT ON bookings BEGIN\n  {insert};\nEND",
+        f"trg_{TABLE}_del": f"CREATE TRIGGER trg_{TABLE}_del AFTER DELETE ON bookings BEGIN\n  {delete};\nEND",
+        f"trg_{TABLE}_upd": (f"CREATE TRIGGER trg_{TABLE}_upd AFTER UPDATE OF booking_id, property_id, start_date, "
+                             f"end_date, status ON bookings BEGIN\n  {delete};\n  {insert};\nEND"),
+    }
+
+
+def refresh(conn: sqlite3.Connection) -> None:
+    conn.execute(f"DELETE FROM {TABLE}")
+    conn.execute(f"INSERT INTO {TABLE} {_fresh()}")
+
+
+def install(conn: sqlite3.Connection) -> None:
+    """Create and fill the index and start maintaining it, in one transaction."""
+    with conn:
+        conn.execute(DDL)
+        for trigger, ddl in trigger_ddl().items():
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            conn.execute(ddl)
+        refresh(conn)
+
+
+def installed(conn) -> bool:
+    """Whether the table and all of its triggers exist."""
+    present = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')").fetchall()}
+    return TABLE in present and set(trigger_ddl()) <= present
+
+
+def drop_triggers(conn: sqlite3.Connection) -> bool:
+    """Stop maintaining the index (e.g. before a bulk load); returns whether it was installed."""
+    was_installed = installed(conn)
+    with conn:
+        for trigger in trigger_ddl():
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    return was_installed
+
+
+def drop(conn: sqlite3.Connection) -> None:
+    drop_triggers(conn)
+    with conn:
+        conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+
+def ensure(path: str) -> None:
+    """Install the index on a SQLite file that does not have it yet (init_db.py --migrate)."""
+    conn = sqlite3.connect(path)
+    try:
+        if not installed(conn):
+            started = time.perf_counter()
+            install(conn)
+            print(f"Built {TABLE} on {path} in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+def check(conn: sqlite3.Connection) -> int:
+    """Rows that differ between the index and a fresh build from bookings."""
+    fresh = _fresh()
+    stored = f"SELECT booking_id, property_id, property_id_hi, start_day, end_day, status FROM {TABLE}"
+    return conn.execute(f"SELECT COUNT(*) FROM (SELECT * FROM ({fresh} EXCEPT {stored}) "
+                        f"UNION ALL SELECT * FROM ({stored} EXCEPT {fresh}))").fetchone()[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the R*Tree index over booking date ranges.")
+    parser.add_argument("--db", default=None, help="SQLite file (default: DATABASE_URL)")
+    parser.add_argument("--install", action="store_true", help="Create/refresh the index and its triggers")
+    parser.add_argument("--drop", action="store_true", help="Remove the index and its triggers")
+    parser.add_argument("--check", action="store_true", help="Compare the index with bookings")
+    args = parser.parse_args()
+
+    if args.db is None:
+        from db import _sqlite_path
+
+        args.db = _sqlite_path()
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.drop:
+            drop(conn)
+            print(f"Dropped {TABLE} from {args.db}")
+        if args.install:
+            started = time.perf_counter()
+            install(conn)
+            print(f"Installed {TABLE} on {args.db} in {time.perf_counter() - started:.1f}s")
+        if installed(conn):
+            rows = conn.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+            status = f", {check(conn)} mismatched" if args.check else ""
+            print(f"  {TABLE}: {rows} rows{status}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# cache.py
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Iterator
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation."""
+    q = re.sub(r"\s+", " ", question.strip().lower())
+    return q.rstrip(" ?!.")
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash over the inputs that shape a translation."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class TranslationCache:
+    """Two-tier NL→SQL cache: in-process LRU in front of a SQLite table.
+
+    The disk tier survives restarts and is shared by every process that
+    points at the same file. Entries expire after `ttl_seconds`; the disk
+    tier is trimmed to `max_disk_entries` by least-recent access.
+    """
+
+    def __init__(self, path: str, max_memory_entries: int = 256,
+                 max_disk_entries: int = 10000, ttl_seconds: int = 7 * 24 * 3600):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._lru: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._init_disk()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_disk(self) -> None:
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_translations_accessed ON translations(accessed_at)")
+
+    def make_key(self, question: str, schema_fingerprint: str) -> str:
+        return fingerprint(normalize_question(question), schema_fingerprint)
+
+    def _remember(self, key: str, value: Dict[str, Any], created_at: float) -> None:
+        self._lru[key] = (value, created_at)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._lru.get(key)
+            if item is not None:
+                value, created_at = item
+                if now - created_at <= self.ttl_seconds:
+                    self._lru.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return dict(value)
+                del self._lru[key]
+
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, created_at FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] > self.ttl_seconds:
+                    conn.execute("DELETE FROM translations WHERE key = ?", (key,))
+                    row = None
+                elif row is not None:
+                    conn.execute("UPDATE translations SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"Translation cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            self._stats["disk_hits"] += 1
+            return dict(value)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, dict(value), now)
+            self._stats["writes"] += 1
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO translations (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, default=str), now, now),
+                )
+                evicted = conn.execute(
+                    "DELETE FROM translations WHERE created_at < ?", (now - self.ttl_seconds,)
+                ).rowcount
+                evicted += conn.execute(
+                    """DELETE FROM translations WHERE key IN (
+                        SELECT key FROM translations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )""",
+                    (self.max_disk_entries,),
+                ).rowcount
+        except sqlite3.Error as e:
+            print(f"Translation cache write failed: {e}")
+            return
+        if evicted:
+            with self._lock:
+                self._stats["evictions"] += evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM translations")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            s = dict(self._stats)
+            s["memory_entries"] = len(self._lru)
+        s["hits"] = s["memory_hits"] + s["disk_hits"]
+        return s
+
+
+_translation_cache: Optional[TranslationCache] = None
+_translation_cache_lock = threading.Lock()
+
+
+def get_translation_cache() -> TranslationCache:
+    """Process-wide translation cache configured from the environment."""
+    global _translation_cache
+    with _translation_cache_lock:
+        if _translation_cache is None:
+            _translation_cache = TranslationCache(
+                path=os.getenv("NLSQL_CACHE_PATH", ".nlsql_cache.db"),
+                max_memory_entries=int(os.getenv("NLSQL_CACHE_MEMORY_ENTRIES", "256")),
+                max_disk_entries=int(os.getenv("NLSQL_CACHE_DISK_ENTRIES", "10000")),
+                ttl_seconds=int(os.getenv("NLSQL_CACHE_TTL", str(7 * 24 * 3600))),
+            )
+        return _translation_cache
+
+
+_SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*[\s\S]*?\*/|\s+|[^'\"\s-]+|-")
+
+
+def canonical_sql(sql: str) -> str:
+    """Whitespace/comment-insensitive form of a statement, literals untouched."""
+    parts = []
+    for tok in _SQL_TOKEN.findall(sql.strip().rstrip(";")):
+        if tok.isspace() or tok.startswith("--") or tok.startswith("/*"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        elif tok[0] in "'\"":
+            parts.append(tok)
+        else:
+            parts.append(tok.lower())
+    return "".join(parts).strip()
+
+
+class ResultCache:
+    """Query result cache bounded by total DataFrame bytes.
+
+    Every entry is tagged with the database version it was read at; the
+    caller passes the current version on lookup and a mismatch drops the
+    whole cache, so rows written since are never served stale.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._version: Any = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def _sync_version(self, version: Any) -> None:
+        if version != self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, sql: str, version: Any):
+        key = canonical_sql(sql)
+        with self._lock:
+            self._sync_version(version)
+            item = self._entries.get(key)
+            if item is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return item[0].copy()
+
+    def put(self, sql: str, version: Any, df) -> None:
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        key = canonical_sql(sql)
+        with self._lock:
+            self._sync_version(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (df.copy(), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            s = dict(self._stats)
+            s["entries"] = len(self._entries)
+            s["bytes"] = self._bytes
+        return s
@@ -1,11 +1,29 @@
 # db.py
+import json
 import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
 import pandas as pd
-from sqlalchemy import create_engine, text
+import pyarrow as pa
+from sqlalchemy import create_engine, event, text, make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.engine import Engine
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Optional, Dict, Any, FrozenSet, Iterator, Callable, List
+
+from arrow_results import ARROW_BATCH_ROWS, ARROW_RESULTS, BatchBuilder, to_pandas
+from cache import ResultCache
+import booking_intervals
+import duckdb_backend
+import rollups
+import text_search
+from singleflight import FlightCancelled, SingleFlight
+from sql_guard import ALLOWED_TABLES, VIRTUAL_TABLES, table_aliases, tokenize
+import tracing
 
 # Load environment variables
 load_dotenv()
@@ -15,22 +33,607 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///rental_app.db")
 
 # SQLAlchemy engine (lazy init)
 _engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
 
 def get_engine() -> Engine:
     global _engine
-    if _engine is None:
-        _engine = create_engine(DATABASE_URL, echo=False, future=True)
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(DATABASE_URL, echo=False, future=True)
+            SessionLocal.configure(bind=_engine)
     return _engine
 
-# Session for ORM usage
-SessionLocal = sessionmaker(bind=get_engine(), autoflush=False, autocommit=False)
+# Session for ORM usage; bound to the engine the first time get_engine() runs
+SessionLocal = sessionmaker(autoflush=False, autocommit=False)
+
+# Engine profile used to serve queries: "read" (read-only, tuned pool) or "default"
+DB_PROFILE = os.getenv("DB_PROFILE", "read")
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+READ_MMAP_BYTES = int(os.getenv("READ_MMAP_BYTES", str(256 * 1024 * 1024)))
+READ_CACHE_KIB = int(os.getenv("READ_CACHE_KIB", str(64 * 1024)))
+
+_read_engine: Optional[Engine] = None
+
+
+def enable_wal(path: str) -> None:
+    """Switch the file to WAL (persistent) so readers never block on a writer; init_db.py runs it once."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+
+def create_read_engine(path: str, pool_size: int = READ_POOL_SIZE, mmap_bytes: int = READ_MMAP_BYTES,
+                       cache_kib: int = READ_CACHE_KIB) -> Engine:
+    """Read-only engine for serving SELECTs from a SQLite file.
+
+    Connections open the file with mode=ro, are pooled (pool_size, no
+    overflow so concurrency stays bounded) and may move between Streamlit's
+    script threads. mmap, page cache and query_only are applied per new
+    connection. Nothing is written to the file: it is read in whatever
+    journal mode it has (WAL once init_db.py has set it up).
+    """
+    eng = create_engine(
+        f"sqlite:///file:{path}?mode=ro&uri=true",
+        echo=False,
+        future=True,
+        poolclass=QueuePool,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_timeout=30,
+        connect_args={"check_same_thread": False},
+    )
+
+    @event.listens_for(eng, "connect")
+    def _tune(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA query_only=1")
+        cur.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        cur.execute(f"PRAGMA cache_size={-int(cache_kib)}")
+        cur.execute("PRAGMA temp_store=MEMORY")
+        cur.close()
+
+    return eng
+
+
+def get_query_engine() -> Engine:
+    """Engine used to run generated SQL: the read profile for SQLite files, else get_engine()."""
+    global _read_engine
+    path = _sqlite_path()
+    if DB_PROFILE != "read" or path is None:
+        return get_engine()
+    with _engine_lock:
+        if _read_engine is None:
+            _read_engine = create_read_engine(path)
+    return _read_engine
 
 # Base class for ORM models
 Base = declarative_base()
 
-# Run raw SQL queries → returns DataFrame
-def run_query(sql: str) -> pd.DataFrame:
-    eng = get_engine()
-    with eng.connect() as conn:
-        df = pd.read_sql_query(text(sql), conn)
+# Result cache, invalidated whenever the SQLite file changes
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE", "1") != "0"
+_result_cache = ResultCache(max_bytes=int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))))
+_version_conn: Optional[sqlite3.Connection] = None
+_version_lock = threading.Lock()
+
+
+def _sqlite_path() -> Optional[str]:
+    url = make_url(DATABASE_URL)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database
+
+
+def data_version() -> Optional[int]:
+    """Cheap change signal: SQLite's PRAGMA data_version on a dedicated connection.
+
+    The value moves whenever another connection commits to the file, so it
+    is read from a connection that never writes. Returns None when the
+    database is not a SQLite file.
+    """
+    global _version_conn
+    path = _sqlite_path()
+    if path is None:
+        return None
+    with _version_lock:
+        if _version_conn is None:
+            _version_conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        return _version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def explain_query_plan(sql: str, params: Optional[Dict[str, Any]] = None) -> list:
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) from the live database."""
+    with get_query_engine().connect() as conn:
+        return [tuple(r) for r in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()]
+
+
+_row_estimates: Dict[str, int] = {}
+_row_estimates_version: Any = None
+
+
+def table_row_estimates(tables) -> Dict[str, int]:
+    """Approximate row counts (MAX(rowid), an index lookup) per table, cached per data_version."""
+    global _row_estimates, _row_estimates_version
+    version = data_version()
+    if version is None or version != _row_estimates_version:
+        estimates = {}
+        with get_query_engine().connect() as conn:
+            for table in tables:
+                try:
+                    estimates[table] = conn.exec_driver_sql(f'SELECT MAX(rowid) FROM "{table}"').scalar() or 0
+                except Exception:
+                    estimates[table] = 0
+        _row_estimates, _row_estimates_version = estimates, version
+    return _row_estimates
+
+
+def result_cache_stats() -> Dict[str, int]:
+    return _result_cache.stats()
+
+
+# Per-query budgets enforced inside SQLite through the progress handler
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", "15"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "100000"))
+QUERY_MAX_STEPS = int(os.getenv("QUERY_MAX_STEPS", "0"))
+PROGRESS_INTERVAL = 1000  # VM instructions between progress handler calls
+
+
+class QueryBudgetExceeded(RuntimeError):
+    """A query hit its time/row/step budget or was cancelled; `stats` has partial progress."""
+
+    def __init__(self, reason: str, stats: Dict[str, Any]):
+        super().__init__(f"Query stopped ({reason}) after {stats['elapsed']:.2f}s, "
+                         f"{stats['rows']} rows fetched, ~{stats['vm_steps']} VM steps")
+        self.reason = reason
+        self.stats = stats
+
+
+class QueryCancelled(QueryBudgetExceeded):
+    pass
+
+
+class QueryControl:
+    """Budgets and a cancel switch for one query execution.
+
+    Pass it to run_query/fetch_page/iter_query and call cancel() from any
+    thread (e.g. a UI callback) to stop the query inside SQLite.
+    """
+
+    def __init__(self, timeout: Optional[float] = QUERY_TIMEOUT, max_rows: Optional[int] = QUERY_MAX_ROWS,
+                 max_steps: Optional[int] = QUERY_MAX_STEPS):
+        self.timeout = timeout or None
+        self.max_rows = max_rows or None
+        self.max_steps = max_steps or None
+        self.cancelled = threading.Event()
+        self.started = time.monotonic()
+        self.vm_steps = 0
+        self.rows = 0
+        self.reason: Optional[str] = None
+        self._raw: Optional[sqlite3.Connection] = None
+        self._on_cancel: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        with self._lock:
+            if self._raw is not None:
+                self._raw.interrupt()
+            callbacks, self._on_cancel = self._on_cancel, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Call `callback` when cancel() is called (now, if it already was)."""
+        with self._lock:
+            if not self.cancelled.is_set():
+                self._on_cancel.append(callback)
+                return
+        callback()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"elapsed": round(time.monotonic() - self.started, 4), "rows": self.rows,
+                "vm_steps": self.vm_steps, "reason": self.reason}
+
+    def _progress(self) -> int:
+        """SQLite progress handler: a non-zero return aborts the statement."""
+        self.vm_steps += PROGRESS_INTERVAL
+        if self.cancelled.is_set():
+            self.reason = "cancelled"
+        elif self.timeout is not None and time.monotonic() - self.started > self.timeout:
+            self.reason = f"timeout {self.timeout:g}s"
+        elif self.max_steps is not None and self.vm_steps > self.max_steps:
+            self.reason = f"step budget {self.max_steps}"
+        return 1 if self.reason else 0
+
+    def count_rows(self, n: int) -> None:
+        self.rows += n
+        if self.max_rows is not None and self.rows > self.max_rows:
+            self.reason = f"row budget {self.max_rows}"
+            self.raise_stopped()
+        if self.cancelled.is_set():
+            self.reason = "cancelled"
+            self.raise_stopped()
+
+    def raise_stopped(self) -> None:
+        stats = self.stats()
+        if self.reason == "cancelled":
+            raise QueryCancelled(self.reason, stats)
+        raise QueryBudgetExceeded(self.reason or "interrupted", stats)
+
+
+@contextmanager
+def _budgeted(conn, control: QueryControl):
+    """Install control's progress handler on the pooled DBAPI connection."""
+    raw = getattr(conn.connection, "driver_connection", None)
+    if not isinstance(raw, sqlite3.Connection):
+        yield
+        return
+    control.started = time.monotonic()
+    raw.set_progress_handler(control._progress, PROGRESS_INTERVAL)
+    with control._lock:
+        control._raw = raw
+    try:
+        yield
+    except QueryBudgetExceeded:
+        raise
+    except Exception as e:
+        if control.cancelled.is_set():
+            control.reason = "cancelled"
+        if control.reason or "interrupted" in str(e):
+            control.raise_stopped()
+        raise
+    finally:
+        with control._lock:
+            control._raw = None
+        raw.set_progress_handler(None, 0)
+
+
+# Run aggregate-heavy queries on DuckDB (duckdb_backend.py) when it is installed
+DUCKDB_ENABLED = duckdb_backend.DUCKDB and duckdb_backend.available()
+
+
+def duckdb_route(sql: str, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """The query in DuckDB's dialect when it should run there, else None.
+
+    It must aggregate, read only model tables, translate, and cost at least
+    DUCKDB_MIN_COST row visits in SQLite's plan. With the Parquet source the
+    copy must also be current; a stale copy is refreshed in the background.
+    """
+    path = _sqlite_path()
+    if not DUCKDB_ENABLED or path is None:
+        return None
+    tokens = tokenize(sql)
+    if not duckdb_backend.is_analytic(tokens) or not duckdb_backend.readable_tables(tokens):
+        return None
+    try:
+        translated = duckdb_backend.translate(sql)
+    except duckdb_backend.Untranslatable:
+        return None
+    tables = list(ALLOWED_TABLES) + list(rollups.ROLLUPS)
+    cost = duckdb_backend.plan_cost(explain_query_plan(sql, params), table_row_estimates(tables), table_aliases(tokens))
+    if cost < duckdb_backend.DUCKDB_MIN_COST:
+        return None
+    if not duckdb_backend.get_engine(path).ready():
+        return None
+    return translated
+
+
+def _execute_duckdb(sql: str, params: Optional[Dict[str, Any]], control: QueryControl) -> Optional[pd.DataFrame]:
+    """The result from DuckDB, or None to run the query on SQLite.
+
+    Time and row budgets and cancellation apply (a timer or cancel()
+    interrupts the DuckDB cursor); there is no VM step count to budget.
+    """
+    try:
+        translated = duckdb_route(sql, params)
+    except Exception:
+        return None  # e.g. EXPLAIN failed: SQLite reports the error itself
+    if translated is None:
+        return None
+    engine = duckdb_backend.get_engine(_sqlite_path())
+    interrupts: List[Callable[[], None]] = []
+
+    def stop(reason: str) -> None:
+        control.reason = control.reason or reason
+        for interrupt in interrupts:
+            try:
+                interrupt()
+            except Exception:
+                pass
+
+    control.started = time.monotonic()
+    control.on_cancel(lambda: stop("cancelled"))
+    timer = threading.Timer(control.timeout, stop, (f"timeout {control.timeout:g}s",)) if control.timeout else None
+    if timer is not None:
+        timer.daemon = True
+        timer.start()
+    try:
+        with tracing.span("duckdb") as s:
+            if control.cancelled.is_set():
+                control.reason = "cancelled"
+                control.raise_stopped()
+            batches = []
+            for batch in engine.batches(translated, params, interrupt=interrupts.append):
+                control.count_rows(batch.num_rows)
+                batches.append(batch)
+            s["rows"] = control.rows
+            df = to_pandas(pa.Table.from_batches(batches))
+    except QueryBudgetExceeded:
+        raise
+    except Exception as e:
+        if control.reason:
+            control.raise_stopped()
+        print(f"DuckDB query failed, using SQLite: {str(e).splitlines()[0] if str(e) else e!r}")
+        tracing.count("nlsql_duckdb_queries_total", outcome="fallback")
+        control.rows = 0
+        return None
+    finally:
+        if timer is not None:
+            timer.cancel()
+    tracing.count("nlsql_duckdb_queries_total", outcome="routed")
+    return df
+
+
+def _execute(sql: str, params: Optional[Dict[str, Any]] = None,
+             control: Optional[QueryControl] = None, fetch_size: int = 1000) -> pd.DataFrame:
+    """Run a query under the given (or default) budgets and build a DataFrame."""
+    control = control or QueryControl()
+    if DUCKDB_ENABLED:
+        df = _execute_duckdb(sql, params, control)
+        if df is not None:
+            return df
+    with get_query_engine().connect() as conn, _budgeted(conn, control):
+        result = conn.execute(text(sql), params or {})
+        if ARROW_RESULTS:
+            table = pa.Table.from_batches(list(_arrow_batches(result, control, fetch_size)))
+            return to_pandas(table)
+        columns = list(result.keys())
+        rows = []
+        while True:
+            chunk = result.fetchmany(fetch_size)
+            if not chunk:
+                break
+            control.count_rows(len(chunk))
+            rows.extend(chunk)
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def _arrow_batches(result, control: QueryControl, fetch_size: int = 1000,
+                   batch_rows: int = ARROW_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """Typed RecordBatches of up to `batch_rows` rows; at least one (empty) batch."""
+    builder = BatchBuilder(list(result.keys()))
+    rows = []
+    sent = False
+    while True:
+        chunk = result.fetchmany(fetch_size)
+        if chunk:
+            control.count_rows(len(chunk))
+            rows.extend(chunk)
+        if rows and (not chunk or len(rows) >= batch_rows):
+            yield builder.build(rows)
+            rows = []
+            sent = True
+        if not chunk:
+            break
+    if not sent:
+        yield builder.empty()
+
+
+def iter_arrow(sql: str, batch_rows: int = ARROW_BATCH_ROWS, params: Optional[Dict[str, Any]] = None,
+               control: Optional[QueryControl] = None) -> Iterator[pa.RecordBatch]:
+    """Stream a query as typed Arrow RecordBatches (for exports of any size).
+
+    Like iter_query, the row budget does not apply; time/step budgets and
+    cancellation do.
+    """
+    control = control or QueryControl(max_rows=0)
+    sql = route_sql(sql)
+    with get_query_engine().connect() as conn, _budgeted(conn, control):
+        result = conn.execution_options(stream_results=True).execute(text(sql), params or {})
+        yield from _arrow_batches(result, control, batch_rows=batch_rows)
+
+
+# Coalesce identical concurrent queries (e.g. several sessions opening the same page)
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT", "1") != "0"
+_query_flight = SingleFlight("query")
+
+
+def _execute_shared(sql: str, control: Optional[QueryControl], version: Optional[int] = None,
+                    params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """_execute, joining an identical in-progress query instead of starting another.
+
+    The shared run gets its own QueryControl with the caller's budgets; it is
+    cancelled only once every caller waiting on it has cancelled.
+    """
+    control = control or QueryControl()
+    if not SINGLEFLIGHT_ENABLED:
+        return _execute(sql, params, control)
+
+    def run(call) -> pd.DataFrame:
+        shared = QueryControl(control.timeout, control.max_rows, control.max_steps)
+        call.on_idle = shared.cancel
+        control.on_cancel(call.leave)
+        return _execute(sql, params, shared)
+
+    key = (sql, _params_key(params), version, control.timeout, control.max_rows, control.max_steps)
+    try:
+        df, _ = _query_flight.do(key, run, control.cancelled)
+    except FlightCancelled:
+        control.reason = "cancelled"
+        control.raise_stopped()
+    if control.cancelled.is_set():
+        # Cancelled while others kept the shared query alive
+        control.reason = "cancelled"
+        control.raise_stopped()
+    control.rows = len(df)
     return df
+
+
+# Answer aggregate queries from rollup tables (rollups.py) when one is installed
+ROLLUPS_ENABLED = os.getenv("ROLLUPS", "1") != "0"
+tracing.METRIC_HELP["nlsql_rollup_queries_total"] = ("counter", "Queries answered from rollup tables, by outcome")
+_rollups_installed: List[str] = []
+_rollups_version: Any = None
+
+
+def installed_rollups() -> List[str]:
+    """Names of the rollups present in the database, cached per data_version."""
+    global _rollups_installed, _rollups_version
+    version = data_version()
+    if version is None:
+        return []
+    if version != _rollups_version:
+        with get_query_engine().connect() as conn:
+            _rollups_installed = rollups.installed(conn.connection.driver_connection)
+        _rollups_version = version
+    return _rollups_installed
+
+
+_indexes_missing: FrozenSet[str] = frozenset()
+_indexes_version: Any = None
+
+
+def missing_indexes() -> FrozenSet[str]:
+    """Index tables the database lacks, cached per data_version.
+
+    The read path never builds them (init_db.py does); the prompt and
+    validate_sql leave out whichever are missing.
+    """
+    global _indexes_missing, _indexes_version
+    version = data_version()
+    if version is None:
+        return frozenset(VIRTUAL_TABLES)
+    if version != _indexes_version:
+        with get_query_engine().connect() as conn:
+            raw = conn.connection.driver_connection
+            present = set(text_search.installed(raw))
+            if booking_intervals.installed(raw):
+                present.add(booking_intervals.TABLE)
+        _indexes_missing, _indexes_version = frozenset(VIRTUAL_TABLES - present), version
+    return _indexes_missing
+
+
+def route_sql(sql: str) -> str:
+    """The query rewritten onto an installed rollup table, or `sql` unchanged."""
+    if not ROLLUPS_ENABLED:
+        return sql
+    available = installed_rollups()
+    if not available:
+        return sql
+    return rollups.rewrite(sql, available) or sql
+
+
+def _with_rollups(sql: str, run: Callable[[str], Any]) -> Any:
+    """run(routed SQL), falling back to run(sql) if the rollup query fails for any reason but a budget."""
+    routed = route_sql(sql)
+    if routed == sql:
+        return run(sql)
+    try:
+        result = run(routed)
+    except QueryBudgetExceeded:
+        raise
+    except Exception as e:
+        print(f"Rollup query failed, using the base tables: {e}")
+        tracing.count("nlsql_rollup_queries_total", outcome="fallback")
+        return run(sql)
+    tracing.count("nlsql_rollup_queries_total", outcome="routed")
+    return result
+
+
+def _params_key(params: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(params, sort_keys=True, default=str) if params else ""
+
+
+# Run raw SQL queries → returns DataFrame
+def run_query(sql: str, control: Optional[QueryControl] = None,
+              params: Optional[Dict[str, Any]] = None) -> pd.DataFrame:
+    """`params` are bound to the statement's :name placeholders (templated translations)."""
+    with tracing.span("execute") as s:
+        version = data_version() if RESULT_CACHE_ENABLED else None
+        cache_key = f"{sql}\n{_params_key(params)}" if params else sql
+        if version is not None:
+            cached = _result_cache.get(cache_key, version)
+            tracing.cache_event("result", cached is not None)
+            if cached is not None:
+                s["rows"] = len(cached)
+                s["cached"] = True
+                return cached
+
+        df = _with_rollups(sql, lambda q: _execute_shared(q, control, version, params))
+        s["rows"] = len(df)
+        tracing.count("nlsql_rows_returned_total", len(df))
+
+        if version is not None:
+            _result_cache.put(cache_key, version, df)
+        return df
+
+
+# Default page size for interactive browsing
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "200"))
+
+
+@dataclass
+class Page:
+    df: pd.DataFrame
+    page_size: int
+    has_more: bool
+    page: Optional[int] = None  # offset pagination
+    last_key: Any = None        # keyset pagination
+
+
+def iter_query(sql: str, chunk_size: int = 1000, params: Optional[Dict[str, Any]] = None,
+               control: Optional[QueryControl] = None) -> Iterator[pd.DataFrame]:
+    """Stream a query as DataFrames of at most `chunk_size` rows (fetchmany).
+
+    The row budget does not apply when streaming; time/step budgets and
+    cancellation do.
+    """
+    control = control or QueryControl(max_rows=0)
+    sql = route_sql(sql)
+    eng = get_query_engine()
+    with eng.connect() as conn, _budgeted(conn, control):
+        result = conn.execution_options(stream_results=True).execute(text(sql), params or {})
+        columns = list(result.keys())
+        while True:
+            rows = result.fetchmany(chunk_size)
+            if not rows:
+                break
+            control.count_rows(len(rows))
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+
+def fetch_page(sql: str, page: int = 0, page_size: int = PAGE_SIZE,
+               control: Optional[QueryControl] = None, order_by: Optional[str] = None,
+               descending: bool = False, params: Optional[Dict[str, Any]] = None) -> Page:
+    """Offset pagination over any SELECT; fetches one extra row to detect more pages.
+
+    `order_by` names a result column to sort the whole result by before paging.
+    """
+    page = max(0, int(page))
+    page_size = int(page_size)
+    order = ""
+    if order_by:
+        quoted = '"' + order_by.replace('"', '""') + '"'
+        order = f"ORDER BY {quoted}{' DESC' if descending else ''} "
+    # Routed before wrapping: the rewriter only understands the bare aggregate
+    df = _with_rollups(sql, lambda q: run_query(
+        f"SELECT * FROM (\n{q}\n) {order}LIMIT {page_size + 1} OFFSET {page * page_size}", control=control,
+        params=params))
+    return Page(df=df.head(page_size), page=page, page_size=page_size, has_more=len(df) > page_size)
+
+
+def fetch_page_after(sql: str, key: str, after: Any = None, page_size: int = PAGE_SIZE,
+                     control: Optional[QueryControl] = None, params: Optional[Dict[str, Any]] = None) -> Page:
+    """Keyset pagination: rows of `sql` ordered by the unique column `key`, after `after`."""
+    page_size = int(page_size)
+    quoted = '"' + key.replace('"', '""') + '"'
+    where = f"WHERE {quoted} > :after " if after is not None else ""
+    if after is not None:
+        params = dict(params or {}, after=after)
+    df = _with_rollups(sql, lambda q: _execute(
+        f"SELECT * FROM (\n{q}\n) {where}ORDER BY {quoted} LIMIT {page_size + 1}", params, control))
+    has_more = len(df) > page_size
+    df = df.head(page_size)
+    last_key = df[key].iloc[-1] if not df.empty else after
+    return Page(df=df, page_size=page_size, has_more=has_more, last_key=last_key)
@@ -0,0 +1,628 @@
+# duckdb_backend.py
+"""Optional DuckDB execution for aggregate-heavy queries.
+
+SQLite runs a GROUP BY over millions of payments one row at a time. DuckDB
+runs the same aggregate vectorized and in parallel. With DUCKDB=1,
+db._execute sends a query here when it groups, aggregates or uses a window.
+It must also read only model tables, and SQLite's plan must be estimated
+(EXPLAIN QUERY PLAN, sql_guard.estimate_cost) to visit at least
+DUCKDB_MIN_COST rows. Point lookups and small aggregates stay on SQLite,
+as does anything that touches the FTS5/R*Tree tables.
+
+DuckDB reads one of two sources:
+
+  parquet (default)  A Parquet copy of every model table in
+                     DUCKDB_PARQUET_DIR. It is rebuilt in a background
+                     thread when the SQLite file changes (its mtime/size and
+                     its -wal's). Queries stay on SQLite while a copy is out
+                     of date, so results never lag behind the database.
+  attach             ATTACH the SQLite file itself (DuckDB's sqlite
+                     extension, which must be installed or downloadable).
+                     It is always current, but it scans through SQLite's
+                     row format.
+
+translate() rewrites the SQLite dialect the model writes. strftime(),
+date(), datetime(), time(), julianday() and unixepoch() with the usual
+modifiers become DuckDB date arithmetic. LIKE becomes ILIKE (SQLite's LIKE
+ignores ASCII case). Scalar min/max become least/greatest, and a numeric
+CAST reads the leading number of text, as SQLite's does. Integer division
+and NULL ordering are set to SQLite's behaviour. Anything it cannot
+translate raises Untranslatable, and the query runs on SQLite. Any DuckDB
+error does the same.
+
+    python duckdb_backend.py --sync               # build the Parquet copy now
+    python duckdb_backend.py --explain "SELECT ..."
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from arrow_results import ARROW_BATCH_ROWS, ARROW_DECIMAL, BatchBuilder
+from sql_guard import ALLOWED_TABLES, VIRTUAL_TABLES, _TOKEN, estimate_cost, table_aliases, tokenize
+import tracing
+
+load_dotenv()
+
+DUCKDB = os.getenv("DUCKDB", "0") != "0"
+DUCKDB_SOURCE = os.getenv("DUCKDB_SOURCE", "parquet")  # parquet | attach
+DUCKDB_PARQUET_DIR = os.getenv("DUCKDB_PARQUET_DIR", ".nlsql_parquet")
+DUCKDB_MIN_COST = float(os.getenv("DUCKDB_MIN_COST", "50000"))
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))  # 0: DuckDB's default (all cores)
+
+# Tables DuckDB can read: the models.py tables, not SQLite's virtual indexes
+MIRRORED_TABLES = sorted(ALLOWED_TABLES - VIRTUAL_TABLES)
+
+tracing.METRIC_HELP["nlsql_duckdb_queries_total"] = ("counter", "Queries sent to DuckDB, by outcome "
+                                                                "(routed/fallback)")
+tracing.METRIC_HELP["nlsql_duckdb_syncs_total"] = ("counter", "Parquet copies of the database rebuilt for DuckDB")
+
+_AGGREGATES = {'count', 'sum', 'avg', 'min', 'max', 'total', 'group_concat'}
+_UNSUPPORTED = {'glob', 'regexp', 'match', 'rowid', 'oid', '_rowid_', 'typeof', 'likelihood', 'likely',
+                'unlikely', 'randomblob', 'zeroblob', 'changes', 'last_insert_rowid'}
+_RENAMED = {'iif': 'if', 'char': 'chr'}
+_INTEGER_TYPES = {'int', 'integer', 'bigint', 'smallint', 'tinyint'}
+_MODIFIER = re.compile(r"^\s*([+-]?\d+(?:\.\d+)?)\s+(year|month|day|hour|minute|second)s?\s*$", re.I)
+_UNSUPPORTED_FORMATS = ('%s', '%J', '%f')
+# The leading number SQLite's CAST reads from text ('12abc' → 12, 'abc' → 0)
+_NUMERIC_PREFIX = r"^\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?"
+
+
+def available() -> bool:
+    """True when the duckdb package is installed."""
+    return importlib.util.find_spec("duckdb") is not None
+
+
+# --- SQL translation -------------------------------------------------------
+
+class Untranslatable(ValueError):
+    """The query uses SQLite behaviour translate() does not reproduce."""
+
+
+def _lex(sql: str) -> List[Tuple[str, str, int, int]]:
+    """(kind, text, start, end) for each token, skipping whitespace and comments."""
+    return [(m.lastgroup, m.group(), m.start(), m.end()) for m in _TOKEN.finditer(sql)
+            if m.lastgroup not in ('space', 'comment')]
+
+
+def _close(tokens: List[Tuple[str, str, int, int]], i: int) -> int:
+    """Index of the ')' matching the '(' at tokens[i]."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j][1] == '(':
+            depth += 1
+        elif tokens[j][1] == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+    raise Untranslatable("unbalanced parentheses")
+
+
+def _arguments(sql: str, tokens: List[Tuple[str, str, int, int]], start: int, end: int) -> List[str]:
+    """Source text of the comma-separated arguments in tokens[start:end]."""
+    args, depth, first = [], 0, start
+    for j in range(start, end):
+        text = tokens[j][1]
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+        elif text == ',' and depth == 0:
+            args.append(sql[tokens[first][2]:tokens[j - 1][3]])
+            first = j + 1
+    if first < end:
+        args.append(sql[tokens[first][2]:tokens[end - 1][3]])
+    return args
+
+
+def _literal(arg: str) -> Optional[str]:
+    """The value of a single string literal argument, else None."""
+    tokens = _lex(arg)
+    if len(tokens) == 1 and tokens[0][0] == 'string':
+        return tokens[0][1][1:-1].replace("''", "'")
+    return None
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _timestamp(args: List[str]) -> str:
+    """A DuckDB TIMESTAMP for SQLite's (time value, modifier, ...) arguments."""
+    if not args:
+        raise Untranslatable("date function without a time value")
+    value = _literal(args[0])
+    if value is not None and value.lower() == 'now':
+        ts = "CAST(current_timestamp AS TIMESTAMP)"
+    elif re.fullmatch(r"\s*[+-]?[\d.]+\s*", args[0]):
+        raise Untranslatable("numeric (Julian day) time values")
+    else:
+        ts = f"TRY_CAST({_dialect(args[0])} AS TIMESTAMP)"
+    for arg in args[1:]:
+        modifier = _literal(arg)
+        if modifier is None:
+            raise Untranslatable("computed date modifiers")
+        m = _MODIFIER.match(modifier)
+        low = modifier.strip().lower()
+        if m:
+            amount = m.group(1).lstrip('+')
+            ts = f"({ts} + INTERVAL '{amount} {m.group(2).lower()}')"
+        elif low in ('start of month', 'start of year', 'start of day'):
+            ts = f"date_trunc('{low.split()[-1]}', {ts})"
+        else:
+            raise Untranslatable(f"date modifier {modifier!r}")
+    return ts
+
+
+def _function(name: str, args: List[str]) -> Optional[str]:
+    """DuckDB text for a SQLite function call, or None to keep the call as written."""
+    if name == 'strftime':
+        fmt = _literal(args[0]) if args else None
+        if fmt is None or any(f in fmt for f in _UNSUPPORTED_FORMATS):
+            raise Untranslatable("strftime format")
+        return f"strftime({_timestamp(args[1:])}, {_quote(fmt)})"
+    if name == 'date':
+        # TEXT like SQLite's, not a DATE
+        return f"strftime({_timestamp(args)}, '%Y-%m-%d')"
+    if name == 'datetime':
+        return f"strftime({_timestamp(args)}, '%Y-%m-%d %H:%M:%S')"
+    if name == 'time':
+        return f"strftime({_timestamp(args)}, '%H:%M:%S')"
+    if name == 'julianday':
+        # DuckDB's julian() counts from midnight, SQLite's Julian day from noon
+        return f"(julian({_timestamp(args)}) - 0.5)"
+    if name == 'unixepoch':
+        return f"CAST(epoch({_timestamp(args)}) AS BIGINT)"
+    if name in ('min', 'max') and len(args) > 1:
+        # Scalar min/max are NULL when any argument is; least/greatest skip NULLs
+        values = [_dialect(a) for a in args]
+        nulls = " OR ".join(f"({v}) IS NULL" for v in values)
+        return f"(CASE WHEN {nulls} THEN NULL ELSE {'least' if name == 'min' else 'greatest'}({', '.join(values)}) END)"
+    if name == 'total':
+        return f"COALESCE(SUM(CAST({_dialect(args[0])} AS DOUBLE)), 0.0)"
+    if name in _RENAMED:
+        return f"{_RENAMED[name]}({', '.join(_dialect(a) for a in args)})"
+    return None
+
+
+def _cast(sql: str, tokens: List[Tuple[str, str, int, int]], start: int, end: int) -> str:
+    """CAST(expr AS type) with SQLite's conversions; tokens[start:end] are inside the parentheses."""
+    depth = 0
+    for j in range(start, end):
+        text = tokens[j][1]
+        depth += text == '('
+        depth -= text == ')'
+        if depth == 0 and text.lower() == 'as' and j > start:
+            expr = _dialect(sql[tokens[start][2]:tokens[j - 1][3]])
+            typ = sql[tokens[j + 1][2]:tokens[end - 1][3]] if j + 1 < end else ''
+            number = (f"COALESCE(TRY_CAST({expr} AS DOUBLE), TRY_CAST(NULLIF(regexp_extract("
+                      f"CAST({expr} AS VARCHAR), '{_NUMERIC_PREFIX}'), '') AS DOUBLE), 0)")
+            if typ.lower() in _INTEGER_TYPES:
+                return f"(CASE WHEN ({expr}) IS NULL THEN NULL ELSE CAST(trunc({number}) AS BIGINT) END)"
+            if typ.lower() in ('real', 'float', 'double'):
+                return f"(CASE WHEN ({expr}) IS NULL THEN NULL ELSE {number} END)"
+            if typ.lower() == 'text':
+                return f"CAST({expr} AS VARCHAR)"
+            return f"CAST({expr} AS {typ})"
+    raise Untranslatable("CAST without AS")
+
+
+def _grouped_columns(sql: str) -> str:
+    """Wrap SELECT-list columns an aggregate query neither groups nor aggregates in ANY_VALUE().
+
+    SQLite allows them (GROUP BY u.user_id, then select u.first_name);
+    DuckDB does not. SQLite's one exception, where they come from the row
+    of a lone min()/max(), is not reproduced.
+    """
+    tokens = _lex(sql)
+    edits: List[Tuple[int, int, str]] = []
+    for i, (kind, text, _, _) in enumerate(tokens):
+        if kind == 'word' and text.lower() == 'select':
+            edits.extend(_level_edits(sql, tokens, i))
+    for start, end, replacement in sorted(edits, reverse=True):
+        sql = sql[:start] + replacement + sql[end:]
+    return sql
+
+
+def _split_level(tokens: List[Tuple[str, str, int, int]], start: int) -> Dict[str, List[List[int]]]:
+    """Token indexes of each comma-separated item per clause of the SELECT at tokens[start]."""
+    clauses: Dict[str, List[List[int]]] = {'select': [[]]}
+    clause = 'select'
+    depth = 0
+    for j in range(start + 1, len(tokens)):
+        text = tokens[j][1]
+        low = text.lower()
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+            if depth < 0:
+                break
+        elif depth == 0 and tokens[j][0] == 'word' and low in ('from', 'where', 'group', 'having', 'order',
+                                                              'limit', 'window', 'union', 'intersect', 'except'):
+            if low in ('union', 'intersect', 'except'):
+                break
+            clause = low
+            clauses[clause] = [[]]
+            continue
+        elif depth == 0 and text == ',':
+            clauses[clause].append([])
+            continue
+        if depth > 0 or low != 'by' or clause not in ('group', 'order'):
+            clauses[clause][-1].append(j)
+    return clauses
+
+
+def _level_edits(sql: str, tokens: List[Tuple[str, str, int, int]], start: int) -> List[Tuple[int, int, str]]:
+    clauses = _split_level(tokens, start)
+    items = [item for item in clauses['select'] if item]
+    if items and tokens[items[0][0]][1].lower() in ('distinct', 'all'):
+        items[0] = items[0][1:]
+    calls = [tokens[j][1].lower() for item in items for j in item
+             if tokens[j][0] == 'word' and tokens[j][1].lower() in _AGGREGATES
+             and j + 1 < len(tokens) and tokens[j + 1][1] == '('
+             and not any(tokens[k][1].lower() == 'select' for k in item)
+             # min(a, b) and max(a, b) are the scalar functions
+             and not (tokens[j][1].lower() in ('min', 'max')
+                      and len(_arguments(sql, tokens, j + 2, _close(tokens, j + 1))) > 1)]
+    if 'group' not in clauses and not calls:
+        return []
+    text_of = lambda item: "".join(tokens[j][1] for j in item).lower()
+    grouped = {text_of(g) for g in clauses.get('group', []) if g}
+    grouped_names = {g.rsplit('.', 1)[-1] for g in grouped}
+    bare = []
+    for n, item in enumerate(items, 1):
+        expr = item
+        if len(item) >= 2 and tokens[item[-1]][0] in ('word', 'ident') and (
+                tokens[item[-2]][1].lower() == 'as' or len(item) in (2, 4)):
+            expr = item[:-2] if tokens[item[-2]][1].lower() == 'as' else item[:-1]
+        shape = [tokens[j][0] if tokens[j][0] != 'op' else tokens[j][1] for j in expr]
+        if shape not in (['word'], ['ident'], ['word', '.', 'word'], ['word', '.', 'ident'],
+                         ['ident', '.', 'word'], ['ident', '.', 'ident']):
+            continue
+        name = tokens[expr[-1]][1]
+        if text_of(expr) in grouped or name.lower() in grouped_names or str(n) in grouped:
+            continue
+        bare.append((expr, item, name))
+    if not bare:
+        return []
+    if calls in (['min'], ['max']):
+        raise Untranslatable("bare columns next to a lone min()/max()")
+    edits = []
+    for expr, item, name in bare:
+        first, last = tokens[expr[0]][2], tokens[expr[-1]][3]
+        alias = "" if expr is not item else f" AS {name}"
+        edits.append((first, last, f"ANY_VALUE({sql[first:last]}){alias}"))
+    return edits
+
+
+def translate(sql: str) -> str:
+    """The SQLite query in DuckDB's dialect; raises Untranslatable."""
+    return _dialect(_grouped_columns(sql))
+
+
+def _dialect(sql: str) -> str:
+    tokens = _lex(sql)
+    out: List[str] = []
+    pos = 0
+    i = 0
+    while i < len(tokens):
+        kind, text, start, end = tokens[i]
+        low = text.lower()
+        replacement: Optional[str] = None
+        if kind == 'word' and i + 1 < len(tokens) and tokens[i + 1][1] == '(' \
+                and (i == 0 or tokens[i - 1][1] != '.'):
+            close = _close(tokens, i + 1)
+            if low == 'cast':
+                replacement = _cast(sql, tokens, i + 2, close)
+            else:
+                replacement = _function(low, _arguments(sql, tokens, i + 2, close))
+            if replacement is not None:
+                out.append(sql[pos:start])
+                out.append(replacement)
+                pos = tokens[close][3]
+                i = close + 1
+                continue
+        if kind == 'word' and low in _UNSUPPORTED:
+            raise Untranslatable(f"{text} has no DuckDB equivalent")
+        if kind == 'word' and low == 'like':
+            replacement = 'ILIKE'
+        elif kind == 'param' and text[0] in ':@':
+            replacement = '$' + text[1:]
+        elif kind == 'ident' and text[0] in '`[':
+            replacement = '"' + text[1:-1].replace('"', '""') + '"'
+        if replacement is not None:
+            out.append(sql[pos:start])
+            out.append(replacement)
+            pos = end
+        i += 1
+    out.append(sql[pos:])
+    return "".join(out)
+
+
+# --- Routing ---------------------------------------------------------------
+
+def is_analytic(tokens: List[Tuple[str, str]]) -> bool:
+    """GROUP BY, a window (OVER) or an aggregate call anywhere in the query."""
+    for i, (kind, text) in enumerate(tokens):
+        low = text.lower()
+        if kind != 'word':
+            continue
+        if low == 'over' or (low == 'group' and i + 1 < len(tokens) and tokens[i + 1][1].lower() == 'by'):
+            return True
+        if low in _AGGREGATES and i + 1 < len(tokens) and tokens[i + 1][1] == '(':
+            return True
+    return False
+
+
+def readable_tables(tokens: List[Tuple[str, str]]) -> Optional[Set[str]]:
+    """The model tables the query reads, or None when it reads anything DuckDB cannot."""
+    names = set(table_aliases(tokens).values())
+    tables = names & ALLOWED_TABLES
+    if tables - set(MIRRORED_TABLES):
+        return None
+    return tables
+
+
+def plan_cost(plan: List[Tuple[int, int, int, str]], table_rows: Dict[str, int], aliases: Dict[str, str]) -> float:
+    """estimate_cost, with a skip-scan (an index SEARCH on ANY(leading column)) read as the whole table.
+
+    SQLite plans GROUP BY tenant_id over a covering index that way, and
+    estimate_cost would count it as one equality lookup.
+    """
+    cost, _ = estimate_cost(plan, table_rows, aliases,
+                            search_rows=lambda table, detail: table_rows.get(table) if 'ANY(' in detail else None)
+    return cost
+
+
+# --- Parquet copy ----------------------------------------------------------
+
+def _signature(db_path: str) -> List[List[int]]:
+    """mtime/size of the database file and its WAL: changes whenever anything is committed."""
+    sig = []
+    for path in (db_path, db_path + "-wal"):
+        try:
+            st = os.stat(path)
+            sig.append([st.st_mtime_ns, st.st_size])
+        except FileNotFoundError:
+            sig.append([0, 0])
+    return sig
+
+
+class ParquetMirror:
+    """A Parquet file per model table, rebuilt when the SQLite file changes."""
+
+    def __init__(self, db_path: str, directory: str = DUCKDB_PARQUET_DIR, tables: List[str] = MIRRORED_TABLES):
+        self.db_path = db_path
+        self.directory = directory
+        self.tables = tables
+        self.syncing = False
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._manifest_path = os.path.join(directory, "manifest.json")
+
+    def path(self, table: str) -> str:
+        return os.path.join(self.directory, f"{table}.parquet")
+
+    def manifest(self) -> Dict[str, Any]:
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def current(self) -> bool:
+        """The copy matches the database file as it is now."""
+        manifest = self.manifest()
+        return manifest.get("db") == os.path.abspath(self.db_path) \
+            and manifest.get("signature") == _signature(self.db_path) \
+            and all(os.path.exists(self.path(t)) for t in self.tables)
+
+    def exists(self) -> bool:
+        return all(os.path.exists(self.path(t)) for t in self.tables)
+
+    def sync(self) -> Dict[str, int]:
+        """Rewrite every table's file from one read transaction; returns rows per table."""
+        with self._sync_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            signature = _signature(self.db_path)
+            started = time.perf_counter()
+            counts = {}
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                conn.execute("BEGIN")
+                for table in self.tables:
+                    counts[table] = self._write(conn, table)
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+            tmp = self._manifest_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"db": os.path.abspath(self.db_path), "signature": signature, "rows": counts,
+                           "seconds": round(time.perf_counter() - started, 3)}, f)
+            os.replace(tmp, self._manifest_path)
+        tracing.count("nlsql_duckdb_syncs_total")
+        return counts
+
+    def _write(self, conn: sqlite3.Connection, table: str) -> int:
+        cur = conn.execute(f'SELECT * FROM "{table}"')
+        builder = BatchBuilder([d[0] for d in cur.description])
+        tmp = self.path(table) + ".tmp"
+        rows = 0
+        writer = None
+        try:
+            while True:
+                chunk = cur.fetchmany(ARROW_BATCH_ROWS)
+                if not chunk and writer is not None:
+                    break
+                batch = builder.build(chunk) if chunk else builder.empty()
+                if writer is None:
+                    writer = pq.ParquetWriter(tmp, batch.schema)
+                writer.write_batch(batch)
+                rows += len(chunk)
+                if not chunk:
+                    break
+        finally:
+            if writer is not None:
+                writer.close()
+        os.replace(tmp, self.path(table))
+        return rows
+
+    def refresh_async(self) -> None:
+        """Start a background sync unless one is running."""
+        with self._lock:
+            if self.syncing:
+                return
+            self.syncing = True
+
+        def run() -> None:
+            try:
+                self.sync()
+            except Exception as e:
+                print(f"DuckDB Parquet sync failed: {e}")
+            finally:
+                self.syncing = False
+
+        threading.Thread(target=run, name="duckdb-sync", daemon=True).start()
+
+
+# --- Engine ----------------------------------------------------------------
+
+class Engine:
+    """One in-process DuckDB database reading `db_path` through `source`; a cursor per query."""
+
+    def __init__(self, db_path: str, source: str = DUCKDB_SOURCE, directory: str = DUCKDB_PARQUET_DIR,
+                 threads: int = DUCKDB_THREADS):
+        self.db_path = db_path
+        self.source = source
+        self.mirror = ParquetMirror(db_path, directory) if source == "parquet" else None
+        self.threads = threads
+        self._conn = None
+        self._views = False
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        with self._lock:
+            if self._conn is None:
+                import duckdb
+
+                conn = duckdb.connect(":memory:")
+                if self.threads:
+                    conn.execute(f"SET threads = {self.threads}")
+                if self.source == "attach":
+                    conn.execute(f"ATTACH {_quote(self.db_path)} AS src (TYPE sqlite, READ_ONLY)")
+                self._conn = self._configure(conn)
+            if self.mirror is not None and not self._views and self.mirror.exists():
+                for table in self.mirror.tables:
+                    self._conn.execute(f'CREATE OR REPLACE VIEW "{table}" AS '
+                                       f'SELECT * FROM read_parquet({_quote(self.mirror.path(table))})')
+                self._views = True
+            return self._conn
+
+    def _configure(self, conn):
+        """Session settings for SQLite semantics. cursor() opens a new session that does not
+        inherit them, so every cursor is configured too."""
+        # 5/2 = 2, NULLs sort first ascending, 'now' is UTC
+        conn.execute("SET integer_division = true")
+        conn.execute("SET default_null_order = 'nulls_first_on_asc_last_on_desc'")
+        conn.execute("SET TimeZone = 'UTC'")
+        if self.source == "attach":
+            conn.execute("USE src")
+        return conn
+
+    def ready(self) -> bool:
+        """True when queries can run now; starts a Parquet refresh when the copy is stale."""
+        if self.mirror is None:
+            return True
+        if self.mirror.current():
+            return True
+        self.mirror.refresh_async()
+        return False
+
+    def batches(self, sql: str, params: Optional[Dict[str, Any]] = None,
+                batch_rows: int = ARROW_BATCH_ROWS, interrupt=None) -> Iterator[pa.RecordBatch]:
+        """Run translated SQL; `interrupt(callback)` registers a way to stop it from another thread."""
+        cur = self._configure(self._connection().cursor())
+        try:
+            if interrupt is not None:
+                interrupt(cur.interrupt)
+            cur.execute(sql, params or {})
+            reader = cur.to_arrow_reader(batch_rows) if hasattr(cur, "to_arrow_reader") \
+                else cur.fetch_record_batch(batch_rows)
+            sent = False
+            for batch in reader:
+                sent = True
+                yield normalize(batch)
+            if not sent:
+                yield normalize(pa.RecordBatch.from_pylist([], schema=reader.schema))
+        finally:
+            cur.close()
+
+
+def normalize(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """DuckDB's result types as SQLite's would be built: whole decimals (SUM of
+    integers) as int64, fractional ones per ARROW_DECIMAL, 32-bit ints widened."""
+    arrays, fields = [], []
+    for field, column in zip(batch.schema, batch.columns):
+        typ = field.type
+        if pa.types.is_decimal(typ):
+            typ = pa.int64() if typ.scale == 0 else (typ if ARROW_DECIMAL == "decimal128" else pa.float64())
+        elif pa.types.is_integer(typ):
+            typ = pa.int64()
+        elif pa.types.is_floating(typ):
+            typ = pa.float64()
+        elif pa.types.is_large_string(typ):
+            typ = pa.string()
+        arrays.append(column if typ == field.type else column.cast(typ, safe=False))
+        fields.append(pa.field(field.name, typ))
+    return pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(db_path: str) -> Engine:
+    global _engine
+    with _engine_lock:
+        if _engine is None or _engine.db_path != db_path:
+            _engine = Engine(db_path)
+    return _engine
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain and try the DuckDB execution backend.")
+    parser.add_argument("--db", default=None, help="SQLite file (default: DATABASE_URL)")
+    parser.add_argument("--sync", action="store_true", help="Rebuild the Parquet copy now")
+    parser.add_argument("--explain", metavar="SQL", help="Show whether and how a query would run on DuckDB")
+    args = parser.parse_args()
+
+    if args.db is None:
+        from db import _sqlite_path
+
+        args.db = _sqlite_path()
+    if args.sync:
+        started = time.perf_counter()
+        counts = ParquetMirror(args.db).sync()
+        print(f"Wrote {sum(counts.values())} rows from {len(counts)} tables to {DUCKDB_PARQUET_DIR} "
+              f"in {time.perf_counter() - started:.1f}s")
+    if args.explain:
+        tokens = tokenize(args.explain)
+        print(f"analytic: {is_analytic(tokens)}  tables: {readable_tables(tokens)}")
+        try:
+            print(translate(args.explain))
+        except Untranslatable as e:
+            print(f"stays on SQLite: {e}")
+
+
+if __name__ == "__main__":
+    main()
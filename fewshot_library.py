@@ -0,0 +1,245 @@
+# fewshot_library.py
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Optional, Dict, List, Set
+
+import numpy as np
+
+from prompts import FEWSHOTS
+from schema_linking import estimate_tokens, sql_tables, stem
+
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "by", "do", "for", "give", "how", "i", "in", "is", "it", "list",
+    "me", "of", "on", "or", "show", "the", "to", "what", "whats", "which", "who", "with",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(w) for w in _WORD.findall(text.lower().replace("’", "'")) if w not in _STOPWORDS]
+
+
+def _example_hash(ex: Dict[str, str]) -> str:
+    return hashlib.sha1(f"{ex['nl']}\x00{ex['sql']}".encode("utf-8")).hexdigest()
+
+
+class FewShotLibrary:
+    """NL/SQL example store with a BM25 index kept as NumPy arrays.
+
+    Examples are the built-in FEWSHOTS followed by the lines of a JSONL file
+    ({"nl": ..., "sql": ...}). The index is a CSR term matrix (indptr,
+    indices, tf) plus per-term document frequencies, saved next to the file.
+    Adding examples appends rows instead of re-indexing, and a saved index
+    that covers a prefix of the examples is extended with only the new tail.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, path: Optional[str] = None, index_path: Optional[str] = None):
+        self.path = path
+        self.index_path = index_path or (f"{path}.index.npz" if path else None)
+        self._lock = threading.Lock()
+        self.examples: List[Dict[str, str]] = [dict(ex) for ex in FEWSHOTS]
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.examples += [json.loads(line) for line in f if line.strip()]
+        self._hashes = [_example_hash(ex) for ex in self.examples]
+        self._tables: List[Set[str]] = [sql_tables(ex["sql"]) for ex in self.examples]
+        # Tables of the plain_sql fallback, for examples that have one
+        self._plain_tables: List[Optional[Set[str]]] = [
+            sql_tables(ex["plain_sql"]) if "plain_sql" in ex else None for ex in self.examples]
+        self._tokens = [estimate_tokens(self._render(ex)) for ex in self.examples]
+
+        self.vocab: Dict[str, int] = {}
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.tf = np.zeros(0, dtype=np.float32)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(0, dtype=np.int32)
+        self._load_index()
+        loaded = self.n_indexed
+        self._index_from(loaded)
+        # Rewrite the index file only when it was missing, stale or short
+        if self.n_indexed > loaded:
+            self._save_index()
+
+    @property
+    def n_indexed(self) -> int:
+        return len(self.indptr) - 1
+
+    @staticmethod
+    def _render(ex: Dict[str, str]) -> str:
+        return f"NL: {ex['nl']}\nSQL:\n{ex['sql']}"
+
+    def fingerprint(self) -> str:
+        """Changes whenever the example set changes (for translation cache keys)."""
+        return hashlib.sha1("".join(self._hashes).encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> None:
+        if not self.index_path or not os.path.exists(self.index_path):
+            return
+        try:
+            data = np.load(self.index_path, allow_pickle=False)
+            hashes = list(data["hashes"])
+        except (OSError, KeyError, ValueError):
+            return
+        # Only reuse an index built over a prefix of the current examples
+        if hashes != self._hashes[: len(hashes)]:
+            return
+        self.vocab = {term: i for i, term in enumerate(data["vocab"])}
+        self.indptr = data["indptr"]
+        self.indices = data["indices"]
+        self.tf = data["tf"]
+        self.doc_len = data["doc_len"]
+        self.df = data["df"]
+
+    def _save_index(self) -> None:
+        if not self.index_path:
+            return
+        vocab = sorted(self.vocab, key=self.vocab.get)
+        tmp = f"{self.index_path}.tmp.npz"
+        np.savez(
+            tmp,
+            vocab=np.array(vocab, dtype=str),
+            hashes=np.array(self._hashes[: self.n_indexed], dtype=str),
+            indptr=self.indptr, indices=self.indices, tf=self.tf,
+            doc_len=self.doc_len, df=self.df,
+        )
+        os.replace(tmp, self.index_path)
+
+    def _index_from(self, start: int) -> None:
+        """Append CSR rows for examples[start:]."""
+        if start >= len(self.examples):
+            return
+        indptr, indices, tf, doc_len = [], [], [], []
+        df_delta: Dict[int, int] = {}
+        offset = int(self.indptr[-1])
+        for ex in self.examples[start:]:
+            counts: Dict[int, int] = {}
+            terms = tokenize(ex["nl"])
+            for term in terms:
+                tid = self.vocab.setdefault(term, len(self.vocab))
+                counts[tid] = counts.get(tid, 0) + 1
+            for tid, c in counts.items():
+                indices.append(tid)
+                tf.append(c)
+                df_delta[tid] = df_delta.get(tid, 0) + 1
+            offset += len(counts)
+            indptr.append(offset)
+            doc_len.append(len(terms))
+
+        df = np.zeros(len(self.vocab), dtype=np.int32)
+        df[: len(self.df)] = self.df
+        for tid, c in df_delta.items():
+            df[tid] += c
+        self.df = df
+        self.indptr = np.concatenate([self.indptr, np.array(indptr, dtype=np.int64)])
+        self.indices = np.concatenate([self.indices, np.array(indices, dtype=np.int32)])
+        self.tf = np.concatenate([self.tf, np.array(tf, dtype=np.float32)])
+        self.doc_len = np.concatenate([self.doc_len, np.array(doc_len, dtype=np.float32)])
+
+    def add(self, nl: str, sql: str, persist: bool = True) -> None:
+        """Add one example, extend the index and append it to the JSONL file."""
+        self.add_many([{"nl": nl, "sql": sql}], persist=persist)
+
+    def add_many(self, examples: List[Dict[str, str]], persist: bool = True) -> None:
+        with self._lock:
+            for ex in examples:
+                ex = {"nl": ex["nl"], "sql": ex["sql"]}
+                self.examples.append(ex)
+                self._hashes.append(_example_hash(ex))
+                self._tables.append(sql_tables(ex["sql"]))
+                self._plain_tables.append(None)
+                self._tokens.append(estimate_tokens(self._render(ex)))
+            self._index_from(self.n_indexed)
+            if persist and self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for ex in examples:
+                        f.write(json.dumps({"nl": ex["nl"], "sql": ex["sql"]}) + "\n")
+                self._save_index()
+
+    def scores(self, question: str) -> np.ndarray:
+        """BM25 score of every example against the question."""
+        n = self.n_indexed
+        terms = [self.vocab[t] for t in set(tokenize(question)) if t in self.vocab]
+        if not n or not terms:
+            return np.zeros(n, dtype=np.float32)
+        doc_of = np.repeat(np.arange(n), np.diff(self.indptr))
+        mask = np.isin(self.indices, terms)
+        tids = self.indices[mask]
+        docs = doc_of[mask]
+        tf = self.tf[mask]
+        idf = np.log(1 + (n - self.df[tids] + 0.5) / (self.df[tids] + 0.5))
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / max(float(self.doc_len.mean()), 1.0))
+        return np.bincount(docs, weights=idf * tf * (self.k1 + 1) / (tf + norm), minlength=n)
+
+    def select(self, question: str, k: int = 3, token_budget: int = 800,
+               allowed_tables: Optional[Set[str]] = None) -> List[Dict[str, str]]:
+        """Top-k examples by BM25 that fit the token budget (and the pruned schema)."""
+        with self._lock:
+            scores = self.scores(question)
+            chosen: List[Dict[str, str]] = []
+            budget = token_budget
+            for i in np.argsort(-scores, kind="stable"):
+                if len(chosen) >= k or scores[i] <= 0:
+                    break
+                ex, tokens = self.examples[i], self._tokens[i]
+                if allowed_tables is not None and not self._tables[i] <= allowed_tables:
+                    # An example written for an index table the schema leaves out may have a plain version
+                    plain = self._plain_tables[i]
+                    if plain is None or not plain <= allowed_tables:
+                        continue
+                    ex = {"nl": ex["nl"], "sql": ex["plain_sql"]}
+                    tokens = estimate_tokens(self._render(ex))
+                if tokens > budget:
+                    continue
+                chosen.append(ex)
+                budget -= tokens
+            return chosen
+
+
+_library: Optional[FewShotLibrary] = None
+_library_lock = threading.Lock()
+
+
+def get_library() -> FewShotLibrary:
+    """Process-wide library backed by FEWSHOT_LIBRARY_PATH."""
+    global _library
+    with _library_lock:
+        if _library is None:
+            _library = FewShotLibrary(os.getenv("FEWSHOT_LIBRARY_PATH", "fewshots.jsonl"))
+        return _library
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the few-shot example library.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    add = sub.add_parser("add", help="Add one NL/SQL example")
+    add.add_argument("--nl", required=True)
+    add.add_argument("--sql", required=True)
+    imp = sub.add_parser("import", help="Add examples from a JSONL file of {nl, sql}")
+    imp.add_argument("path")
+    search = sub.add_parser("search", help="Show the examples selected for a question")
+    search.add_argument("question")
+    search.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    library = get_library()
+    if args.cmd == "add":
+        library.add(args.nl, args.sql)
+    elif args.cmd == "import":
+        with open(args.path, encoding="utf-8") as f:
+            library.add_many([json.loads(line) for line in f if line.strip()])
+    else:
+        for ex in library.select(args.question, k=args.k):
+            print(FewShotLibrary._render(ex), end="\n\n")
+    print(f"{len(library.examples)} examples indexed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# hedging.py
+"""Hedged model calls: race a few candidates and keep the first good one.
+
+A question's model call usually returns in a second or two. The slow tail,
+and a malformed or rejected answer, cost far more than a second call does.
+With HEDGE=1, race() starts HEDGE_PARALLEL calls. It adds one more when
+none has returned within the deadline, and one more when every returned
+answer failed its check. It stops at the first answer the caller accepts
+and cancels the calls still in flight.
+
+The deadline is the HEDGE_PERCENTILE of recent call latencies, so only the
+slowest calls get hedged. Until HEDGE_MIN_SAMPLES latencies have been
+seen it is HEDGE_DELAY. Each question has a budget: at most
+HEDGE_MAX_CALLS calls and, if HEDGE_TOKEN_BUDGET is set, that many prompt
+plus response tokens.
+
+A blocking generate() cannot be interrupted, so race() only abandons its
+losers (their answers are dropped). arace() cancels its losing tasks.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional, Set, Tuple, TypeVar
+
+from dotenv import load_dotenv
+
+import tracing
+from schema_linking import estimate_tokens
+
+load_dotenv()
+
+HEDGE = os.getenv("HEDGE", "0") != "0"
+HEDGE_PARALLEL = int(os.getenv("HEDGE_PARALLEL", "1"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "3"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_CALLS = int(os.getenv("HEDGE_MAX_CALLS", "3"))
+HEDGE_TOKEN_BUDGET = int(os.getenv("HEDGE_TOKEN_BUDGET", "0"))
+
+tracing.METRIC_HELP["nlsql_hedge_total"] = ("counter", "Hedged model calls by reason (first/deadline/retry) "
+                                                       "and how they ended (won/lost/abandoned)")
+
+T = TypeVar("T")
+# accept(text) -> (result, final): a final result ends the race, None included
+Accept = Callable[[Optional[str]], Tuple[Optional[T], bool]]
+
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+class LatencyWindow:
+    """The last `size` model call latencies."""
+
+    def __init__(self, size: int = 200):
+        self._values = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._values.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            values = sorted(self._values)
+        if len(values) < HEDGE_MIN_SAMPLES:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+latencies = LatencyWindow()
+
+
+def deadline() -> float:
+    """Seconds to wait for an answer before hedging with another call."""
+    p = latencies.percentile(HEDGE_PERCENTILE)
+    return HEDGE_DELAY if p is None else p
+
+
+class Budget:
+    """One question's spend on model calls."""
+
+    def __init__(self, prompt_tokens: int, max_calls: int = HEDGE_MAX_CALLS, max_tokens: int = HEDGE_TOKEN_BUDGET):
+        self.prompt_tokens = prompt_tokens
+        self.max_calls = max(1, max_calls)
+        self.max_tokens = max_tokens
+        self.calls = 0
+        self.tokens = 0
+
+    def allows_call(self) -> bool:
+        if self.calls == 0:
+            return True
+        if self.calls >= self.max_calls:
+            return False
+        return not self.max_tokens or self.tokens + self.prompt_tokens <= self.max_tokens
+
+    def charge(self, tokens: int) -> None:
+        self.tokens += tokens
+
+
+def _count(reason: str, result: str) -> None:
+    tracing.count("nlsql_hedge_total", reason=reason, result=result)
+
+
+def _record(budget: Budget) -> None:
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.set(llm_calls=budget.calls, llm_tokens=budget.tokens)
+
+
+def race(generate: Callable[[], Optional[str]], accept: Accept, budget: Budget) -> Optional[T]:
+    """First accepted answer of up to budget.max_calls generate() calls run on a shared pool.
+
+    Raises the last call's error when every call failed with one.
+    """
+    reasons = {}
+    last_error: Optional[BaseException] = None
+
+    def launch(reason: str) -> Any:
+        budget.calls += 1
+        budget.charge(budget.prompt_tokens)
+        fut = _pool.submit(contextvars.copy_context().run, generate)
+        reasons[fut] = reason
+        return fut
+
+    launch("first")
+    while len(reasons) < HEDGE_PARALLEL and budget.allows_call():
+        launch("first")
+    pending: Set[Any] = set(reasons)
+    answered = False
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=deadline() if budget.allows_call() else None,
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                pending.add(launch("deadline"))
+                continue
+            for fut in done:
+                try:
+                    txt = fut.result()
+                except Exception as e:
+                    _count(reasons[fut], "lost")
+                    last_error = e
+                    continue
+                answered = True
+                budget.charge(estimate_tokens(txt) if txt else 0)
+                result, final = accept(txt)
+                _count(reasons[fut], "won" if final else "lost")
+                if final:
+                    return result
+            if not pending and budget.allows_call():
+                pending.add(launch("retry"))
+    finally:
+        for fut in pending:
+            fut.cancel()
+            _count(reasons[fut], "abandoned")
+        _record(budget)
+    if last_error is not None and not answered:
+        raise last_error
+    return None
+
+
+async def arace(agenerate: Callable[[], Awaitable[Optional[str]]],
+                accept: Callable[[Optional[str]], Awaitable[Tuple[Optional[T], bool]]], budget: Budget) -> Optional[T]:
+    """race() for event loops: candidates are tasks, and the losers are cancelled."""
+    reasons = {}
+    last_error: Optional[BaseException] = None
+
+    def launch(reason: str) -> asyncio.Task:
+        budget.calls += 1
+        budget.charge(budget.prompt_tokens)
+        task = asyncio.ensure_future(agenerate())
+        reasons[task] = reason
+        return task
+
+    launch("first")
+    while len(reasons) < HEDGE_PARALLEL and budget.allows_call():
+        launch("first")
+    pending: Set[asyncio.Task] = set(reasons)
+    answered = False
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=deadline() if budget.allows_call() else None,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                pending.add(launch("deadline"))
+                continue
+            for task in done:
+                try:
+                    txt = task.result()
+                except Exception as e:
+                    _count(reasons[task], "lost")
+                    last_error = e
+                    continue
+                answered = True
+                budget.charge(estimate_tokens(txt) if txt else 0)
+                result, final = await accept(txt)
+                _count(reasons[task], "won" if final else "lost")
+                if final:
+                    return result
+            if not pending and budget.allows_call():
+                pending.add(launch("retry"))
+    finally:
+        for task in pending:
+            task.cancel()
+            _count(reasons[task], "abandoned")
+        _record(budget)
+    if last_error is not None and not answered:
+        raise last_error
+    return None
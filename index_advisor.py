@@ -0,0 +1,437 @@
+# index_advisor.py
+"""Workload-driven index advisor.
+
+nl_to_sql records every SQL statement it hands out (see record_query). The
+advisor replays that workload through EXPLAIN QUERY PLAN, proposes
+composite/covering indexes for the columns the workload filters, joins and
+sorts on, and ranks them by estimated benefit: each candidate is tried in
+an in-memory copy of the schema whose sqlite_stat1 is filled from the live
+database, and the drop in estimated cost (sql_guard.estimate_cost) is
+weighted by how often each query ran.
+
+    python index_advisor.py --fewshots            # report
+    python index_advisor.py --fewshots --apply    # create the top indexes
+    python index_advisor.py --migrate             # add models.py indexes to an existing DB
+"""
+import argparse
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, List, Tuple
+
+from cache import canonical_sql
+from sql_guard import ALLOWED_TABLES, VIRTUAL_TABLES, estimate_cost, table_aliases, tokenize
+
+WORKLOAD_PATH = os.getenv("WORKLOAD_LOG_PATH", ".nlsql_workload.db")
+# Virtual tables take no ordinary indexes
+INDEXABLE_TABLES = ALLOWED_TABLES - VIRTUAL_TABLES
+_EQ_OPS = {'=', '==', 'in', 'is'}
+_RANGE_OPS = {'<', '>', '<=', '>=', 'between', 'like', 'glob'}
+# Clause keyword → how column references inside it are used (ON counts as WHERE)
+_CLAUSES = {'select': 'select', 'from': 'from', 'join': 'from', 'where': 'where', 'on': 'where',
+            'having': 'select', 'group': 'order', 'order': 'order', 'limit': None}
+_SEARCH_TERMS = re.compile(r"\(([^()]*)\)\s*$")
+# Recorded queries are buffered and written by a background thread at most this often
+WORKLOAD_FLUSH_SECONDS = float(os.getenv("WORKLOAD_FLUSH_SECONDS", "5"))
+
+
+def _workload_conn(path: str = WORKLOAD_PATH) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS workload (
+            key TEXT PRIMARY KEY,
+            sql TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_seen REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+class WorkloadLog:
+    """Workload counts buffered in memory and upserted in one transaction per flush.
+
+    record() only bumps an in-memory counter. A daemon thread flushes every
+    `interval` seconds, and so does process exit. The file and its table are
+    opened once, on the first flush.
+    """
+
+    def __init__(self, path: str, interval: float = WORKLOAD_FLUSH_SECONDS):
+        self.path = path
+        self.interval = interval
+        self._pending: Dict[str, List[float]] = {}  # sql → [count, last_seen]
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._flusher: Optional[threading.Thread] = None
+
+    def record(self, sql: str) -> None:
+        now = time.time()
+        with self._lock:
+            entry = self._pending.get(sql)
+            if entry is None:
+                self._pending[sql] = [1, now]
+            else:
+                entry[0] += 1
+                entry[1] = now
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name="workload-log", daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        rows = [(canonical_sql(sql), sql, int(count), last_seen) for sql, (count, last_seen) in pending.items()]
+        with self._flush_lock:
+            try:
+                if self._conn is None:
+                    self._conn = _workload_conn(self.path)
+                with self._conn:
+                    self._conn.executemany(
+                        """INSERT INTO workload (key, sql, count, last_seen) VALUES (?, ?, ?, ?)
+                           ON CONFLICT(key) DO UPDATE SET count = count + excluded.count,
+                                                          last_seen = MAX(last_seen, excluded.last_seen)""",
+                        rows,
+                    )
+            except sqlite3.Error as e:
+                print(f"Workload log write failed ({len(rows)} queries dropped): {e}")
+
+
+_logs: Dict[str, WorkloadLog] = {}
+_logs_lock = threading.Lock()
+
+
+def get_workload_log(path: str = WORKLOAD_PATH) -> WorkloadLog:
+    with _logs_lock:
+        if path not in _logs:
+            _logs[path] = WorkloadLog(path)
+        return _logs[path]
+
+
+def record_query(sql: str, path: str = WORKLOAD_PATH) -> None:
+    """Count one execution of `sql` in the workload log (buffered; see WorkloadLog)."""
+    get_workload_log(path).record(sql)
+
+
+def load_workload(path: str = WORKLOAD_PATH) -> List[Tuple[str, int]]:
+    if path in _logs:
+        _logs[path].flush()
+    if not os.path.exists(path):
+        return []
+    conn = _workload_conn(path)
+    try:
+        return [(sql, count) for sql, count in conn.execute("SELECT sql, count FROM workload ORDER BY count DESC")]
+    finally:
+        conn.close()
+
+
+class Candidate:
+    def __init__(self, table: str, columns: Tuple[str, ...]):
+        self.table = table
+        self.columns = columns
+        self.benefit = 0.0
+        self.queries = 0  # workload queries whose estimated cost it lowers
+
+    @property
+    def name(self) -> str:
+        return f"ix_{self.table}_{'_'.join(self.columns)}"
+
+    def ddl(self) -> str:
+        cols = ", ".join(f'"{c}"' for c in self.columns)
+        return f'CREATE INDEX IF NOT EXISTS "{self.name}" ON "{self.table}" ({cols})'
+
+    def model_snippet(self) -> str:
+        cols = ", ".join(f'"{c}"' for c in self.columns)
+        return f'Index("{self.name}", {cols})'
+
+
+def _table_columns(conn: sqlite3.Connection) -> Dict[str, List[str]]:
+    return {t: [r[1] for r in conn.execute(f'PRAGMA table_info("{t}")')] for t in INDEXABLE_TABLES}
+
+
+def _operator(tokens: List[Tuple[str, str]], i: int, step: int) -> str:
+    """Comparison operator starting at tokens[i] (step=1) or ending there (step=-1)."""
+    if not 0 <= i < len(tokens):
+        return ''
+    text = tokens[i][1].lower()
+    if text in ('<', '>', '!', '=') and 0 <= i + step < len(tokens) and tokens[i + step][1] in ('<', '>', '!', '='):
+        pair = text + tokens[i + step][1] if step == 1 else tokens[i + step][1] + text
+        return pair if pair in ('<=', '>=', '==', '<>', '!=') else text
+    if text == 'not' and step == 1:
+        return ''
+    return text if text in _EQ_OPS or text in _RANGE_OPS else ''
+
+
+def column_usage(sql: str, columns: Dict[str, List[str]]) -> Dict[str, Dict[str, List[str]]]:
+    """Per table: columns used with equality, range, ORDER/GROUP BY, and anywhere."""
+    tokens = tokenize(sql)
+    aliases = table_aliases(tokens)
+    tables_in_query = {t for t in aliases.values() if t in columns}
+    usage: Dict[str, Dict[str, List[str]]] = {}
+
+    def note(table: str, kind: str, col: str) -> None:
+        kinds = usage.setdefault(table, {"eq": [], "range": [], "order": [], "all": []})
+        if col not in kinds[kind]:
+            kinds[kind].append(col)
+        if col not in kinds["all"]:
+            kinds["all"].append(col)
+
+    clause = None
+    for i, (kind, text) in enumerate(tokens):
+        low = text.lower()
+        if kind == 'word' and low in _CLAUSES:
+            clause = _CLAUSES[low]
+            continue
+        if clause in (None, 'from') or kind not in ('word', 'ident'):
+            continue
+        if i + 1 < len(tokens) and tokens[i + 1][1] == '.':
+            continue  # table alias
+        col = text.strip('"`[]').lower()
+        qualified = i >= 2 and tokens[i - 1][1] == '.'
+        if qualified:
+            owners = [aliases.get(tokens[i - 2][1].strip('"`[]').lower())]
+        else:
+            owners = sorted(tables_in_query)
+        owners = [t for t in owners if t in columns and col in columns[t]]
+        if not owners:
+            continue
+        op = _operator(tokens, i + 1, 1) or _operator(tokens, (i - 3 if qualified else i - 1), -1)
+        if clause == 'where' and op in _EQ_OPS:
+            bucket = "eq"
+        elif clause == 'where' and op in _RANGE_OPS:
+            bucket = "range"
+        elif clause == 'order':
+            bucket = "order"
+        else:
+            bucket = "all"
+        for table in owners:
+            note(table, bucket, col)
+    return usage
+
+
+def _candidates_for(use: Dict[str, List[str]], per_key: Dict[str, int]) -> List[Tuple[str, ...]]:
+    """Single-column, composite (equality columns then one range/sort column) and covering keys."""
+    eq = sorted(use["eq"], key=lambda c: per_key.get(c, 1))
+    tail = (use["range"] or use["order"])[:1]
+    out: List[Tuple[str, ...]] = [(c,) for c in eq + use["range"]]
+    if eq:
+        composite = tuple(eq[:3]) + tuple(c for c in tail if c not in eq[:3])
+        out.append(composite)
+        covering = list(composite) + [c for c in use["all"] if c not in composite]
+        if len(composite) < len(covering) <= 5:
+            out.append(tuple(covering))
+    return list(dict.fromkeys(out))
+
+
+class IndexAdvisor:
+    def __init__(self, db_path: str, sample_rows: int = 20000):
+        self.db_path = db_path
+        self.live = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        self.columns = _table_columns(self.live)
+        self.rows = {t: self.live.execute(f'SELECT MAX(rowid) FROM "{t}"').fetchone()[0] or 0 for t in INDEXABLE_TABLES}
+        self.sample_rows = sample_rows
+        self._per_key: Dict[Tuple[str, Tuple[str, ...]], int] = {}
+
+    def rows_per_key(self, table: str, cols: Tuple[str, ...]) -> int:
+        """Average rows sharing one value of `cols`, estimated from a sample."""
+        key = (table, cols)
+        if key not in self._per_key:
+            col_list = ", ".join(f'"{c}"' for c in cols)
+            sample = f'SELECT {col_list} FROM "{table}" LIMIT {int(self.sample_rows)}'
+            s = self.live.execute(f"SELECT COUNT(*) FROM ({sample})").fetchone()[0]
+            d = self.live.execute(f"SELECT COUNT(*) FROM (SELECT DISTINCT * FROM ({sample}))").fetchone()[0]
+            n = max(1, self.rows.get(table, 0))
+            if not s or not d:
+                self._per_key[key] = n
+            elif s >= n or d < s / 10:
+                # Whole table sampled, or few distinct values: assume the sample saw them all
+                self._per_key[key] = max(1, round(n / d))
+            else:
+                self._per_key[key] = max(1, round(s / d))
+        return self._per_key[key]
+
+    def _scratch(self, extra: List[Candidate]) -> sqlite3.Connection:
+        """Schema-only copy with sqlite_stat1 synthesized from the live data."""
+        scratch = sqlite3.connect(":memory:")
+        for (sql,) in self.live.execute(
+            "SELECT sql FROM sqlite_master WHERE type IN ('table', 'index') AND sql IS NOT NULL "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY type DESC"
+        ):
+            try:
+                scratch.execute(sql)
+            except sqlite3.Error:
+                pass  # virtual tables and their shadow tables are not needed here
+        for cand in extra:
+            scratch.execute(cand.ddl())
+        scratch.execute("ANALYZE")
+        scratch.execute("DELETE FROM sqlite_stat1")
+        for table in INDEXABLE_TABLES:
+            n = max(1, self.rows.get(table, 0))
+            scratch.execute("INSERT INTO sqlite_stat1 VALUES (?, NULL, ?)", (table, str(n)))
+            for (idx_name,) in scratch.execute("SELECT name FROM pragma_index_list(?)", (table,)).fetchall():
+                cols = tuple(r[2] for r in scratch.execute("SELECT * FROM pragma_index_info(?)", (idx_name,)))
+                # "nrows rows-per-key(col1) rows-per-key(col1, col2) ..."
+                stat = [str(n)] + [str(self.rows_per_key(table, cols[:k + 1])) for k in range(len(cols))]
+                scratch.execute("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)", (table, idx_name, " ".join(stat)))
+        scratch.execute("ANALYZE sqlite_schema")
+        return scratch
+
+    def search_rows(self, table: str, detail: str) -> Optional[float]:
+        """Rows one SEARCH step returns, from the constraints EXPLAIN shows, e.g. "(status=? AND x>?)"."""
+        m = _SEARCH_TERMS.search(detail)
+        if table not in self.rows or not m:
+            return None
+        eq, ranged = [], False
+        for term in m.group(1).split(" AND "):
+            col, op = re.match(r"(\w+)(.*)", term.strip()).groups()
+            if op.startswith("="):
+                eq.append(col)
+            else:
+                ranged = True
+        if "rowid" in eq:
+            return 1.0
+        rows = float(self.rows_per_key(table, tuple(eq)) if eq else max(1, self.rows[table]))
+        return rows / 3 if ranged else rows
+
+    def cost(self, conn: sqlite3.Connection, sql: str) -> float:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+        return estimate_cost(plan, self.rows, table_aliases(tokenize(sql)), self.search_rows)[0]
+
+    def recommend(self, workload: List[Tuple[str, int]], top: int = 10) -> List[Candidate]:
+        """Indexes chosen greedily by frequency-weighted drop in estimated cost, best first."""
+        base = self._scratch([])
+        baseline: Dict[str, float] = {}
+        proposed: Dict[Tuple[str, Tuple[str, ...]], Candidate] = {}
+        for sql, count in workload:
+            try:
+                baseline[sql] = self.cost(base, sql)
+            except sqlite3.Error:
+                continue
+            for table, use in column_usage(sql, self.columns).items():
+                per_key = {c: self.rows_per_key(table, (c,)) for c in use["eq"]}
+                for cols in _candidates_for(use, per_key):
+                    proposed.setdefault((table, cols), Candidate(table, cols))
+        base.close()
+
+        # Greedy what-if: each round adds the candidate with the largest
+        # marginal gain given the indexes already chosen
+        chosen: List[Candidate] = []
+        current = dict(baseline)
+        remaining = list(proposed.values())
+        while remaining and len(chosen) < top:
+            best, best_gain, best_costs = None, 0.0, {}
+            for cand in remaining:
+                scratch = self._scratch(chosen + [cand])
+                costs = {sql: self.cost(scratch, sql) for sql in current}
+                scratch.close()
+                gain = sum((current[sql] - costs[sql]) * count for sql, count in workload if sql in current)
+                # Ties go to the narrower index (cheaper to maintain)
+                if gain > best_gain * 1.01 or (best is not None and gain >= best_gain * 0.99
+                                               and len(cand.columns) < len(best.columns)):
+                    best, best_gain, best_costs = cand, gain, costs
+            if best is None or best_gain <= 0:
+                break
+            best.benefit = best_gain
+            best.queries = sum(1 for sql in current if best_costs[sql] < current[sql])
+            chosen.append(best)
+            remaining.remove(best)
+            current = best_costs
+        # An index that is a prefix of another chosen one on the same table is redundant
+        for narrow in list(chosen):
+            for wide in chosen:
+                if wide is not narrow and wide.table == narrow.table and \
+                        wide.columns[:len(narrow.columns)] == narrow.columns:
+                    wide.benefit += narrow.benefit
+                    wide.queries = max(wide.queries, narrow.queries)
+                    chosen.remove(narrow)
+                    break
+        return sorted(chosen, key=lambda c: -c.benefit)
+
+
+def apply_indexes(db_path: str, candidates: List[Candidate]) -> None:
+    """Create the indexes on an existing database and refresh planner statistics."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            for cand in candidates:
+                conn.execute(cand.ddl())
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def migrate_model_indexes(db_path: str) -> List[str]:
+    """Create the indexes declared in models.py that an existing database lacks."""
+    from sqlalchemy import create_engine, inspect
+
+    from models import Base
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    created = []
+    try:
+        existing = {t: {ix["name"] for ix in inspect(engine).get_indexes(t)} for t in inspect(engine).get_table_names()}
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing.get(table.name, set()):
+                    index.create(engine)
+                    created.append(index.name)
+        if created:
+            with engine.begin() as conn:
+                conn.exec_driver_sql("ANALYZE")
+    finally:
+        engine.dispose()
+    return created
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recommend indexes for the recorded NL→SQL workload.")
+    parser.add_argument("--db", default=None, help="SQLite file (default: DATABASE_URL)")
+    parser.add_argument("--workload", default=WORKLOAD_PATH, help="Workload log written by nl_to_sql")
+    parser.add_argument("--fewshots", action="store_true", help="Add the prompt few-shots to the workload")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--apply", action="store_true", help="Create the recommended indexes")
+    parser.add_argument("--migrate", action="store_true", help="Create the indexes declared in models.py")
+    args = parser.parse_args()
+
+    if args.db is None:
+        from db import _sqlite_path
+
+        args.db = _sqlite_path()
+    if args.migrate:
+        created = migrate_model_indexes(args.db)
+        print(f"Created {len(created)} model index(es) on {args.db}: {', '.join(created) or 'none missing'}")
+    workload = load_workload(args.workload)
+    if args.fewshots:
+        from prompts import FEWSHOTS
+
+        workload += [(ex["sql"], 1) for ex in FEWSHOTS]
+    if not workload:
+        print("Workload is empty; run some questions first or pass --fewshots.")
+        return
+
+    advisor = IndexAdvisor(args.db)
+    recs = advisor.recommend(workload, top=args.top)
+    for cand in recs:
+        print(f"{cand.benefit:14.0f}  {cand.queries:4d} queries  {cand.ddl()}")
+    if recs:
+        print("\nFor models.py __table_args__:")
+        for cand in recs:
+            print(f"  {cand.table}: {cand.model_snippet()}")
+    if args.apply and recs:
+        apply_indexes(args.db, recs)
+        print(f"\nCreated {len(recs)} index(es) on {args.db}")
+
+
+if __name__ == "__main__":
+    main()
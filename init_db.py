@@ -1,12 +1,17 @@
+import argparse
+
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+import booking_intervals
+import text_search
+from db import enable_wal
 from models import Base
-from seed import seed_data
+from seed import seed_bulk, seed_data
 
 engine = create_engine("sqlite:///rental_app.db", echo=True)
 Session = sessionmaker(bind=engine)
 
-def init_db():
+def init_db(scale_factor=None, workers=None):
     print("Dropping all tables...")
     Base.metadata.drop_all(engine)
 
@@ -14,10 +19,40 @@ def init_db():
     Base.metadata.create_all(engine)
 
     print("Seeding data...")
-    session = Session()
-    seed_data(session, num_users=50, num_properties=100, num_bookings=200)
-    session.close()
+    if scale_factor is not None:
+        # Bulk mode for load testing; per-statement echo would dominate the run
+        engine.echo = False
+        seed_bulk(engine, scale_factor=scale_factor, workers=workers)
+    else:
+        session = Session()
+        seed_data(session, num_users=50, num_properties=100, num_bookings=200)
+        session.close()
+
+    print("Building booking interval and full-text indexes...")
+    with engine.connect() as conn:
+        booking_intervals.install(conn.connection.driver_connection)
+        text_search.install(conn.connection.driver_connection)
+    # Readers never block on a writer; the app's read-only connections cannot switch it themselves
+    enable_wal(engine.url.database)
+    print(" Done!")
+
+def migrate():
+    """Bring an existing database up to date without reseeding: build the indexes it lacks, switch to WAL."""
+    path = engine.url.database
+    booking_intervals.ensure(path)
+    text_search.ensure(path)
+    enable_wal(path)
     print(" Done!")
 
 if __name__ == "__main__":
-    init_db()
+    parser = argparse.ArgumentParser(description="Reset and seed the rental database.")
+    parser.add_argument("--scale-factor", type=float, default=None,
+                        help="Bulk-seed BULK_BASE_ROWS × this factor instead of the small demo data")
+    parser.add_argument("--workers", type=int, default=None, help="Generator processes for bulk seeding")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Keep the data and only build what is missing (indexes, WAL mode)")
+    args = parser.parse_args()
+    if args.migrate:
+        migrate()
+    else:
+        init_db(scale_factor=args.scale_factor, workers=args.workers)
@@ -0,0 +1,104 @@
+# json_stream.py
+"""Incremental scanner for a JSON object that arrives in pieces.
+
+The model answers with one object, {"sql": ..., "confidence": ..., "notes":
+...}, and streams it a few tokens at a time. FieldScanner.feed() takes each
+chunk and returns the top-level fields completed by it. The SQL is usable as
+soon as its closing quote arrives, while the model is still writing its
+notes. Anything before the first "{" (a ```json fence, prose) is skipped,
+as is anything after the object closes.
+"""
+import json
+from typing import Any, Dict, Optional
+
+
+class FieldScanner:
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._buf = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect = "key"
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Top-level fields whose values this chunk completed."""
+        completed: Dict[str, Any] = {}
+        self._buf += chunk
+        buf = self._buf
+        for i in range(self._pos, len(buf)):
+            if self.done:
+                break
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._string_end(i, completed)
+                continue
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                    self._expect = "key"
+                continue
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._start_value(i)
+            elif c in "{[":
+                self._start_value(i)
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end_value(i, completed)
+                    self.done = True
+            elif self._depth == 1 and c == ":":
+                self._expect = "value"
+                self._value_start = None
+            elif self._depth == 1 and c == ",":
+                self._end_value(i, completed)
+                self._expect = "key"
+            elif not c.isspace():
+                self._start_value(i)
+        self._pos = len(buf)
+        return completed
+
+    def _start_value(self, i: int) -> None:
+        if self._depth == 1 and self._expect == "value" and self._value_start is None:
+            self._value_start = i
+
+    def _string_end(self, i: int, completed: Dict[str, Any]) -> None:
+        if self._depth != 1:
+            return
+        if self._expect == "key":
+            self._key = self._loads(self._buf[self._string_start:i + 1])
+        elif self._value_start == self._string_start:
+            # A string value is complete at its closing quote; no need to wait for the comma
+            self._end_value(i + 1, completed)
+
+    def _end_value(self, end: int, completed: Dict[str, Any]) -> None:
+        if self._expect != "value" or self._value_start is None or self._key is None:
+            return
+        text = self._buf[self._value_start:end].strip()
+        self._expect = "done"
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return
+        self.fields[self._key] = completed[self._key] = value
+
+    @staticmethod
+    def _loads(text: str) -> Optional[str]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
@@ -0,0 +1,186 @@
+# llm.py
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional, Dict, Iterator, Set, Tuple
+
+from dotenv import load_dotenv
+
+from cache import normalize_question
+
+load_dotenv()
+
+MODEL_NAME = os.getenv("MODEL_NAME", "gemini-1.5-flash")
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+
+class LLMBackend:
+    """Minimal interface nlsql needs from a model: prompt in, text out."""
+
+    name = "base"
+    model_name = ""
+
+    def generate(self, prompt: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def agenerate(self, prompt: str) -> Optional[str]:
+        """Async variant; backends without a native one run generate() in a thread."""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """The answer in pieces as the model writes it; backends without streaming yield it whole."""
+        text = self.generate(prompt)
+        if text:
+            yield text
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini; the SDK is imported and configured on first use."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = MODEL_NAME, api_key: Optional[str] = None):
+        self.model_name = model_name
+        self._api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                api_key = self._api_key or os.getenv("GOOGLE_API_KEY")
+                if not api_key:
+                    raise RuntimeError("GOOGLE_API_KEY not set. Please add it to your .env file.")
+                import google.generativeai as genai
+
+                genai.configure(api_key=api_key)
+                self._model = genai.GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt: str) -> Optional[str]:
+        resp = self._get_model().generate_content(prompt)
+        return getattr(resp, "text", None)
+
+    async def agenerate(self, prompt: str) -> Optional[str]:
+        resp = await self._get_model().generate_content_async(prompt)
+        return getattr(resp, "text", None)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._get_model().generate_content(prompt, stream=True):
+            text = getattr(chunk, "text", None)
+            if text:
+                yield text
+
+
+_QUESTION_IN_PROMPT = re.compile(r"User question:\n(.*?)\n\nReturn ONLY JSON", re.S)
+
+
+class StubBackend(LLMBackend):
+    """Local, deterministic backend that replays recorded responses.
+
+    Responses are keyed on the normalized question found in the prompt. The
+    FEWSHOTS are always recorded; `path` may add a JSONL file of
+    {"question": ..., "response": ...} (or {"question": ..., "sql": ...}) lines.
+    Like a model, a few-shot whose SQL needs an index table the prompt's
+    schema leaves out is answered with its plain_sql. Unknown questions get
+    the "unanswerable" JSON. `latency` simulates a
+    model round trip in seconds; generate_stream spreads it over
+    `chunk_chars`-sized pieces.
+    """
+
+    name = "stub"
+    model_name = "stub"
+
+    def __init__(self, responses: Optional[Dict[str, str]] = None, path: Optional[str] = None,
+                 latency: float = 0.0, chunk_chars: int = 16):
+        from prompts import FEWSHOTS
+        from sql_guard import VIRTUAL_TABLES
+
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.responses: Dict[str, str] = {}
+        # question → (index tables the recorded SQL reads, response with the plain_sql)
+        self._plain: Dict[str, Tuple[Set[str], str]] = {}
+        for ex in FEWSHOTS:
+            self.record(ex["nl"], json.dumps({"sql": ex["sql"], "confidence": 1.0, "notes": "recorded few-shot"}))
+            tables = {t for t in VIRTUAL_TABLES if re.search(rf"\b{t}\b", ex["sql"])}
+            if tables and "plain_sql" in ex:
+                self._plain[normalize_question(ex["nl"])] = (tables, json.dumps(
+                    {"sql": ex["plain_sql"], "confidence": 1.0, "notes": "recorded few-shot"}))
+        if path:
+            self.load(path)
+        for question, response in (responses or {}).items():
+            self.record(question, response)
+
+    def record(self, question: str, response: str) -> None:
+        self.responses[normalize_question(question)] = response
+        self._plain.pop(normalize_question(question), None)
+
+    def load(self, path: str) -> None:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                response = item.get("response")
+                if response is None:
+                    response = json.dumps({"sql": item.get("sql"), "confidence": 1.0, "notes": "recorded"})
+                self.record(item["question"], response)
+
+    def generate(self, prompt: str) -> Optional[str]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def agenerate(self, prompt: str) -> Optional[str]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        text = self._respond(prompt)
+        for i in range(0, len(text), self.chunk_chars):
+            chunk = text[i:i + self.chunk_chars]
+            if self.latency:
+                time.sleep(self.latency * len(chunk) / len(text))
+            yield chunk
+
+    def _respond(self, prompt: str) -> str:
+        match = _QUESTION_IN_PROMPT.search(prompt)
+        question = match.group(1) if match else prompt
+        plain = self._plain.get(normalize_question(question))
+        if plain is not None and any(f"CREATE VIRTUAL TABLE {t} " not in prompt for t in plain[0]):
+            return plain[1]
+        return self.responses.get(
+            normalize_question(question),
+            json.dumps({"sql": None, "confidence": 0.0, "notes": "unanswerable"}),
+        )
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """Process-wide backend chosen by LLM_BACKEND (gemini | stub), created on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if LLM_BACKEND == "stub":
+                _backend = StubBackend(path=os.getenv("LLM_STUB_RESPONSES"),
+                                       latency=float(os.getenv("LLM_STUB_LATENCY", "0")))
+            elif LLM_BACKEND == "gemini":
+                _backend = GeminiBackend()
+            else:
+                raise RuntimeError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+        return _backend
+
+
+def set_backend(backend: Optional[LLMBackend]) -> None:
+    """Swap the process-wide backend (benchmarks, tests, services)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
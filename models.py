@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Enum, Date, DateTime, DECIMAL, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Enum, Date, DateTime, DECIMAL, ForeignKey, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship, declarative_base
 
@@ -24,12 +24,12 @@ class User(Base):
 class Property(Base):
     __tablename__ = "properties"
     property_id = Column(Integer, primary_key=True, autoincrement=True)
-    landlord_id = Column(Integer, ForeignKey("users.user_id"))
+    landlord_id = Column(Integer, ForeignKey("users.user_id"), index=True)
     title = Column(String(100))
     description = Column(Text)
     property_type = Column(Enum("apartment", "house", "studio", "villa", name="property_types"))
     address = Column(String(255))
-    city = Column(String(100))
+    city = Column(String(100), index=True)
     state = Column(String(100))
     country = Column(String(100))
     bedrooms = Column(Integer)
@@ -48,8 +48,8 @@ class Property(Base):
 class Booking(Base):
     __tablename__ = "bookings"
     booking_id = Column(Integer, primary_key=True, autoincrement=True)
-    property_id = Column(Integer, ForeignKey("properties.property_id"))
-    tenant_id = Column(Integer, ForeignKey("users.user_id"))
+    property_id = Column(Integer, ForeignKey("properties.property_id"), index=True)
+    tenant_id = Column(Integer, ForeignKey("users.user_id"), index=True)
     start_date = Column(Date)
     end_date = Column(Date)
     status = Column(Enum("pending", "confirmed", "cancelled", "completed", name="booking_status"))
@@ -63,7 +63,7 @@ class Booking(Base):
 class Payment(Base):
     __tablename__ = "payments"
     payment_id = Column(Integer, primary_key=True, autoincrement=True)
-    booking_id = Column(Integer, ForeignKey("bookings.booking_id"))
+    booking_id = Column(Integer, ForeignKey("bookings.booking_id"), index=True)
     tenant_id = Column(Integer, ForeignKey("users.user_id"))
     amount = Column(DECIMAL(12, 2))
     payment_date = Column(Date)
@@ -73,12 +73,15 @@ class Payment(Base):
     booking = relationship("Booking", back_populates="payments")
     tenant = relationship("User", back_populates="payments")
 
+    # Covers per-tenant payment totals filtered by status (from index_advisor.py)
+    __table_args__ = (Index("ix_payments_tenant_id_status_amount", "tenant_id", "status", "amount"),)
+
 
 class Review(Base):
     __tablename__ = "reviews"
     review_id = Column(Integer, primary_key=True, autoincrement=True)
-    property_id = Column(Integer, ForeignKey("properties.property_id"))
-    tenant_id = Column(Integer, ForeignKey("users.user_id"))
+    property_id = Column(Integer, ForeignKey("properties.property_id"), index=True)
+    tenant_id = Column(Integer, ForeignKey("users.user_id"), index=True)
     rating = Column(Integer)
     comment = Column(Text)
     created_at = Column(DateTime, server_default=func.now())
@@ -90,7 +93,7 @@ class Review(Base):
 class PropertyPhoto(Base):
     __tablename__ = "property_photos"
     photo_id = Column(Integer, primary_key=True, autoincrement=True)
-    property_id = Column(Integer, ForeignKey("properties.property_id"))
+    property_id = Column(Integer, ForeignKey("properties.property_id"), index=True)
     photo_url = Column(String(255))
     uploaded_at = Column(DateTime, server_default=func.now())
 
@@ -1,36 +1,56 @@
+import asyncio
+import contextvars
 import os
 import json
 import re
-from typing import Optional, Dict, Any
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Optional, Dict, Any, Callable, List, Tuple
 
-import google.generativeai as genai
 from dotenv import load_dotenv
 
-from prompts import SCHEMA_DDL, FEWSHOTS, INSTRUCTIONS
+from prompts import fewshots as base_fewshots, instructions, schema_ddl as full_schema_ddl
+from cache import fingerprint, get_translation_cache, normalize_question
+from llm import get_backend
+from schema_linking import estimate_tokens, pruned_schema
+from fewshot_library import get_library
+from sql_guard import ALLOWED_TABLES, SQLValidationError, validate_sql, check_cost
+from index_advisor import record_query
+from json_stream import FieldScanner
+from singleflight import SingleFlight
+import db
+import hedging
+import rollups
+import templates
+import tracing
 
 # Load environment variables
 load_dotenv()
 
-MODEL_NAME = os.getenv("MODEL_NAME", "gemini-1.5-flash")
-API_KEY = os.getenv("GOOGLE_API_KEY")
-
-if not API_KEY:
-    raise RuntimeError("GOOGLE_API_KEY not set. Please add it to your .env file.")
-
-# Configure Gemini API
-genai.configure(api_key=API_KEY)
-model = genai.GenerativeModel(MODEL_NAME)
-
-# Allowed and banned SQL elements
-ALLOWED_TABLES = {
-    'users', 'properties', 'bookings', 'payments',
-    'reviews', 'property_photos', 'favorites'
-}
-BANNED_KEYWORDS = {
-    'insert', 'update', 'delete', 'drop',
-    'truncate', 'alter', 'create', 'attach', 'pragma'
-}
-
+CACHE_ENABLED = os.getenv("NLSQL_CACHE", "1") != "0"
+# Hard ceiling on rows a generated query may return; the UI pages through them
+MAX_RESULT_ROWS = int(os.getenv("MAX_RESULT_ROWS", "10000"))
+# Send only the tables/few-shots the question needs instead of the whole schema
+SCHEMA_PRUNING = os.getenv("SCHEMA_PRUNING", "1") != "0"
+# Few-shots are retrieved per question from the example library
+FEWSHOT_K = int(os.getenv("FEWSHOT_K", "3"))
+FEWSHOT_TOKEN_BUDGET = int(os.getenv("FEWSHOT_TOKEN_BUDGET", "800"))
+# Reject queries whose EXPLAIN QUERY PLAN cost estimate is too high
+COST_GUARD = os.getenv("COST_GUARD", "1") != "0"
+MAX_QUERY_COST = float(os.getenv("MAX_QUERY_COST", "5e7"))
+# Stream the model's answer and validate the SQL as soon as its field is complete
+LLM_STREAM = os.getenv("LLM_STREAM", "1") != "0"
+# Answer questions that differ from an earlier one only in their literals from a learned template
+TEMPLATES_ENABLED = os.getenv("TEMPLATES", "1") != "0"
+# Log every SQL handed out so index_advisor.py can recommend indexes for it
+WORKLOAD_LOG = os.getenv("WORKLOAD_LOG", "1") != "0"
+
+_prompt_stats = {"prompts": 0, "prompt_tokens": 0, "tokens_saved": 0}
+_prompt_stats_lock = threading.Lock()
+# Identical questions asked concurrently (other sessions, retries) share one model call
+_translations = SingleFlight("translate")
+tracing.METRIC_HELP["nlsql_templates_learned_total"] = ("counter", "SQL templates learned from model answers")
 
 def _json_from_text(text: str) -> Optional[Dict[str, Any]]:
     """Extract the first JSON object from text."""
@@ -43,49 +63,15 @@ def _json_from_text(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def _sanitize_sql(sql: str) -> str:
-    """Remove unsafe elements and ensure single-statement SQL."""
-    sql = sql.strip().strip(';')
-    sql = sql.replace('`', '')
-
-    # Prevent multi-statements
-    if ';' in sql:
-        sql = sql.split(';')[0]
-
-    return sql
-
-
-def _is_select_only(sql: str) -> bool:
-    """Ensure only SELECT queries are allowed."""
-    s = sql.strip().lower()
-    if not s.startswith('select'):
-        return False
-    return all(kw not in s for kw in BANNED_KEYWORDS)
-
-
-def _references_only_allowed_tables(sql: str) -> bool:
-    """Check query only references whitelisted tables."""
-    s = sql.lower()
-    tables = re.findall(r"(?:from|join)\s+([a-zA-Z_][a-zA-Z0-9_]*)", s)
-    return all(t in ALLOWED_TABLES for t in tables)
-
-
-def _ensure_limit(sql: str, default_limit: int = 200) -> str:
-    """Ensure a LIMIT is present to prevent huge outputs."""
-    if " limit " not in sql.lower():
-        return f"{sql}\nLIMIT {default_limit}"
-    return sql
-
-
-def build_prompt(user_query: str) -> str:
-    """Builds a rich prompt with schema, fewshots, and instructions."""
+def _render_prompt(user_query: str, schema_ddl: str, fewshots: List[Dict[str, str]],
+                   rules: str) -> str:
     examples = "\n\n".join(
-        f"NL: {ex['nl']}\nSQL:\n{ex['sql']}" for ex in FEWSHOTS
+        f"NL: {ex['nl']}\nSQL:\n{ex['sql']}" for ex in fewshots
     )
-    return f"""{INSTRUCTIONS}
+    return f"""{rules}
 
 SCHEMA (SQLite DDL):
-{SCHEMA_DDL}
+{schema_ddl}
 
 Examples:
 {examples}
@@ -97,30 +83,433 @@ Return ONLY JSON as specified.
 """
 
 
-def nl_to_sql(user_query: str) -> Optional[Dict[str, Any]]:
-    """Convert natural language query into a safe SQL statement."""
-    prompt = build_prompt(user_query)
-    try:
-        resp = model.generate_content(prompt)
-        txt = getattr(resp, "text", None)
+def build_prompt_with_stats(user_query: str) -> Tuple[str, Dict[str, Any]]:
+    """Prompt plus token accounting against the unpruned prompt.
+
+    Index tables the database has not built are left out of the schema,
+    rules and examples.
+    """
+    missing = db.missing_indexes()
+    rules = instructions(missing)
+    full = _render_prompt(user_query, full_schema_ddl(missing), base_fewshots(missing), rules)
+    if not SCHEMA_PRUNING:
+        tokens = estimate_tokens(full)
+        return full, {"tables": None, "prompt_tokens": tokens, "full_prompt_tokens": tokens, "tokens_saved": 0}
+
+    schema_ddl, tables = pruned_schema(user_query, missing)
+    fewshots = get_library().select(user_query, k=FEWSHOT_K, token_budget=FEWSHOT_TOKEN_BUDGET,
+                                    allowed_tables=tables)
+    prompt = _render_prompt(user_query, schema_ddl, fewshots, rules)
+    full_tokens = estimate_tokens(full)
+    prompt_tokens = estimate_tokens(prompt)
+    stats = {
+        "tables": sorted(tables),
+        "prompt_tokens": prompt_tokens,
+        "full_prompt_tokens": full_tokens,
+        "tokens_saved": full_tokens - prompt_tokens,
+    }
+    with _prompt_stats_lock:
+        _prompt_stats["prompts"] += 1
+        _prompt_stats["prompt_tokens"] += prompt_tokens
+        _prompt_stats["tokens_saved"] += full_tokens - prompt_tokens
+    return prompt, stats
 
-        if not txt:
-            return None
 
-        data = _json_from_text(txt)
-        if not data or "sql" not in data:
+def build_prompt(user_query: str) -> str:
+    """Builds a rich prompt with schema, fewshots, and instructions."""
+    return build_prompt_with_stats(user_query)[0]
+
+
+def prompt_stats() -> Dict[str, int]:
+    """Cumulative prompt token counters for this process."""
+    with _prompt_stats_lock:
+        return dict(_prompt_stats)
+
+
+def prompt_fingerprint() -> str:
+    """Fingerprint of everything besides the question that shapes the answer."""
+    backend = get_backend()
+    missing = db.missing_indexes()
+    return fingerprint(full_schema_ddl(missing), get_library().fingerprint(), instructions(missing),
+                       backend.name, backend.model_name,
+                       MAX_RESULT_ROWS, SCHEMA_PRUNING, FEWSHOT_K, FEWSHOT_TOKEN_BUDGET)
+
+
+def cache_stats() -> Dict[str, int]:
+    """Hit/miss counters of the translation cache."""
+    return get_translation_cache().stats()
+
+
+def nl_to_sql(user_query: str, raise_errors: bool = False,
+              on_sql: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+    """Convert natural language query into a safe SQL statement.
+
+    LLM/transport failures are logged and turned into None unless
+    `raise_errors` is set, which lets callers such as the batch runner retry.
+    With LLM_STREAM, `on_sql` gets {"sql"} as soon as a streamed answer's
+    SQL is complete and has passed validation and the cost guard, while
+    the model is still writing the rest; the caller can start the query.
+    A translation from a learned template carries its values in "params",
+    to be bound when the SQL runs.
+    """
+    cache, key, data = _cached_translation(user_query)
+    if data is None:
+        data = _templated(user_query)
+    if data is None:
+        def translate_and_store(_call) -> Optional[Dict[str, Any]]:
+            fresh = _translate(user_query, on_sql)
+            if fresh is not None and cache is not None:
+                cache.put(key, fresh)
+            _learn(user_query, fresh)
+            return fresh
+
+        try:
+            data = _coalesced(*_translations.do(_flight_key(user_query, key), translate_and_store))
+        except Exception as e:
+            _outcome("error")
+            if raise_errors:
+                raise
+            print(f"Error in nl_to_sql: {e}")
             return None
+    return _accept(data)
+
+
+async def nl_to_sql_async(user_query: str, raise_errors: bool = False,
+                          executor: Optional[Executor] = None) -> Optional[Dict[str, Any]]:
+    """nl_to_sql for event loops: the model call is awaited, cache and plan checks run on `executor`."""
+    loop = asyncio.get_running_loop()
+    cache, key, data = await _run_in(loop, executor, _cached_translation, user_query)
+    if data is None:
+        data = await _run_in(loop, executor, _templated, user_query)
+    if data is None:
+        async def translate_and_store() -> Optional[Dict[str, Any]]:
+            fresh = await _translate_async(user_query)
+            if fresh is not None and cache is not None:
+                await _run_in(loop, executor, cache.put, key, fresh)
+            await _run_in(loop, executor, _learn, user_query, fresh)
+            return fresh
+
+        try:
+            data = _coalesced(*await _translations.do_async(_flight_key(user_query, key), translate_and_store))
+        except Exception as e:
+            _outcome("error")
+            if raise_errors:
+                raise
+            print(f"Error in nl_to_sql: {e}")
+            return None
+    return await _run_in(loop, executor, _accept, data)
+
+
+def _flight_key(user_query: str, cache_key: Optional[str]) -> str:
+    # Same identity as the translation cache, also when the cache is disabled
+    return cache_key or fingerprint(normalize_question(user_query), prompt_fingerprint())
+
+
+def _coalesced(data: Optional[Dict[str, Any]], shared: bool) -> Optional[Dict[str, Any]]:
+    """A caller's own copy of a translation that another caller produced."""
+    if shared:
+        trace = tracing.current_trace()
+        if trace is not None:
+            trace.set(translation="shared")
+        return dict(data) if data is not None else None
+    return data
+
+
+def _run_in(loop: asyncio.AbstractEventLoop, executor: Optional[Executor], fn, *args):
+    # copy_context keeps the caller's active trace for spans run in the pool
+    return loop.run_in_executor(executor, contextvars.copy_context().run, fn, *args)
+
 
-        sql = _sanitize_sql(data["sql"])
-        if not _is_select_only(sql):
+def _cached_translation(user_query: str) -> Tuple[Any, Optional[str], Optional[Dict[str, Any]]]:
+    """(cache, key, cached translation or None); cache is None when disabled."""
+    cache = get_translation_cache() if CACHE_ENABLED else None
+    if cache is None:
+        return None, None, None
+    with tracing.span("translation_cache"):
+        key = cache.make_key(user_query, prompt_fingerprint())
+        data = cache.get(key)
+    tracing.cache_event("translation", data is not None)
+    return cache, key, data
+
+
+def _templated(user_query: str) -> Optional[Dict[str, Any]]:
+    """A translation from a learned template (no model call), or None."""
+    if not TEMPLATES_ENABLED:
+        return None
+    with tracing.span("template") as s:
+        try:
+            extraction = templates.extract(user_query)
+        except Exception as e:
+            print(f"Template lookup failed: {e}")
+            return None
+        found = templates.get_template_store().match(extraction, prompt_fingerprint())
+        tracing.cache_event("template", found is not None)
+        if found is None:
             return None
-        if not _references_only_allowed_tables(sql):
+        template, params = found
+        s["skeleton"] = template.skeleton
+        try:
+            # Same gate as a model answer; a bound "top N" past MAX_RESULT_ROWS gets capped here
+            sql = validate_sql(template.sql, MAX_RESULT_ROWS, params, missing=db.missing_indexes())
+        except SQLValidationError as e:
+            print(f"Rejected template SQL: {e}")
+            s["rejected"] = str(e)
             return None
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.set(translation="template")
+    return {"sql": sql, "params": params, "confidence": template.confidence,
+            "notes": f"Learned template: {template.skeleton}", "template": template.key}
 
-        # Add LIMIT for safety
-        data["sql"] = _ensure_limit(sql)
-        return data
 
+def _learn(user_query: str, data: Optional[Dict[str, Any]]) -> None:
+    """Keep a template from a model answer so questions that differ only in their literals skip the model."""
+    if not TEMPLATES_ENABLED or data is None or not data.get("sql"):
+        return
+    try:
+        confidence = float(data.get("confidence") or 0)
+    except (TypeError, ValueError):
+        return
+    if confidence < templates.TEMPLATE_MIN_CONFIDENCE:
+        return
+    try:
+        extraction = templates.extract(user_query)
     except Exception as e:
-        print(f"Error in nl_to_sql: {e}")
+        print(f"Template learning failed: {e}")
+        return
+    if extraction.entities and templates.get_template_store().learn(extraction, data["sql"], confidence,
+                                                                     prompt_fingerprint()):
+        tracing.count("nlsql_templates_learned_total")
+
+
+def template_stats() -> Dict[str, Any]:
+    """Template hits/misses in this process and the LLM-bypass rate."""
+    return templates.get_template_store().stats()
+
+
+def _accept(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Final gate for a (possibly cached) translation, plus outcome and workload accounting."""
+    # Cost depends on the data, so it is re-checked even for cached translations
+    if data is not None and not _passes_cost_guard(data["sql"], data.get("params")):
+        _outcome("rejected")
+        return None
+    if data is not None:
+        _outcome("answered")
+        if data.get("sql") and WORKLOAD_LOG:
+            record_query(templates.render(data["sql"], data.get("params")))
+    return data
+
+
+def _outcome(outcome: str) -> None:
+    tracing.count("nlsql_questions_total", outcome=outcome)
+    trace = tracing.current_trace()
+    if trace is not None:
+        trace.set(outcome=outcome)
+
+
+def _passes_cost_guard(sql: str, params: Optional[Dict[str, Any]] = None) -> bool:
+    """EXPLAIN QUERY PLAN gate: reject cartesian/unindexed plans over large tables."""
+    if not COST_GUARD or db.data_version() is None:
+        return True
+    with tracing.span("cost_guard") as s:
+        # Judge the plan that will actually run, which may read a rollup table instead
+        routed = db.route_sql(sql)
+        if routed != sql:
+            s["rollup"] = True
+        try:
+            tables = list(ALLOWED_TABLES) + list(rollups.ROLLUPS)
+            s["cost"] = check_cost(routed, db.explain_query_plan(routed, params), db.table_row_estimates(tables),
+                                   MAX_QUERY_COST)
+        except SQLValidationError as e:
+            print(f"Rejected SQL: {e}")
+            s["rejected"] = str(e)
+            return False
+    return True
+
+
+def _translate(user_query: str,
+               on_sql: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+    """Run the LLM round trip and validate its answer."""
+    prompt, stats = _prompt_for(user_query)
+    backend = get_backend()
+    if not hedging.HEDGE:
+        if LLM_STREAM:
+            return _streamed(backend, prompt, stats, on_sql)
+        return _from_response(_generate(backend, prompt), stats)
+    failures: List[str] = []
+    data = hedging.race(lambda: _generate(backend, prompt), lambda txt: _candidate(txt, failures),
+                        hedging.Budget(stats["prompt_tokens"]))
+    return _hedged_result(data, stats, failures)
+
+
+async def _translate_async(user_query: str) -> Optional[Dict[str, Any]]:
+    prompt, stats = _prompt_for(user_query)
+    backend = get_backend()
+    if not hedging.HEDGE:
+        return _from_response(await _agenerate(backend, prompt), stats)
+    loop = asyncio.get_running_loop()
+    failures: List[str] = []
+
+    async def accept(txt: Optional[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        return await _run_in(loop, None, _candidate, txt, failures)
+
+    data = await hedging.arace(lambda: _agenerate(backend, prompt), accept, hedging.Budget(stats["prompt_tokens"]))
+    return _hedged_result(data, stats, failures)
+
+
+def _generate(backend, prompt: str) -> Optional[str]:
+    started = time.perf_counter()
+    with tracing.span("llm", backend=backend.name) as s:
+        txt = backend.generate(prompt)
+        s["response_tokens"] = estimate_tokens(txt) if txt else 0
+    hedging.latencies.observe(time.perf_counter() - started)
+    tracing.count("nlsql_response_tokens_total", s["response_tokens"])
+    return txt
+
+
+def _streamed(backend, prompt: str, stats: Dict[str, Any],
+              on_sql: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[Dict[str, Any]]:
+    """Streamed round trip: the SQL is checked (and handed to on_sql) once its field is complete."""
+    scanner = FieldScanner()
+    parts: List[str] = []
+    early: Optional[str] = None
+    started = time.perf_counter()
+    with tracing.span("llm", backend=backend.name, streamed=True) as s:
+        for chunk in backend.generate_stream(prompt):
+            parts.append(chunk)
+            if early is None and "sql" in scanner.feed(chunk):
+                s["sql_seconds"] = round(time.perf_counter() - started, 4)
+                early = _early_sql(scanner.fields["sql"], on_sql)
+        txt = "".join(parts)
+        s["response_tokens"] = estimate_tokens(txt) if txt else 0
+    hedging.latencies.observe(time.perf_counter() - started)
+    tracing.count("nlsql_response_tokens_total", s["response_tokens"])
+
+    data, failure = _checked(txt)
+    if data is None and early is not None:
+        # The SQL arrived intact even though the rest of the answer did not parse
+        data, failure = dict(scanner.fields, sql=early), None
+    if data is None:
+        _outcome(_FAILURE_OUTCOME[failure])
+        return None
+    data["prompt_stats"] = stats
+    return data
+
+
+def _early_sql(sql: Any, on_sql: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[str]:
+    """Validated SQL from a partial answer, passed to on_sql when it also clears the cost guard."""
+    if not isinstance(sql, str):
+        return None
+    with tracing.span("validate", early=True):
+        try:
+            sql = validate_sql(sql, MAX_RESULT_ROWS, missing=db.missing_indexes())
+        except SQLValidationError:
+            # Reported when the whole answer is checked
+            return None
+    if on_sql is not None and _passes_cost_guard(sql):
+        on_sql({"sql": sql})
+    return sql
+
+
+async def _agenerate(backend, prompt: str) -> Optional[str]:
+    started = time.perf_counter()
+    cancelled = False
+    with tracing.span("llm", backend=backend.name) as s:
+        try:
+            txt = await backend.agenerate(prompt)
+        except asyncio.CancelledError:
+            # A hedged call that lost the race; not a stage error
+            s["cancelled"] = cancelled = True
+        else:
+            s["response_tokens"] = estimate_tokens(txt) if txt else 0
+    # A cancelled call took at least this long, which keeps the hedge deadline honest
+    hedging.latencies.observe(time.perf_counter() - started)
+    if cancelled:
+        raise asyncio.CancelledError
+    tracing.count("nlsql_response_tokens_total", s["response_tokens"])
+    return txt
+
+
+def _prompt_for(user_query: str) -> Tuple[str, Dict[str, Any]]:
+    with tracing.span("build_prompt") as s:
+        prompt, stats = build_prompt_with_stats(user_query)
+        s["prompt_tokens"] = stats["prompt_tokens"]
+    tracing.count("nlsql_prompt_tokens_total", stats["prompt_tokens"])
+    return prompt, stats
+
+
+def _from_response(txt: Optional[str], stats: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Parse and validate the model's answer."""
+    data, failure = _checked(txt)
+    if data is None:
+        _outcome(_FAILURE_OUTCOME[failure])
+        return None
+    data["prompt_stats"] = stats
+    return data
+
+
+# Why a model answer was not usable → question outcome
+_FAILURE_OUTCOME = {"malformed": "unanswerable", "unanswerable": "unanswerable", "rejected": "rejected"}
+
+
+def _checked(txt: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """(validated answer, None) or (None, "malformed" | "unanswerable" | "rejected")."""
+    if not txt:
+        return None, "malformed"
+
+    with tracing.span("parse"):
+        data = _json_from_text(txt)
+    if not data:
+        return None, "malformed"
+    if not isinstance(data.get("sql"), str):
+        # {"sql": null} is the model's own "cannot answer"
+        return None, "unanswerable" if data.get("sql") is None else "malformed"
+
+    with tracing.span("validate") as s:
+        try:
+            # Single statement, read-only, whitelisted tables, LIMIT added for safety
+            data["sql"] = validate_sql(data["sql"], MAX_RESULT_ROWS, missing=db.missing_indexes())
+        except SQLValidationError as e:
+            print(f"Rejected SQL: {e}")
+            s["rejected"] = str(e)
+            return None, "rejected"
+    return data, None
+
+
+def _candidate(txt: Optional[str], failures: List[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Hedged answer check: parse, validate and EXPLAIN. Returns (answer, whether it settles the question).
+
+    Malformed and rejected answers are worth another call; a deliberate
+    "cannot answer" is not.
+    """
+    data, failure = _checked(txt)
+    if data is not None and not _plannable(data["sql"]):
+        data, failure = None, "rejected"
+    if data is None:
+        failures.append(failure)
+        return None, failure == "unanswerable"
+    return data, True
+
+
+def _plannable(sql: str) -> bool:
+    """Cheap EXPLAIN check: the live database can plan the SQL (within the cost guard when it is on)."""
+    if db.data_version() is None:
+        return True
+    try:
+        if COST_GUARD:
+            return _passes_cost_guard(sql)
+        with tracing.span("explain"):
+            db.explain_query_plan(db.route_sql(sql))
+    except Exception as e:
+        print(f"Rejected SQL: {e}")
+        return False
+    return True
+
+
+def _hedged_result(data: Optional[Dict[str, Any]], stats: Dict[str, Any],
+                   failures: List[str]) -> Optional[Dict[str, Any]]:
+    if data is None:
+        _outcome(_FAILURE_OUTCOME[failures[-1]] if failures else "unanswerable")
         return None
+    data["prompt_stats"] = stats
+    return data
@@ -1,3 +1,6 @@
+import re
+from typing import Dict, Iterable, List
+
 SCHEMA_DDL = """
 -- DATABASE: rental_app
 
@@ -41,6 +44,18 @@ CREATE TABLE bookings (
   FOREIGN KEY (tenant_id) REFERENCES users(user_id)
 );
 
+-- Interval index over bookings (R*Tree): one row per booking.
+-- start_day/end_day = CAST(julianday(start_date/end_date) AS INTEGER);
+-- property_id_hi always equals property_id.
+CREATE VIRTUAL TABLE booking_intervals USING rtree_i32(
+  booking_id,
+  property_id,
+  property_id_hi,
+  start_day,
+  end_day,
+  +status
+);
+
 CREATE TABLE payments (
   payment_id INTEGER PRIMARY KEY,
   booking_id INTEGER,
@@ -64,6 +79,23 @@ CREATE TABLE reviews (
   FOREIGN KEY (tenant_id) REFERENCES users(user_id)
 );
 
+-- Full-text indexes (FTS5, porter stemming) over property text and review comments.
+-- rowid = properties.property_id / reviews.review_id. Search with MATCH, rank with bm25().
+CREATE VIRTUAL TABLE properties_fts USING fts5(
+  title,
+  description,
+  content='properties',
+  content_rowid='property_id',
+  tokenize='porter unicode61 remove_diacritics 2'
+);
+
+CREATE VIRTUAL TABLE reviews_fts USING fts5(
+  comment,
+  content='reviews',
+  content_rowid='review_id',
+  tokenize='porter unicode61 remove_diacritics 2'
+);
+
 CREATE TABLE property_photos (
   photo_id INTEGER PRIMARY KEY,
   property_id INTEGER,
@@ -129,7 +161,8 @@ FEWSHOTS = [
     "nl": "What’s the occupancy rate of properties in Bradford last quarter?",
     "sql": "-- Occupancy rate = total booked property-days / total available property-days in last quarter.\n"
            "-- Approximation using bookings.status in ('confirmed','completed').\n"
-           "WITH q AS (\n"
+           "-- booking_intervals turns the date overlap into an R*Tree range search.\n"
+           "WITH bounds AS (\n"
            "  SELECT\n"
            "    -- Compute last quarter start/end (approx via current date)\n"
            "    CASE\n"
@@ -144,35 +177,84 @@ FEWSHOTS = [
            "      WHEN CAST(strftime('%m','now') AS INT) IN (7,8,9) THEN strftime('%Y','now') || '-06-30'\n"
            "      ELSE strftime('%Y','now') || '-09-30'\n"
            "    END AS q_end\n"
+           "), q AS (\n"
+           "  SELECT CAST(julianday(q_start) AS INTEGER) AS s, CAST(julianday(q_end) AS INTEGER) AS e\n"
+           "  FROM bounds\n"
            "), props AS (\n"
            "  SELECT property_id\n"
            "  FROM properties\n"
            "  WHERE city = 'Bradford'\n"
-           "), days AS (\n"
-           "  SELECT p.property_id, CAST((julianday(q.q_end) - julianday(q.q_start) + 1) AS INT) AS total_days\n"
-           "  FROM props p CROSS JOIN q\n"
            "), booked AS (\n"
-           "  SELECT b.property_id,\n"
-           "         MAX(0, CAST((julianday(MIN(q.q_end, b.end_date)) - julianday(MAX(q.q_start, b.start_date)) + 1) AS INT)) AS overlap_days\n"
-           "  FROM bookings b CROSS JOIN q\n"
-           "  WHERE b.property_id IN (SELECT property_id FROM props)\n"
-           "    AND b.status IN ('confirmed','completed')\n"
-           "    AND b.end_date >= (SELECT q_start FROM q)\n"
-           "    AND b.start_date <= (SELECT q_end FROM q)\n"
-           "  GROUP BY b.property_id, b.booking_id\n"
-           "), agg AS (\n"
-           "  SELECT property_id, SUM(CASE WHEN overlap_days < 0 THEN 0 ELSE overlap_days END) AS booked_days\n"
-           "  FROM booked\n"
-           "  GROUP BY property_id\n"
+           "  SELECT SUM(MIN(bi.end_day, q.e) - MAX(bi.start_day, q.s) + 1) AS booked_days\n"
+           "  FROM q\n"
+           "  JOIN booking_intervals bi ON bi.start_day <= q.e AND bi.end_day >= q.s\n"
+           "  WHERE bi.property_id IN (SELECT property_id FROM props)\n"
+           "    AND bi.status IN ('confirmed','completed')\n"
            ")\n"
            "SELECT\n"
-           "  ROUND( (SUM(COALESCE(a.booked_days,0)) * 1.0) / (SUM(d.total_days) * 1.0), 4) AS occupancy_rate\n"
-           "FROM days d\n"
-           "LEFT JOIN agg a ON d.property_id = a.property_id"
+           "  ROUND(COALESCE((SELECT booked_days FROM booked), 0) * 1.0\n"
+           "        / ((SELECT COUNT(*) FROM props) * (SELECT e - s + 1 FROM q)), 4) AS occupancy_rate",
+    # Same answer from bookings alone, for databases without booking_intervals
+    "plain_sql": "-- Occupancy rate = total booked property-days / total available property-days in last quarter.\n"
+                 "-- Approximation using bookings.status in ('confirmed','completed').\n"
+                 "WITH q AS (\n"
+                 "  SELECT\n"
+                 "    -- Compute last quarter start/end (approx via current date)\n"
+                 "    CASE\n"
+                 "      WHEN CAST(strftime('%m','now') AS INT) IN (1,2,3) THEN date(strftime('%Y','now') || '-10-01','-1 year')\n"
+                 "      WHEN CAST(strftime('%m','now') AS INT) IN (4,5,6) THEN strftime('%Y','now') || '-01-01'\n"
+                 "      WHEN CAST(strftime('%m','now') AS INT) IN (7,8,9) THEN strftime('%Y','now') || '-04-01'\n"
+                 "      ELSE strftime('%Y','now') || '-07-01'\n"
+                 "    END AS q_start,\n"
+                 "    CASE\n"
+                 "      WHEN CAST(strftime('%m','now') AS INT) IN (1,2,3) THEN date(strftime('%Y','now') || '-12-31','-1 year')\n"
+                 "      WHEN CAST(strftime('%m','now') AS INT) IN (4,5,6) THEN strftime('%Y','now') || '-03-31'\n"
+                 "      WHEN CAST(strftime('%m','now') AS INT) IN (7,8,9) THEN strftime('%Y','now') || '-06-30'\n"
+                 "      ELSE strftime('%Y','now') || '-09-30'\n"
+                 "    END AS q_end\n"
+                 "), props AS (\n"
+                 "  SELECT property_id\n"
+                 "  FROM properties\n"
+                 "  WHERE city = 'Bradford'\n"
+                 "), days AS (\n"
+                 "  SELECT p.property_id, CAST((julianday(q.q_end) - julianday(q.q_start) + 1) AS INT) AS total_days\n"
+                 "  FROM props p CROSS JOIN q\n"
+                 "), booked AS (\n"
+                 "  SELECT b.property_id,\n"
+                 "         MAX(0, CAST((julianday(MIN(q.q_end, b.end_date)) - julianday(MAX(q.q_start, b.start_date)) + 1) AS INT)) AS overlap_days\n"
+                 "  FROM bookings b CROSS JOIN q\n"
+                 "  WHERE b.property_id IN (SELECT property_id FROM props)\n"
+                 "    AND b.status IN ('confirmed','completed')\n"
+                 "    AND b.end_date >= (SELECT q_start FROM q)\n"
+                 "    AND b.start_date <= (SELECT q_end FROM q)\n"
+                 "  GROUP BY b.property_id, b.booking_id\n"
+                 "), agg AS (\n"
+                 "  SELECT property_id, SUM(CASE WHEN overlap_days < 0 THEN 0 ELSE overlap_days END) AS booked_days\n"
+                 "  FROM booked\n"
+                 "  GROUP BY property_id\n"
+                 ")\n"
+                 "SELECT\n"
+                 "  ROUND( (SUM(COALESCE(a.booked_days,0)) * 1.0) / (SUM(d.total_days) * 1.0), 4) AS occupancy_rate\n"
+                 "FROM days d\n"
+                 "LEFT JOIN agg a ON d.property_id = a.property_id"
+  },
+  {
+    "nl": "Which reviews complain about noise?",
+    "sql": "SELECT r.review_id, r.property_id, r.rating, r.comment\n"
+           "FROM reviews_fts\n"
+           "JOIN reviews r ON r.review_id = reviews_fts.rowid\n"
+           "WHERE reviews_fts MATCH 'nois* OR loud*'\n"
+           "ORDER BY bm25(reviews_fts)\n"
+           "LIMIT 20",
+    # For databases without the FTS5 indexes
+    "plain_sql": "SELECT r.review_id, r.property_id, r.rating, r.comment\n"
+                 "FROM reviews r\n"
+                 "WHERE r.comment LIKE '%nois%' OR r.comment LIKE '%loud%'\n"
+                 "LIMIT 20"
   }
 ]
 
-INSTRUCTIONS = """You are an expert Text-to-SQL generator for the following SQLite schema.
+_INSTRUCTIONS_HEAD = """You are an expert Text-to-SQL generator for the following SQLite schema.
 - Output **ONLY** JSON as: {"sql": "...", "confidence": 0.0, "notes": "short reasoning"}
 - The SQL must be **SELECT-only** (no INSERT/UPDATE/DELETE/DDL).
 - Use only tables/columns that exist in the provided schema.
@@ -180,7 +262,23 @@ INSTRUCTIONS = """You are an expert Text-to-SQL generator for the following SQLi
 - When ambiguous, choose a reasonable, simple interpretation.
 - For revenue, use payments where status = 'successful'.
 - For occupancy, consider bookings with status IN ('confirmed','completed').
-- If the question is truly unanswerable from the schema, return {"sql": null, "confidence": 0.0, "notes": "unanswerable"}.
+"""
+
+# Rules for the optional index tables, dropped from the prompt when the database lacks them
+_INDEX_RULES = [
+    ({"booking_intervals"}, """- For bookings overlapping a date range (occupancy, "booked during ..."), use booking_intervals:
+  bi.start_day <= CAST(julianday(:end) AS INTEGER) AND bi.end_day >= CAST(julianday(:start) AS INTEGER),
+  narrowed with bi.property_id IN (SELECT property_id FROM properties WHERE ...);
+  days booked inside the range = MIN(bi.end_day, end) - MAX(bi.start_day, start) + 1.
+"""),
+    ({"properties_fts", "reviews_fts"}, """- For words in property titles/descriptions or review comments ("mentioning a balcony", "complaining
+  about noise"), never use LIKE '%...%'. Use the FTS5 tables: JOIN properties_fts ON
+  properties_fts.rowid = p.property_id WHERE properties_fts MATCH 'balcon*' ORDER BY bm25(properties_fts)
+  (lower bm25 = more relevant). Use prefix* for word variants and OR for synonyms ('nois* OR loud').
+"""),
+]
+
+_INSTRUCTIONS_TAIL = """- If the question is truly unanswerable from the schema, return {"sql": null, "confidence": 0.0, "notes": "unanswerable"}.
 
 Map domain language to schema:
 - "2BHK" → bedrooms = 2; "3BHK" → bedrooms = 3, etc.
@@ -191,3 +289,36 @@ Map domain language to schema:
 
 Return small, efficient queries and include a LIMIT if result could be large.
 """
+
+
+# Index tables rendered as "-- comments\nCREATE VIRTUAL TABLE name ...(\n...\n);"
+_VIRTUAL_BLOCK = re.compile(r"(?:--[^\n]*\n)*CREATE VIRTUAL TABLE (\w+) .*?\n\);\n\n", re.S)
+
+
+def schema_ddl(missing: Iterable[str] = ()) -> str:
+    """SCHEMA_DDL without the index tables in `missing`."""
+    missing = set(missing)
+    return _VIRTUAL_BLOCK.sub(lambda m: "" if m.group(1) in missing else m.group(0), SCHEMA_DDL)
+
+
+def instructions(missing: Iterable[str] = ()) -> str:
+    """INSTRUCTIONS without the rules for the index tables in `missing`."""
+    missing = set(missing)
+    return _INSTRUCTIONS_HEAD + "".join(rule for tables, rule in _INDEX_RULES if not tables & missing) \
+        + _INSTRUCTIONS_TAIL
+
+
+def fewshots(missing: Iterable[str] = ()) -> List[Dict[str, str]]:
+    """FEWSHOTS that avoid the index tables in `missing`: their plain_sql when they have one, else dropped."""
+    missing = set(missing)
+    out = []
+    for ex in FEWSHOTS:
+        if any(re.search(rf"\b{t}\b", ex["sql"]) for t in missing):
+            if "plain_sql" not in ex:
+                continue
+            ex = {"nl": ex["nl"], "sql": ex["plain_sql"]}
+        out.append(ex)
+    return out
+
+
+INSTRUCTIONS = instructions()
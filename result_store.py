@@ -0,0 +1,130 @@
+# result_store.py
+"""Per-session store of recent answers and the result pages fetched for them.
+
+The app keeps one ResultStore in st.session_state, so widget reruns (toggles,
+paging back, switching between recent questions) render from memory instead
+of calling the model and the database again. It holds the last
+`max_entries` question/SQL pairs and the pages fetched for them. The pages
+are bounded by `max_bytes` of DataFrame memory and evicted least recently
+used. A page is tagged with the database version it was read at and is
+dropped once the data changes. A store belongs to one session and is not
+thread-safe.
+"""
+import itertools
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RESULT_STORE_ENTRIES = int(os.getenv("RESULT_STORE_ENTRIES", "5"))
+RESULT_STORE_MAX_BYTES = int(os.getenv("RESULT_STORE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# (page number, sort column or None, descending)
+PageKey = Tuple[int, Optional[str], bool]
+
+
+@dataclass
+class StoredResult:
+    entry_id: int
+    question: str
+    sql: str
+    confidence: float = 0.0
+    notes: str = ""
+    # Bound to the SQL's :name placeholders (translations from a learned template)
+    params: Optional[Dict[str, Any]] = None
+    created: float = field(default_factory=time.time)
+    # View state, so switching back to an entry restores where the user was
+    page: int = 0
+    sort_by: Optional[str] = None
+    descending: bool = False
+    columns: List[str] = field(default_factory=list)
+
+    def view_key(self) -> PageKey:
+        return (self.page, self.sort_by, self.descending)
+
+
+class ResultStore:
+    def __init__(self, max_entries: int = RESULT_STORE_ENTRIES, max_bytes: int = RESULT_STORE_MAX_BYTES):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, StoredResult]" = OrderedDict()
+        self._pages: "OrderedDict[Tuple[int, PageKey], tuple]" = OrderedDict()  # → (page, size, version)
+        self._bytes = 0
+        self._ids = itertools.count(1)
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def add(self, question: str, result: Dict[str, Any]) -> StoredResult:
+        """Remember an answer as the newest entry (an entry with the same SQL is reused)."""
+        for entry in self._entries.values():
+            if entry.sql == result["sql"] and entry.params == result.get("params"):
+                entry.question = question
+                entry.confidence = result.get("confidence", 0.0)
+                entry.notes = result.get("notes", "")
+                entry.page, entry.sort_by, entry.descending = 0, None, False
+                self._entries.move_to_end(entry.entry_id)
+                return entry
+        entry = StoredResult(next(self._ids), question, result["sql"],
+                             result.get("confidence", 0.0), result.get("notes", ""), result.get("params"))
+        self._entries[entry.entry_id] = entry
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._drop_pages(oldest)
+        return entry
+
+    def get(self, entry_id: Optional[int]) -> Optional[StoredResult]:
+        return self._entries.get(entry_id)
+
+    def entries(self) -> List[StoredResult]:
+        """Newest first."""
+        return list(reversed(self._entries.values()))
+
+    def page(self, entry: StoredResult, version: Any):
+        """The cached page for the entry's current view, or None."""
+        key = (entry.entry_id, entry.view_key())
+        item = self._pages.get(key)
+        if item is not None and item[2] != version:
+            self._remove(key)
+            item = None
+        if item is None:
+            self._stats["misses"] += 1
+            return None
+        self._pages.move_to_end(key)
+        self._stats["hits"] += 1
+        return item[0]
+
+    def put_page(self, entry: StoredResult, version: Any, page) -> None:
+        if entry.entry_id not in self._entries:
+            return
+        if not entry.columns:
+            entry.columns = [str(c) for c in page.df.columns]
+        size = int(page.df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        key = (entry.entry_id, entry.view_key())
+        if key in self._pages:
+            self._remove(key)
+        self._pages[key] = (page, size, version)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            self._remove(next(iter(self._pages)))
+            self._stats["evictions"] += 1
+
+    def _remove(self, key: Tuple[int, PageKey]) -> None:
+        _, size, _ = self._pages.pop(key)
+        self._bytes -= size
+
+    def _drop_pages(self, entry_id: int) -> None:
+        for key in [k for k in self._pages if k[0] == entry_id]:
+            self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        s = dict(self._stats)
+        s["entries"] = len(self._entries)
+        s["pages"] = len(self._pages)
+        s["bytes"] = self._bytes
+        return s
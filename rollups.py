@@ -0,0 +1,550 @@
+# rollups.py
+"""Pre-aggregated rollup tables, kept current by triggers, and query routing to them.
+
+A Rollup is an aggregate of one fact table (payments, reviews) grouped by a
+key reached through a join path, optionally per month:
+
+    rollup_landlord_revenue = successful payments → bookings → properties.landlord_id, per month
+
+Row-level triggers on the fact table apply each inserted/deleted/updated
+row as a delta. Changes to the join path (a booking moved to another
+property, a property's landlord changed) are rare, and they recompute the
+affected keys from the base tables.
+
+rewrite() maps a single-level aggregate SELECT that only needs what a
+rollup stores (its filters, SUM/AVG/COUNT of the measure, the key, the
+month, columns of the table the key points at) onto the rollup table.
+Anything else is left alone and runs against the base tables.
+
+    python rollups.py --install        # create, fill and start maintaining the rollups
+    python rollups.py --check          # compare every rollup with a fresh aggregate
+    python rollups.py --drop
+"""
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Tuple
+
+from sql_guard import first_statement, table_aliases, tokenize
+
+
+@dataclass(frozen=True)
+class Rollup:
+    name: str
+    fact: str
+    fact_pk: str
+    measure: str
+    key: Tuple[str, str]  # (table, column) the rows are grouped by
+    # Joins from the fact table to the key's table: (table, column, next table, next column)
+    path: Tuple[Tuple[str, str, str, str], ...] = ()
+    dimension: Optional[Tuple[str, str]] = None  # (table, column) the key refers to
+    month: Optional[str] = None  # fact date column, bucketed by strftime('%Y-%m')
+    where: Tuple[Tuple[str, str], ...] = ()  # fact column = SQL literal
+
+    @property
+    def tables(self) -> List[str]:
+        """Fact table, then each table along the join path."""
+        return [self.fact] + [edge[2] for edge in self.path]
+
+    @property
+    def group_columns(self) -> List[str]:
+        return [self.key[1]] + (["month"] if self.month else [])
+
+    @property
+    def columns(self) -> List[str]:
+        return self.group_columns + ["n", f"{self.measure}_sum", f"{self.measure}_n"]
+
+
+ROLLUP_LIST = [
+    Rollup("rollup_tenant_revenue", "payments", "payment_id", "amount", key=("payments", "tenant_id"),
+           dimension=("users", "user_id"), month="payment_date", where=(("status", "'successful'"),)),
+    Rollup("rollup_landlord_revenue", "payments", "payment_id", "amount", key=("properties", "landlord_id"),
+           path=(("payments", "booking_id", "bookings", "booking_id"),
+                 ("bookings", "property_id", "properties", "property_id")),
+           dimension=("users", "user_id"), month="payment_date", where=(("status", "'successful'"),)),
+    Rollup("rollup_property_type_ratings", "reviews", "review_id", "rating", key=("properties", "property_type"),
+           path=(("reviews", "property_id", "properties", "property_id"),)),
+]
+ROLLUPS: Dict[str, Rollup] = {r.name: r for r in ROLLUP_LIST}
+
+
+# --- maintenance --------------------------------------------------------------
+
+def _filter(r: Rollup, row: str) -> str:
+    return " AND ".join(f"{row}.{col} = {literal}" for col, literal in r.where) or "1"
+
+
+def _joins(edges) -> str:
+    return "".join(f" JOIN {nxt} ON {tbl}.{col} = {nxt}.{nxt_col}" for tbl, col, nxt, nxt_col in edges)
+
+
+def aggregate_sql(r: Rollup, extra_where: str = "") -> str:
+    """The rollup's contents computed from the base tables."""
+    key_table, key_col = r.key
+    month = f", strftime('%Y-%m', {r.fact}.{r.month})" if r.month else ""
+    groups = "1, 2" if r.month else "1"
+    m = f"{r.fact}.{r.measure}"
+    return (f"SELECT {key_table}.{key_col}{month}, COUNT(*), COALESCE(SUM({m}), 0), COUNT({m}) "
+            f"FROM {r.fact}{_joins(r.path)} WHERE {_filter(r, r.fact)}{extra_where} GROUP BY {groups}")
+
+
+def _rest_of_path(r: Rollup, table: str):
+    return r.path[r.tables.index(table):]
+
+
+def _key_of(r: Rollup, table: str, row: str) -> str:
+    """Key value for a row of `table` (NEW/OLD), following the rest of the join path."""
+    rest = _rest_of_path(r, table)
+    if not rest:
+        return f"{row}.{r.key[1]}"
+    _, col, nxt, nxt_col = rest[0]
+    return f"(SELECT {r.key[0]}.{r.key[1]} FROM {nxt}{_joins(rest[1:])} WHERE {nxt}.{nxt_col} = {row}.{col})"
+
+
+def _reachable(r: Rollup, table: str, row: str) -> str:
+    """Whether the row joins all the way to the key's table (inner-join semantics)."""
+    rest = _rest_of_path(r, table)
+    if not rest:
+        return "1"
+    _, col, nxt, nxt_col = rest[0]
+    return f"EXISTS (SELECT 1 FROM {nxt}{_joins(rest[1:])} WHERE {nxt}.{nxt_col} = {row}.{col})"
+
+
+def _delta(r: Rollup, row: str, sign: int) -> List[str]:
+    """Statements adding (+1) or removing (-1) one fact row's contribution."""
+    key = _key_of(r, r.fact, row)
+    month = f"strftime('%Y-%m', {row}.{r.month})"
+    # Unary + drops the key's affinity, so the comparison can use ix_{name} on the untyped column
+    match = f"{r.key[1]} IS +{key}" + (f" AND month IS {month}" if r.month else "")
+    applies = f"{_filter(r, row)} AND {_reachable(r, r.fact, row)}"
+    op = "+" if sign > 0 else "-"
+    m = f"{row}.{r.measure}"
+    stmts = []
+    if sign > 0:
+        values = f"{key}, {month}" if r.month else key
+        stmts.append(f"INSERT INTO {r.name} ({', '.join(r.group_columns)}) SELECT {values} "
+                     f"WHERE {applies} AND NOT EXISTS (SELECT 1 FROM {r.name} WHERE {match})")
+    stmts.append(f"UPDATE {r.name} SET n = n {op} 1, {r.measure}_sum = {r.measure}_sum {op} COALESCE({m}, 0), "
+                 f"{r.measure}_n = {r.measure}_n {op} ({m} IS NOT NULL) WHERE {match} AND {applies}")
+    if sign < 0:
+        stmts.append(f"DELETE FROM {r.name} WHERE n = 0 AND {match}")
+    return stmts
+
+
+def _recompute(r: Rollup, key: str) -> List[str]:
+    """Statements rebuilding every row of one key from the base tables."""
+    return [f"DELETE FROM {r.name} WHERE {r.key[1]} IS +{key}",
+            f"INSERT INTO {r.name} ({', '.join(r.columns)}) "
+            + aggregate_sql(r, f" AND {r.key[0]}.{r.key[1]} IS {key}")]
+
+
+def _trigger(name: str, event: str, table: str, body: List[str], when: str = "") -> str:
+    when = f" WHEN {when}" if when else ""
+    return f"CREATE TRIGGER {name} AFTER {event} ON {table}{when} BEGIN\n  " + ";\n  ".join(body) + ";\nEND"
+
+
+def trigger_ddl(r: Rollup) -> Dict[str, str]:
+    """Trigger name → CREATE TRIGGER statement for everything the rollup depends on."""
+    first_col = r.path[0][1] if r.path else r.key[1]
+    watched = sorted({col for col, _ in r.where} | {r.measure, first_col} | ({r.month} if r.month else set()))
+    triggers = {
+        f"trg_{r.name}_{r.fact}_ins": _trigger(f"trg_{r.name}_{r.fact}_ins", "INSERT", r.fact, _delta(r, "NEW", 1)),
+        f"trg_{r.name}_{r.fact}_del": _trigger(f"trg_{r.name}_{r.fact}_del", "DELETE", r.fact, _delta(r, "OLD", -1)),
+        f"trg_{r.name}_{r.fact}_upd": _trigger(f"trg_{r.name}_{r.fact}_upd", f"UPDATE OF {', '.join(watched)}",
+                                               r.fact, _delta(r, "OLD", -1) + _delta(r, "NEW", 1)),
+    }
+    for i, (prev, prev_col, table, col) in enumerate(r.path):
+        # Only rows that fact rows actually reach through this table matter
+        referenced = f"EXISTS (SELECT 1 FROM {prev} WHERE {prev}.{prev_col} = {{row}}.{col})"
+        out_col = r.path[i + 1][1] if i + 1 < len(r.path) else r.key[1]
+        cols = sorted({col, out_col})
+        changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in cols)
+        for event, body, when in (
+            ("INSERT", _recompute(r, _key_of(r, table, "NEW")), referenced.format(row="NEW")),
+            ("DELETE", _recompute(r, _key_of(r, table, "OLD")), referenced.format(row="OLD")),
+            (f"UPDATE OF {', '.join(cols)}",
+             _recompute(r, _key_of(r, table, "OLD")) + _recompute(r, _key_of(r, table, "NEW")), changed),
+        ):
+            name = f"trg_{r.name}_{table}_{event.split()[0].lower()[:3]}"
+            triggers[name] = _trigger(name, event, table, body, when)
+    return triggers
+
+
+def table_ddl(r: Rollup) -> List[str]:
+    # Untyped group columns keep the base values as they are; NUMERIC keeps integer sums integral
+    group = ", ".join(f"{c} TEXT" if c == "month" else c for c in r.group_columns)
+    return [
+        f"CREATE TABLE IF NOT EXISTS {r.name} ({group}, n INTEGER NOT NULL DEFAULT 0, "
+        f"{r.measure}_sum NUMERIC NOT NULL DEFAULT 0, {r.measure}_n INTEGER NOT NULL DEFAULT 0)",
+        f"CREATE INDEX IF NOT EXISTS ix_{r.name} ON {r.name} ({', '.join(r.group_columns)})",
+    ]
+
+
+def refresh(conn: sqlite3.Connection, r: Rollup) -> None:
+    conn.execute(f"DELETE FROM {r.name}")
+    conn.execute(f"INSERT INTO {r.name} ({', '.join(r.columns)}) {aggregate_sql(r)}")
+
+
+def install(conn: sqlite3.Connection, names: Optional[List[str]] = None) -> List[str]:
+    """Create, fill and start maintaining the rollups (all by default) in one transaction."""
+    names = list(ROLLUPS) if names is None else names
+    with conn:
+        for name in names:
+            r = ROLLUPS[name]
+            for stmt in table_ddl(r):
+                conn.execute(stmt)
+            for trigger, ddl in trigger_ddl(r).items():
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                conn.execute(ddl)
+            refresh(conn, r)
+    return names
+
+
+def drop_triggers(conn: sqlite3.Connection) -> List[str]:
+    """Stop maintaining every installed rollup (e.g. before a bulk load); returns their names."""
+    names = installed(conn)
+    with conn:
+        for name in names:
+            for trigger in trigger_ddl(ROLLUPS[name]):
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    return names
+
+
+def drop(conn: sqlite3.Connection) -> None:
+    drop_triggers(conn)
+    with conn:
+        for name in ROLLUPS:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+def installed(conn) -> List[str]:
+    """Rollups whose table and triggers all exist, i.e. that are safe to route to."""
+    present = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')").fetchall()}
+    return [name for name, r in ROLLUPS.items() if name in present and set(trigger_ddl(r)) <= present]
+
+
+def check(conn: sqlite3.Connection, r: Rollup) -> int:
+    """Rows in which the rollup and a fresh aggregate disagree."""
+    cols = ", ".join(r.columns)
+    # Deltas and a fresh SUM can differ in the last float bits
+    rounded = ", ".join(f"ROUND({c}, 6)" if c.endswith("_sum") else c for c in r.columns)
+    stored = f"SELECT {rounded} FROM {r.name}"
+    mismatched = conn.execute(
+        f"WITH fresh ({cols}) AS ({aggregate_sql(r)}) "
+        f"SELECT COUNT(*) FROM (SELECT * FROM (SELECT {rounded} FROM fresh EXCEPT {stored}) "
+        f"UNION ALL SELECT * FROM ({stored} EXCEPT SELECT {rounded} FROM fresh))").fetchone()[0]
+    return mismatched
+
+
+# --- routing ------------------------------------------------------------------
+
+_AGGREGATES = {"sum", "avg", "count"}
+_UNSUPPORTED = {"select", "union", "intersect", "except", "with", "over", "window", "distinct", "or",
+                "between", "left", "right", "full", "cross", "natural", "using", "outer"}
+_CLAUSES = ("select", "from", "where", "group", "having", "order", "limit")
+_column_names: Optional[Dict[str, set]] = None
+
+
+def _schema_columns() -> Dict[str, set]:
+    global _column_names
+    if _column_names is None:
+        from models import Base
+
+        _column_names = {t.name: {c.name for c in t.columns} for t in Base.metadata.sorted_tables}
+    return _column_names
+
+
+# Items are ("tok", kind, text) or ("col", alias, column)
+Item = Tuple[str, str, str]
+
+
+def _itemize(tokens, aliases: Dict[str, str]) -> Optional[List[Item]]:
+    """Tokens with every column reference resolved to ("col", alias, column)."""
+    schema = _schema_columns()
+    in_query = {alias: table for alias, table in aliases.items() if table in schema}
+    items: List[Item] = []
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        low = text.lower()
+        nxt = tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        if kind in ("word", "ident") and nxt == "." and i + 2 < len(tokens):
+            alias = text.strip('"`[]').lower()
+            items.append(("col", alias, tokens[i + 2][1].strip('"`[]').lower()))
+            i += 3
+            continue
+        prev = items[-1] if items else None
+        defines_alias = prev is not None and (
+            (prev[0] == "tok" and prev[2].lower() == "as")
+            or prev[0] == "col" or (prev[0] == "tok" and prev[2] == ")"))
+        if kind == "word" and nxt != "(" and not defines_alias and low not in in_query:
+            owners = [alias for alias, table in in_query.items() if low in schema[table]]
+            tables = {in_query[a] for a in owners}
+            if len(tables) > 1:
+                return None
+            if owners:
+                # Prefer the explicit alias over the bare table name
+                alias = next((a for a in owners if a != in_query[a]), owners[0])
+                items.append(("col", alias, low))
+                i += 1
+                continue
+        items.append(("tok", kind, text))
+        i += 1
+    return items
+
+
+def _split(items: List[Item], sep: str) -> List[List[Item]]:
+    """Split on a depth-0 token (',' or a keyword such as 'and')."""
+    parts: List[List[Item]] = [[]]
+    depth = 0
+    for item in items:
+        text = item[2] if item[0] == "tok" else ""
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        if depth == 0 and item[0] == "tok" and text.lower() == sep:
+            parts.append([])
+        else:
+            parts[-1].append(item)
+    return parts
+
+
+def _clauses(items: List[Item]) -> Optional[Dict[str, List[Item]]]:
+    clauses: Dict[str, List[Item]] = {}
+    current = None
+    depth = 0
+    for i, item in enumerate(items):
+        text = item[2].lower() if item[0] == "tok" else ""
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        if text in _UNSUPPORTED and not (text == "select" and i == 0):
+            return None
+        if depth == 0 and text in _CLAUSES:
+            current = text
+            if current in clauses:
+                return None
+            clauses[current] = []
+            continue
+        if depth == 0 and text == "by" and current in ("group", "order") and not clauses[current]:
+            continue
+        if current is None:
+            return None
+        clauses[current].append(item)
+    return clauses if "select" in clauses and "from" in clauses else None
+
+
+def _parse_from(items: List[Item]):
+    """[(table, alias)], [(col ref, col ref)] for `t a JOIN t2 b ON a.x = b.y ...`, else None."""
+    tables, joins = [], []
+    i = 0
+
+    def table_at(j):
+        if j >= len(items) or items[j][0] != "tok" or items[j][1] not in ("word", "ident"):
+            return None
+        name = items[j][2].strip('"`[]').lower()
+        j += 1
+        if j < len(items) and items[j][0] == "tok" and items[j][2].lower() == "as":
+            j += 1
+        alias = name
+        if j < len(items) and items[j][0] == "tok" and items[j][1] in ("word", "ident") \
+                and items[j][2].lower() not in ("join", "inner", "on"):
+            alias = items[j][2].strip('"`[]').lower()
+            j += 1
+        return (name, alias), j
+
+    first = table_at(0)
+    if first is None:
+        return None
+    tables.append(first[0])
+    i = first[1]
+    while i < len(items):
+        if items[i][0] == "tok" and items[i][2].lower() == "inner":
+            i += 1
+        if i >= len(items) or items[i][0] != "tok" or items[i][2].lower() != "join":
+            return None
+        nxt = table_at(i + 1)
+        if nxt is None:
+            return None
+        tables.append(nxt[0])
+        i = nxt[1]
+        cond = items[i:i + 4]
+        if len(cond) != 4 or cond[0][2].lower() != "on" or cond[1][0] != "col" or cond[2][2] != "=" \
+                or cond[3][0] != "col":
+            return None
+        joins.append((cond[1][1:], cond[3][1:]))
+        i += 4
+    return tables, joins
+
+
+class _Rewriter:
+    """Maps one parsed query onto one rollup, or gives up (None)."""
+
+    def __init__(self, r: Rollup, tables: List[Tuple[str, str]]):
+        self.r = r
+        self.alias = {table: alias for table, alias in tables}
+        self.fact_side = {self.alias[t] for t in r.tables}
+        self.dim_alias = self.alias.get(r.dimension[0]) if r.dimension else None
+        self.key_refs = {(self.alias[r.key[0]], r.key[1])}
+        self.aggregates = 0
+
+    def sub(self, items: List[Item]) -> Optional[List[Item]]:
+        r, fact = self.r, self.alias[self.r.fact]
+        out: List[Item] = []
+        i = 0
+        while i < len(items):
+            item = items[i]
+            low = item[2].lower() if item[0] == "tok" else ""
+            window = items[i:i + 4]
+            if low in _AGGREGATES and len(window) == 4 and window[1][2] == "(" and window[3][2] == ")":
+                arg = window[2]
+                if arg[0] == "tok" and arg[2] == "*" and low == "count":
+                    expr = "COALESCE(SUM(_r.n), 0)"
+                elif arg[0] == "col" and arg[1] == fact and arg[2] == r.fact_pk and low == "count":
+                    expr = "COALESCE(SUM(_r.n), 0)"
+                elif arg[0] == "col" and arg[1] == fact and arg[2] == r.measure:
+                    expr = {"sum": f"SUM(_r.{r.measure}_sum)",
+                            "count": f"COALESCE(SUM(_r.{r.measure}_n), 0)",
+                            "avg": f"(SUM(_r.{r.measure}_sum) * 1.0 / SUM(_r.{r.measure}_n))"}[low]
+                else:
+                    return None
+                out.append(("tok", "sql", expr))
+                self.aggregates += 1
+                i += 4
+                continue
+            window = items[i:i + 6]
+            if r.month and low == "strftime" and len(window) == 6 and window[1][2] == "(" \
+                    and window[2][2] in ("'%Y'", "'%Y-%m'") and window[3][2] == "," \
+                    and window[4][0] == "col" and window[4][1:] == (fact, r.month) and window[5][2] == ")":
+                out.append(("tok", "sql", "substr(_r.month, 1, 4)" if window[2][2] == "'%Y'" else "_r.month"))
+                i += 6
+                continue
+            if item[0] == "col":
+                if item[1:] in self.key_refs:
+                    item = ("tok", "sql", f"_r.{r.key[1]}")
+                elif item[1] in self.fact_side:
+                    return None
+            out.append(item)
+            i += 1
+        return out
+
+    def rewrite(self, clauses: Dict[str, List[Item]], joins) -> Optional[str]:
+        r = self.r
+        expected = {frozenset({(self.alias[t], c), (self.alias[n], nc)}) for t, c, n, nc in r.path}
+        if self.dim_alias is not None:
+            expected.add(frozenset({(self.alias[r.key[0]], r.key[1]), (self.dim_alias, r.dimension[1])}))
+        if {frozenset(j) for j in joins} != expected or len(joins) != len(expected):
+            return None
+
+        filters = {((self.alias[r.fact], col), literal): col for col, literal in r.where}
+        kept_where, satisfied = [], set()
+        for pred in _split(clauses["where"], "and") if "where" in clauses else []:
+            if len(pred) == 3 and pred[1][2] == "=":
+                col, literal = (pred[0], pred[2]) if pred[0][0] == "col" else (pred[2], pred[0])
+                if (col[1:], literal[2]) in filters:
+                    satisfied.add(filters[(col[1:], literal[2])])
+                    continue
+            pred = self.sub(pred)
+            if pred is None:
+                return None
+            kept_where.append(pred)
+        if satisfied != {col for col, _ in r.where}:
+            return None
+
+        parts = {}
+        for clause in ("select", "group", "having", "order"):
+            if clause in clauses:
+                parts[clause] = self.sub(clauses[clause])
+                if parts[clause] is None:
+                    return None
+        if not self.aggregates:
+            return None
+
+        source = f"{r.name} AS _r"
+        if self.dim_alias is not None:
+            dim_table, dim_col = r.dimension
+            alias = "" if self.dim_alias == dim_table else f" AS {self.dim_alias}"
+            source += f" JOIN {dim_table}{alias} ON {self.dim_alias}.{dim_col} = _r.{r.key[1]}"
+        sql = f"SELECT {_render(parts['select'])} FROM {source}"
+        if kept_where:
+            sql += " WHERE " + " AND ".join(_render(p) for p in kept_where)
+        for clause, keyword in (("group", "GROUP BY"), ("having", "HAVING"), ("order", "ORDER BY")):
+            if clause in parts:
+                sql += f" {keyword} {_render(parts[clause])}"
+        if "limit" in clauses:
+            sql += f" LIMIT {_render(clauses['limit'])}"
+        return sql
+
+
+def _render(items: List[Item]) -> str:
+    out = ""
+    for item in items:
+        text = f"{item[1]}.{item[2]}" if item[0] == "col" else item[2]
+        if out and not (text in (",", ")") or out.endswith("(") or (text == "(" and out[-1].isalnum())):
+            out += " "
+        out += text
+    return out
+
+
+def rewrite(sql: str, available: Optional[List[str]] = None) -> Optional[str]:
+    """The query over a rollup table, or None when no (available) rollup can answer it."""
+    tokens = tokenize(first_statement(sql).strip())
+    words = {text.lower() for kind, text in tokens if kind == "word"}
+    candidates = [r for name, r in ROLLUPS.items() if (available is None or name in available)
+                  and r.fact in words and words & _AGGREGATES]
+    if not candidates:
+        return None
+    items = _itemize(tokens, table_aliases(tokens))
+    clauses = _clauses(items) if items else None
+    parsed = _parse_from(clauses["from"]) if clauses else None
+    if parsed is None:
+        return None
+    tables, joins = parsed
+    names = [t for t, _ in tables]
+    if len(set(names)) != len(names):
+        return None
+    for r in candidates:
+        allowed = set(r.tables) | ({r.dimension[0]} if r.dimension else set())
+        if not set(r.tables) <= set(names) or not set(names) <= allowed:
+            continue
+        routed = _Rewriter(r, tables).rewrite(clauses, joins)
+        if routed is not None:
+            return routed
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain rollup tables for common aggregate queries.")
+    parser.add_argument("--db", default=None, help="SQLite file (default: DATABASE_URL)")
+    parser.add_argument("--install", action="store_true", help="Create/refresh the rollups and their triggers")
+    parser.add_argument("--drop", action="store_true", help="Remove the rollups and their triggers")
+    parser.add_argument("--check", action="store_true", help="Compare each rollup with the base tables")
+    args = parser.parse_args()
+
+    if args.db is None:
+        from db import _sqlite_path
+
+        args.db = _sqlite_path()
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.drop:
+            drop(conn)
+            print(f"Dropped rollups from {args.db}")
+        if args.install:
+            started = time.perf_counter()
+            install(conn)
+            print(f"Installed {len(ROLLUPS)} rollup(s) on {args.db} in {time.perf_counter() - started:.1f}s")
+        for name in installed(conn):
+            rows = conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            status = f", {check(conn, ROLLUPS[name])} mismatched" if args.check else ""
+            print(f"  {name}: {rows} rows{status}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
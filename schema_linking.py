@@ -0,0 +1,185 @@
+# schema_linking.py
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import Enum
+
+from models import Base
+from prompts import SCHEMA_DDL, schema_ddl
+
+# Domain vocabulary from INSTRUCTIONS and the app's usual questions → tables.
+# Column names and enum values from models.py are added automatically.
+SYNONYMS: Dict[str, List[str]] = {
+    "users": ["user", "tenant", "landlord", "owner", "admin", "people", "person", "customer",
+              "renter", "name", "email", "phone", "role"],
+    "properties": ["property", "listing", "home", "flat", "bhk", "bedroom", "bathroom", "rent",
+                   "price", "city", "state", "country", "address", "type", "available", "landlord",
+                   "occupancy"],
+    "bookings": ["booking", "book", "booked", "reservation", "reserve", "stay", "occupancy",
+                 "occupied", "tenancy", "lease", "quarter"],
+    "payments": ["payment", "paid", "pay", "revenue", "income", "earn", "earned", "earning",
+                 "amount", "spend", "spent", "money", "refund", "method", "card", "upi", "cash"],
+    "reviews": ["review", "rating", "rated", "comment", "feedback", "star"],
+    "property_photos": ["photo", "picture", "image", "pic"],
+    "favorites": ["favorite", "favourite", "saved", "wishlist", "liked", "like", "shortlist"],
+    "booking_intervals": ["occupancy", "occupied", "vacant", "vacancy", "overlap", "overlapping", "booked",
+                          "during", "quarter"],
+    "properties_fts": ["mention", "mentioning", "describe", "described", "description", "title", "feature",
+                       "keyword", "word", "phrase", "contain", "containing", "text", "search"],
+    "reviews_fts": ["comment", "complain", "complaining", "complaint", "mention", "mentioning", "say", "said",
+                    "saying", "keyword", "word", "phrase", "text", "search"],
+}
+
+# Column-name fragments too generic to say anything about the table
+_GENERIC_PARTS = {"id", "at", "first", "last", "start", "end", "created", "added", "listed", "uploaded"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_BHK = re.compile(r"\d+\s*bhk")
+# Leading comment lines, table name, "USING module" for virtual tables, column block
+_TABLE_BLOCK = re.compile(r"((?:--[^\n]*\n)*)CREATE (?:VIRTUAL )?TABLE (\w+) (USING \w+)?\((.*?)\n\);", re.S)
+_SQL_TABLE_REF = re.compile(r"(?:from|join)\s+([a-zA-Z_][a-zA-Z0-9_]*)", re.I)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for prompt accounting."""
+    return max(1, len(text) // 4)
+
+
+def stem(word: str) -> str:
+    """Crude plural folding: properties→property, houses→house, addresses→address."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("sses"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _build_index() -> Tuple[Dict[str, Set[str]], Dict[str, Set[str]], Dict[str, Set[str]]]:
+    """keyword → tables, table → FK neighbours, table → key columns."""
+    keywords: Dict[str, Set[str]] = {}
+
+    def add(word: str, table: str) -> None:
+        for w in _WORD.findall(word.lower()):
+            keywords.setdefault(stem(w), set()).add(table)
+
+    neighbours: Dict[str, Set[str]] = {}
+    key_columns: Dict[str, Set[str]] = {}
+    for table in Base.metadata.sorted_tables:
+        name = table.name
+        if "_" not in name:
+            add(name, name)
+        neighbours.setdefault(name, set())
+        key_columns.setdefault(name, set())
+        for col in table.columns:
+            if col.primary_key or col.foreign_keys:
+                # Key columns name the table they point at, not this one
+                key_columns[name].add(col.name)
+            else:
+                for part in col.name.split("_"):
+                    if part not in _GENERIC_PARTS:
+                        add(part, name)
+            if isinstance(col.type, Enum):
+                for value in col.type.enums:
+                    add(value, name)
+            for fk in col.foreign_keys:
+                other = fk.column.table.name
+                neighbours[name].add(other)
+                neighbours.setdefault(other, set()).add(name)
+    for table, words in SYNONYMS.items():
+        for word in words:
+            add(word, table)
+    return keywords, neighbours, key_columns
+
+
+KEYWORDS, NEIGHBOURS, KEY_COLUMNS = _build_index()
+DDL_BLOCKS: Dict[str, str] = {m.group(2): m.group(4) for m in _TABLE_BLOCK.finditer(SCHEMA_DDL)}
+# Comments and CREATE line per table, e.g. "CREATE VIRTUAL TABLE booking_intervals USING rtree_i32("
+DDL_HEADERS: Dict[str, str] = {
+    m.group(2): f"{m.group(1)}CREATE {'VIRTUAL ' if m.group(3) else ''}TABLE {m.group(2)} {m.group(3) or ''}("
+    for m in _TABLE_BLOCK.finditer(SCHEMA_DDL)
+}
+
+
+def sql_tables(sql: str) -> Set[str]:
+    """Schema tables named after FROM/JOIN in a SQL string (CTE names dropped)."""
+    return {t.lower() for t in _SQL_TABLE_REF.findall(sql)} & set(DDL_BLOCKS)
+
+
+def _join_path(start: str, goal: str) -> List[str]:
+    """Shortest FK path between two tables (BFS), endpoints included."""
+    prev = {start: None}
+    queue = deque([start])
+    while queue:
+        node = queue.popleft()
+        if node == goal:
+            break
+        for nxt in sorted(NEIGHBOURS.get(node, ())):
+            if nxt not in prev:
+                prev[nxt] = node
+                queue.append(nxt)
+    if goal not in prev:
+        return []
+    path, node = [], goal
+    while node is not None:
+        path.append(node)
+        node = prev[node]
+    return path
+
+
+def link_tables(question: str) -> Tuple[Set[str], Set[str]]:
+    """Tables mentioned by the question, and bridge tables needed to join them."""
+    q = question.lower()
+    matched: Set[str] = set()
+    if _BHK.search(q):
+        matched.add("properties")
+    for word in _WORD.findall(q):
+        matched |= KEYWORDS.get(stem(word), set())
+
+    bridges: Set[str] = set()
+    ordered = sorted(matched)
+    for a, b in zip(ordered, ordered[1:]):
+        for table in _join_path(a, b):
+            if table not in matched:
+                bridges.add(table)
+    return matched, bridges
+
+
+def _render_table(table: str, keys_only: bool, selected: Set[str]) -> str:
+    # Virtual tables have no model entry and are always shown whole
+    keys_only = keys_only and table in KEY_COLUMNS
+    lines = []
+    for line in DDL_BLOCKS[table].strip("\n").split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("FOREIGN KEY") or stripped.startswith("PRIMARY KEY"):
+            ref = re.search(r"REFERENCES (\w+)", stripped)
+            if ref and ref.group(1) not in selected:
+                continue
+        elif keys_only and stripped.split(" ")[0] not in KEY_COLUMNS[table]:
+            continue
+        lines.append(line.rstrip(","))
+    return DDL_HEADERS[table] + "\n" + ",\n".join(lines) + "\n);"
+
+
+def pruned_schema(question: str, missing: Iterable[str] = ()) -> Tuple[str, Set[str]]:
+    """DDL restricted to the tables the question needs, and those tables.
+
+    Directly matched tables keep every column; bridge tables needed only for
+    joins keep their key columns. Index tables in `missing` are never
+    included. Falls back to the full schema when nothing in the question can
+    be linked.
+    """
+    missing = set(missing)
+    matched, bridges = link_tables(question)
+    matched -= missing
+    if not matched:
+        return schema_ddl(missing), set(DDL_BLOCKS) - missing
+
+    selected = matched | bridges
+    order = [t for t in DDL_BLOCKS if t in selected]
+    ddl = "\n-- DATABASE: rental_app (tables relevant to this question)\n\n" + "\n\n".join(
+        _render_table(t, t in bridges, selected) for t in order
+    ) + "\n"
+    return ddl, selected
@@ -1,10 +1,32 @@
+import os
 import random
-from datetime import datetime, timedelta
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, List, Any
+
+import numpy as np
 from faker import Faker
-from models import User, Property, Booking, Payment, Review, PropertyPhoto, Favorite
+from models import Base, User, Property, Booking, Payment, Review, PropertyPhoto, Favorite
+import booking_intervals
+import rollups
+import text_search
 
 fake = Faker()
 
+# Bulk mode: rows per table at scale factor 1 (sizes grow linearly, like TPC-H SF).
+# Every property gets one photo and every booking one payment.
+BULK_BASE_ROWS = {"users": 1000, "properties": 2000, "bookings": 10000, "reviews": 4000, "favorites": 2000}
+BULK_CHUNK_ROWS = 50000
+BULK_POOL_SIZE = 1000
+
+PROPERTY_TYPES = ["apartment", "house", "studio", "villa"]
+PROPERTY_STATUS = ["available", "booked", "inactive"]
+BOOKING_STATUS = ["pending", "confirmed", "cancelled", "completed"]
+PAYMENT_STATUS = ["initiated", "successful", "failed", "refunded"]
+PAYMENT_METHODS = ["credit_card", "debit_card", "bank_transfer", "upi", "cash"]
+
 def seed_data(session, num_users=20, num_properties=50, num_bookings=100):
     users = []
     for _ in range(num_users):
@@ -100,4 +122,213 @@ def seed_data(session, num_users=20, num_properties=50, num_bookings=100):
 
     session.commit()
     print("🌱 Seeded users, properties, bookings, payments, reviews, favorites, photos")
- 
\ No newline at end of file
+ 
+
+
+def bulk_sizes(scale_factor: float) -> Dict[str, int]:
+    sizes = {name: max(1, int(round(n * scale_factor))) for name, n in BULK_BASE_ROWS.items()}
+    sizes["users"] = max(2, sizes["users"])  # at least one landlord and one tenant
+    # Favorites are unique (tenant, property) pairs
+    sizes["favorites"] = min(sizes["favorites"], (sizes["users"] // 2) * sizes["properties"])
+    return sizes
+
+
+_pools: Dict[int, Dict[str, np.ndarray]] = {}
+_rents: Dict[Any, np.ndarray] = {}
+
+
+def _string_pools(seed: int) -> Dict[str, np.ndarray]:
+    """Faker output generated once per process and sampled by index afterwards."""
+    if seed not in _pools:
+        faker = Faker()
+        faker.seed_instance(seed)
+        n = BULK_POOL_SIZE
+        _pools[seed] = {
+            "first_name": np.array([faker.first_name() for _ in range(n)], dtype=object),
+            "last_name": np.array([faker.last_name() for _ in range(n)], dtype=object),
+            "phone": np.array([faker.phone_number() for _ in range(n)], dtype=object),
+            "title": np.array([faker.catch_phrase() for _ in range(n)], dtype=object),
+            "description": np.array([faker.text() for _ in range(n)], dtype=object),
+            "address": np.array([faker.address() for _ in range(n)], dtype=object),
+            "city": np.array([faker.city() for _ in range(n // 10)], dtype=object),
+            "state": np.array([faker.state() for _ in range(n // 20)], dtype=object),
+            "country": np.array([faker.country() for _ in range(n // 20)], dtype=object),
+            "comment": np.array([faker.sentence() for _ in range(n)], dtype=object),
+        }
+    return _pools[seed]
+
+
+def _property_rents(seed: int, num_properties: int) -> np.ndarray:
+    """Rent of every property, derived from the seed so any process can look it up."""
+    key = (seed, num_properties)
+    if key not in _rents:
+        rng = np.random.default_rng([seed, 0])
+        _rents[key] = np.round(rng.uniform(5000, 50000, num_properties), 2)
+    return _rents[key]
+
+
+def _pick(rng: np.random.Generator, pool, n: int) -> List[Any]:
+    return np.asarray(pool, dtype=object)[rng.integers(0, len(pool), n)].tolist()
+
+
+def _generate_chunk(task: tuple) -> Dict[str, tuple]:
+    """Rows for ids [start, start + count) of one table (plus dependent photos/payments).
+
+    Returns {table: (columns, rows)} with plain Python values (dates as ISO
+    strings, which is how SQLAlchemy stores them in SQLite). Users with odd
+    ids are landlords and even ids tenants, so foreign keys can be drawn
+    from id ranges without seeing other chunks.
+    """
+    kind, start, count, seed, sizes = task
+    rng = np.random.default_rng([seed, list(BULK_BASE_ROWS).index(kind) + 1, start])
+    pools = _string_pools(seed)
+    ids = np.arange(start, start + count)
+    id_list = ids.tolist()
+    n_landlords = (sizes["users"] + 1) // 2
+    n_tenants = sizes["users"] // 2
+
+    def landlords(n: int) -> List[int]:
+        return (2 * rng.integers(0, n_landlords, n) + 1).tolist()
+
+    def tenants(n: int) -> List[int]:
+        return (2 * rng.integers(1, n_tenants + 1, n)).tolist()
+
+    def properties(n: int) -> np.ndarray:
+        return rng.integers(1, sizes["properties"] + 1, n)
+
+    if kind == "users":
+        first, last = _pick(rng, pools["first_name"], count), _pick(rng, pools["last_name"], count)
+        emails = [f"{f.lower()}.{l.lower()}{i}@example.com" for i, f, l in zip(id_list, first, last)]
+        roles = np.where(ids % 2 == 1, "landlord", "tenant").tolist()
+        return {"users": (
+            ("user_id", "first_name", "last_name", "email", "phone", "role"),
+            list(zip(id_list, first, last, emails, _pick(rng, pools["phone"], count), roles)),
+        )}
+
+    if kind == "properties":
+        rents = _property_rents(seed, sizes["properties"])[ids - 1].tolist()
+        props = list(zip(
+            id_list, landlords(count), _pick(rng, pools["title"], count), _pick(rng, pools["description"], count),
+            _pick(rng, PROPERTY_TYPES, count), _pick(rng, pools["address"], count), _pick(rng, pools["city"], count),
+            _pick(rng, pools["state"], count), _pick(rng, pools["country"], count),
+            rng.integers(1, 6, count).tolist(), rng.integers(1, 4, count).tolist(), rents,
+            _pick(rng, PROPERTY_STATUS, count),
+        ))
+        photos = [(i, i, f"https://picsum.photos/seed/{i}/600/400") for i in id_list]
+        return {
+            "properties": (("property_id", "landlord_id", "title", "description", "property_type", "address",
+                            "city", "state", "country", "bedrooms", "bathrooms", "rent_price", "status"), props),
+            "property_photos": (("photo_id", "property_id", "photo_url"), photos),
+        }
+
+    if kind == "bookings":
+        year_start = date.today().replace(month=1, day=1)
+        days_so_far = max(1, (date.today() - year_start).days + 1)
+        starts = np.datetime64(year_start) + rng.integers(0, days_so_far, count).astype("timedelta64[D]")
+        ends = starts + rng.integers(5, 31, count).astype("timedelta64[D]")
+        prop_ids = properties(count)
+        tenant_ids = tenants(count)
+        amounts = _property_rents(seed, sizes["properties"])[prop_ids - 1].tolist()
+        start_iso = starts.astype(str).tolist()
+        bookings = list(zip(id_list, prop_ids.tolist(), tenant_ids, start_iso, ends.astype(str).tolist(),
+                            _pick(rng, BOOKING_STATUS, count)))
+        # One payment per booking, same id, same tenant, the property's rent
+        payments = list(zip(id_list, id_list, tenant_ids, amounts, start_iso,
+                            _pick(rng, PAYMENT_STATUS, count), _pick(rng, PAYMENT_METHODS, count)))
+        return {
+            "bookings": (("booking_id", "property_id", "tenant_id", "start_date", "end_date", "status"), bookings),
+            "payments": (("payment_id", "booking_id", "tenant_id", "amount", "payment_date", "status", "method"),
+                         payments),
+        }
+
+    if kind == "reviews":
+        return {"reviews": (
+            ("review_id", "property_id", "tenant_id", "rating", "comment"),
+            list(zip(id_list, properties(count).tolist(), tenants(count), rng.integers(1, 6, count).tolist(),
+                     _pick(rng, pools["comment"], count))),
+        )}
+
+    # favorites: pair k walks tenants first, then shifts the property per tenant,
+    # so (tenant, property) never repeats while k < tenants * properties
+    k = ids - 1
+    tenant_idx = k % n_tenants
+    prop_ids = (k // n_tenants + tenant_idx * 31) % sizes["properties"] + 1
+    return {"favorites": (("tenant_id", "property_id"), list(zip((2 * (tenant_idx + 1)).tolist(), prop_ids.tolist())))}
+
+
+def _generate_all(tasks: List[tuple], workers: int):
+    """Yield generated chunks in task order, at most 2×workers in flight."""
+    if workers <= 1:
+        for task in tasks:
+            yield _generate_chunk(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_generate_chunk, task))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def seed_bulk(engine, scale_factor: float = 1.0, workers: Optional[int] = None, seed: int = 42,
+              chunk_rows: int = BULK_CHUNK_ROWS, commit_rows: int = 1000000) -> Dict[str, int]:
+    """Fill empty tables with scale_factor × BULK_BASE_ROWS rows, fast.
+
+    Chunks are generated in worker processes (NumPy for numbers/dates,
+    pooled Faker strings) and inserted as tuples with a Core executemany,
+    committing every `commit_rows` rows. Secondary indexes and the triggers
+    of rollups, booking_intervals and the FTS5 indexes are dropped for the
+    load; indexes are rebuilt and the installed derived tables refreshed
+    afterwards.
+    """
+    workers = workers or os.cpu_count() or 1
+    sizes = bulk_sizes(scale_factor)
+    tasks = [
+        (kind, start, min(chunk_rows, sizes[kind] - start + 1), seed, sizes)
+        for kind in BULK_BASE_ROWS
+        for start in range(1, sizes[kind] + 1, chunk_rows)
+    ]
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes]
+    counts: Dict[str, int] = {}
+    started = time.perf_counter()
+
+    with engine.connect() as conn:
+        rollup_names, intervals, text_indexes = [], False, []
+        if engine.dialect.name == "sqlite":
+            rollup_names = rollups.drop_triggers(conn.connection.driver_connection)
+            intervals = booking_intervals.drop_triggers(conn.connection.driver_connection)
+            text_indexes = text_search.drop_triggers(conn.connection.driver_connection)
+            conn.exec_driver_sql("PRAGMA synchronous = OFF")
+        for index in indexes:
+            index.drop(conn, checkfirst=True)
+        pending = 0
+        for chunk in _generate_all(tasks, workers):
+            for name, (columns, rows) in chunk.items():
+                conn.exec_driver_sql(
+                    f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows
+                )
+                counts[name] = counts.get(name, 0) + len(rows)
+                pending += len(rows)
+            if pending >= commit_rows:
+                conn.commit()
+                pending = 0
+        conn.commit()
+        for index in indexes:
+            index.create(conn)
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("ANALYZE")
+        conn.commit()
+        if rollup_names:
+            rollups.install(conn.connection.driver_connection, rollup_names)
+        if intervals:
+            booking_intervals.install(conn.connection.driver_connection)
+        if text_indexes:
+            text_search.install(conn.connection.driver_connection, text_indexes)
+
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"🌱 Bulk-seeded {total} rows at SF {scale_factor} in {elapsed:.1f}s "
+          f"({total / elapsed:,.0f} rows/s): " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+    return counts
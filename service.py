@@ -0,0 +1,293 @@
+# service.py
+"""Headless HTTP API for the NL→SQL pipeline (ASGI / FastAPI).
+
+    uvicorn service:app --port 8000
+
+    POST /translate  {"question"}               → {"sql", "confidence", "notes", "params"?}
+    POST /execute    {"sql", "params"?, "max_rows"?} → NDJSON rows
+    POST /ask        {"question", "max_rows"?}  → NDJSON: translation, then rows
+    POST /export     {"sql", "params"?, "format"} → CSV or Parquet file, streamed
+    GET  /metrics                               → Prometheus text
+    GET  /healthz
+
+An NDJSON stream is a {"columns": [...]} line, one object per row, then
+{"done": true, "rows": n, "truncated": bool} ("truncated" means max_rows cut
+the stream short), or {"error": ..., "stopped": ...} if a query budget
+stopped it. A translation from a learned template has :name placeholders
+in its SQL and their values in "params"; pass both to /execute or /export.
+Model calls are awaited on the event loop. Database work (the
+caches, the plan check and query chunks) runs on a bounded thread pool. At
+most SERVICE_MAX_INFLIGHT requests are admitted at once. Past that the
+service answers 503 with Retry-After instead of queueing without bound.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional, Dict, Any, AsyncIterator, Iterator, Literal, Tuple
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+import db
+import tracing
+from arrow_results import EXPORT_FORMATS
+from nlsql import MAX_RESULT_ROWS, _passes_cost_guard, nl_to_sql_async
+from sql_guard import SQLValidationError, validate_sql
+
+load_dotenv()
+
+SERVICE_MAX_INFLIGHT = int(os.getenv("SERVICE_MAX_INFLIGHT", "64"))
+# How long a request may wait for a free slot before getting a 503
+SERVICE_QUEUE_TIMEOUT = float(os.getenv("SERVICE_QUEUE_TIMEOUT", "0.5"))
+# Threads for blocking DB work; also the number of concurrently open result streams
+SERVICE_DB_WORKERS = int(os.getenv("SERVICE_DB_WORKERS", str(db.READ_POOL_SIZE)))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "500"))
+# LIMIT appended to exported SQL that has none (exports are not held in memory)
+EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "10000000"))
+
+tracing.METRIC_HELP["nlsql_http_rejected_total"] = ("counter", "Requests refused with 503 (backpressure)")
+
+app = FastAPI(title="Verbaflo NL→SQL", version="1.0")
+_db_pool = ThreadPoolExecutor(max_workers=SERVICE_DB_WORKERS, thread_name_prefix="service-db")
+_inflight = asyncio.Semaphore(SERVICE_MAX_INFLIGHT)
+_streams = asyncio.Semaphore(SERVICE_DB_WORKERS)
+
+
+class TranslateRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=2000)
+
+
+class ExecuteRequest(BaseModel):
+    sql: str = Field(min_length=1, max_length=20000)
+    params: Optional[Dict[str, Any]] = None
+    max_rows: Optional[int] = Field(default=None, ge=1)
+
+
+class AskRequest(TranslateRequest):
+    max_rows: Optional[int] = Field(default=None, ge=1)
+
+
+class ExportRequest(BaseModel):
+    sql: str = Field(min_length=1, max_length=20000)
+    params: Optional[Dict[str, Any]] = None
+    format: Literal["csv", "parquet"] = "csv"
+
+
+class _Slot:
+    """One admission slot; release() is idempotent so every path that ends a request may call it."""
+
+    def __init__(self) -> None:
+        self.held = True
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            _inflight.release()
+
+
+async def _admit() -> _Slot:
+    try:
+        await asyncio.wait_for(_inflight.acquire(), SERVICE_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        tracing.count("nlsql_http_rejected_total")
+        raise HTTPException(503, "Server busy, retry later", headers={"Retry-After": "1"}) from None
+    return _Slot()
+
+
+class _SlotResponse(StreamingResponse):
+    """StreamingResponse that releases its admission slot however the response ends.
+
+    The body generator releases it too, but Starlette never starts the
+    generator when the client disconnects before the body is sent.
+    """
+
+    def __init__(self, content: AsyncIterator[Any], slot: _Slot, **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+def _line(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, default=str) + "\n"
+
+
+async def _translate(question: str) -> Dict[str, Any]:
+    try:
+        data = await nl_to_sql_async(question, raise_errors=True, executor=_db_pool)
+    except Exception as e:
+        raise HTTPException(502, f"Model call failed: {e}") from None
+    if not data or not data.get("sql"):
+        raise HTTPException(422, "Unable to answer this question")
+    out = {"sql": data["sql"], "confidence": data.get("confidence"), "notes": data.get("notes")}
+    if data.get("params"):
+        out["params"] = data["params"]
+    return out
+
+
+def _close_when_idle(pending: Optional[Future], rows) -> None:
+    # A generator can't be closed while another thread is inside next()
+    if pending is not None:
+        try:
+            pending.result()
+        except Exception:
+            pass
+    rows.close()
+
+
+async def _stream_rows(slot: _Slot, sql: str, max_rows: Optional[int], first: Optional[Dict[str, Any]] = None,
+                       params: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    """NDJSON body; releases the admission slot when the stream ends or the client goes away."""
+    loop = asyncio.get_running_loop()
+    # QUERY_MAX_ROWS stays a hard budget; a request's max_rows just truncates the stream
+    control = db.QueryControl(max_rows=db.QUERY_MAX_ROWS)
+    limit = max_rows or db.QUERY_MAX_ROWS
+    rows = db.iter_query(sql, chunk_size=STREAM_CHUNK_ROWS, params=params, control=control)
+    pending: Optional[Future] = None
+    finished = False
+    count = 0
+    truncated = False
+    try:
+        if first is not None:
+            yield _line(first)
+        async with _streams:
+            columns_sent = False
+            while True:
+                pending = _db_pool.submit(next, rows, None)
+                chunk = await asyncio.wrap_future(pending, loop=loop)
+                pending = None
+                if chunk is None:
+                    break
+                if not columns_sent:
+                    yield _line({"columns": list(chunk.columns)})
+                    columns_sent = True
+                if count + len(chunk) >= limit:
+                    truncated = count + len(chunk) > limit
+                    chunk = chunk.head(limit - count)
+                count += len(chunk)
+                body = chunk.to_json(orient="records", lines=True, date_format="iso")
+                yield body if body.endswith("\n") else body + "\n"
+                if count >= limit:
+                    break
+        finished = True
+        tracing.count("nlsql_rows_returned_total", count)
+        yield _line({"done": True, "rows": count, "truncated": truncated})
+    except db.QueryBudgetExceeded as e:
+        finished = True
+        yield _line({"error": str(e), "stopped": e.reason, "rows": count})
+    except Exception as e:
+        finished = True
+        yield _line({"error": f"Query failed: {e}", "rows": count})
+    finally:
+        if not finished:
+            control.cancel()
+        _db_pool.submit(_close_when_idle, pending, rows)
+        slot.release()
+
+
+async def _stream_export(slot: _Slot, sql: str, fmt: str,
+                         params: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+    """File body built from Arrow batches; the full result is never held in memory."""
+    loop = asyncio.get_running_loop()
+    control = db.QueryControl(max_rows=0)
+    writer, _ = EXPORT_FORMATS[fmt]
+    chunks: Iterator[bytes] = writer(db.iter_arrow(sql, params=params, control=control))
+    pending: Optional[Future] = None
+    finished = False
+    try:
+        async with _streams:
+            while True:
+                pending = _db_pool.submit(next, chunks, None)
+                chunk = await asyncio.wrap_future(pending, loop=loop)
+                pending = None
+                if chunk is None:
+                    break
+                yield chunk
+        finished = True
+    finally:
+        # A failed or abandoned export just ends the body early; the client sees a truncated file
+        if not finished:
+            control.cancel()
+        _db_pool.submit(_close_when_idle, pending, chunks)
+        slot.release()
+
+
+def _check_sql(sql: str, max_rows: int, params: Optional[Dict[str, Any]]) -> Tuple[str, bool]:
+    """validate_sql plus the cost guard. Both compile against SQLite, so this runs on _db_pool."""
+    sql = validate_sql(sql, max_rows, params, db.missing_indexes())
+    return sql, _passes_cost_guard(sql, params)
+
+
+async def _checked_sql(sql: str, max_rows: int = MAX_RESULT_ROWS, params: Optional[Dict[str, Any]] = None) -> str:
+    try:
+        sql, ok = await asyncio.get_running_loop().run_in_executor(_db_pool, _check_sql, sql, max_rows, params)
+    except SQLValidationError as e:
+        raise HTTPException(400, f"Rejected SQL: {e}") from None
+    if not ok:
+        raise HTTPException(400, "Rejected SQL: query too expensive")
+    return sql
+
+
+@app.post("/translate")
+async def translate(req: TranslateRequest) -> Dict[str, Any]:
+    slot = await _admit()
+    try:
+        return await _translate(req.question)
+    finally:
+        slot.release()
+
+
+@app.post("/execute")
+async def execute(req: ExecuteRequest) -> StreamingResponse:
+    slot = await _admit()
+    try:
+        sql = await _checked_sql(req.sql, params=req.params)
+    except BaseException:
+        slot.release()
+        raise
+    # The response owns the admission slot from here on
+    return _SlotResponse(_stream_rows(slot, sql, req.max_rows, params=req.params), slot,
+                         media_type="application/x-ndjson")
+
+
+@app.post("/ask")
+async def ask(req: AskRequest) -> StreamingResponse:
+    slot = await _admit()
+    try:
+        translation = await _translate(req.question)
+    except BaseException:
+        slot.release()
+        raise
+    return _SlotResponse(_stream_rows(slot, translation["sql"], req.max_rows, first=translation,
+                                      params=translation.get("params")), slot,
+                         media_type="application/x-ndjson")
+
+
+@app.post("/export")
+async def export(req: ExportRequest) -> StreamingResponse:
+    slot = await _admit()
+    try:
+        sql = await _checked_sql(req.sql, EXPORT_MAX_ROWS, req.params)
+    except BaseException:
+        slot.release()
+        raise
+    _, media_type = EXPORT_FORMATS[req.format]
+    return _SlotResponse(_stream_export(slot, sql, req.format, req.params), slot, media_type=media_type,
+                         headers={"Content-Disposition": f'attachment; filename="result.{req.format}"'})
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(tracing.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/healthz")
+async def healthz() -> Dict[str, Any]:
+    return {"ok": True, "inflight_limit": SERVICE_MAX_INFLIGHT, "db_workers": SERVICE_DB_WORKERS}
@@ -0,0 +1,124 @@
+# singleflight.py
+"""Coalesce concurrent identical work ("single flight").
+
+The first caller for a key runs the function; callers that arrive while it
+is in progress wait for the same result instead of repeating the work. An
+exception raised by the function is re-raised in every caller, and results
+are shared objects, so callers must not mutate them.
+
+Cancellation is per caller: a waiter whose cancel event is set stops
+waiting (FlightCancelled) without disturbing the others, and the work
+itself is only told to stop (Call.on_idle) once every caller has left.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import tracing
+
+tracing.METRIC_HELP["nlsql_singleflight_total"] = ("counter", "Coalescable calls by flight and role (leader/shared)")
+
+
+class FlightCancelled(Exception):
+    """The caller stopped waiting for a shared in-progress call."""
+
+
+class Call:
+    """One in-progress computation and the callers interested in it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.participants = 1
+        # Set by the running function to stop its work when nobody is left
+        self.on_idle: Optional[Callable[[], None]] = None
+        self._lock = threading.Lock()
+
+    def join(self) -> None:
+        with self._lock:
+            self.participants += 1
+
+    def leave(self) -> None:
+        """A caller lost interest; stop the work once nobody is left."""
+        with self._lock:
+            self.participants -= 1
+            idle = self.participants == 0 and not self.done.is_set()
+        if idle and self.on_idle is not None:
+            self.on_idle()
+
+
+class SingleFlight:
+    def __init__(self, name: str, poll_interval: float = 0.05):
+        self.name = name
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], List[Any]] = {}
+
+    def _count(self, role: str) -> None:
+        tracing.count("nlsql_singleflight_total", flight=self.name, role=role)
+
+    def do(self, key: Hashable, fn: Callable[[Call], Any],
+           cancelled: Optional[threading.Event] = None) -> Tuple[Any, bool]:
+        """(fn(call) or the in-progress result for `key`, whether it was shared).
+
+        The first caller runs fn in its own thread. Waiters poll `cancelled`
+        (their own cancel switch) and raise FlightCancelled when it is set.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Call()
+            else:
+                call.join()
+
+        if leader:
+            self._count("leader")
+            try:
+                call.value = fn(call)
+            except BaseException as e:
+                call.error = e
+            finally:
+                # Unpublish before waking waiters so late arrivals start a fresh call
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+            if call.error is not None:
+                raise call.error
+            return call.value, False
+
+        self._count("shared")
+        with tracing.span(f"{self.name}_wait"):
+            while not call.done.wait(self.poll_interval if cancelled is not None else None):
+                if cancelled.is_set():
+                    call.leave()
+                    raise FlightCancelled(f"stopped waiting for shared {self.name}")
+        if call.error is not None:
+            raise call.error
+        return call.value, True
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Event-loop variant: the work runs as its own task that every caller awaits.
+
+        A cancelled caller just stops awaiting; the task is cancelled only
+        when the last interested caller is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        slot = (id(loop), key)
+        entry = self._tasks.get(slot)
+        shared = entry is not None
+        if entry is None:
+            task = loop.create_task(fn())
+            entry = self._tasks[slot] = [task, 0]
+            task.add_done_callback(lambda _: self._tasks.pop(slot, None) if self._tasks.get(slot) is entry else None)
+        self._count("shared" if shared else "leader")
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0]), shared
+        except asyncio.CancelledError:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                entry[0].cancel()
+            raise
@@ -0,0 +1,357 @@
+# sql_guard.py
+import math
+import re
+import sqlite3
+import threading
+from typing import Any, Callable, FrozenSet, Iterable, Optional, Dict, List, Tuple
+
+from prompts import schema_ddl
+
+ALLOWED_TABLES = {
+    'users', 'properties', 'bookings', 'payments',
+    'reviews', 'property_photos', 'favorites', 'booking_intervals',
+    'properties_fts', 'reviews_fts'
+}
+# Whitelisted virtual tables (indexes maintained by triggers, not models.py tables)
+VIRTUAL_TABLES = {'booking_intervals', 'properties_fts', 'reviews_fts'}
+BANNED_FUNCTIONS = {'load_extension', 'fts3_tokenizer', 'readfile', 'writefile', 'edit'}
+
+# Cost gate: estimated row visits above this are rejected before execution
+MAX_QUERY_COST = 5e7
+# Tables at least this big are called out when they are scanned inside a join
+LARGE_TABLE_ROWS = 10000
+
+
+class SQLValidationError(ValueError):
+    """Generated SQL was rejected; the message says why."""
+
+
+_TOKEN = re.compile(
+    r"(?P<string>'(?:[^']|'')*')"
+    r"|(?P<ident>\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\])"
+    r"|(?P<comment>--[^\n]*|/\*[\s\S]*?(?:\*/|$))"
+    r"|(?P<space>\s+)"
+    r"|(?P<word>[A-Za-z_][A-Za-z0-9_$]*)"
+    r"|(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?|\.\d+)"
+    r"|(?P<param>\?\d*|[:@$][A-Za-z0-9_]+)"
+    r"|(?P<op>.)",
+    re.S,
+)
+
+_CLAUSE_WORDS = {
+    'where', 'group', 'order', 'limit', 'having', 'window', 'union', 'intersect', 'except',
+    'on', 'using', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'outer',
+    'select', 'from', 'as', 'values',
+}
+# Keywords that close a FROM clause
+_FROM_ENDS = {'where', 'group', 'order', 'limit', 'having', 'window', 'union', 'intersect',
+              'except', 'select', 'values'}
+
+
+def tokenize(sql: str) -> List[Tuple[str, str]]:
+    """Lex SQL into (kind, text) pairs, dropping whitespace and comments."""
+    out = []
+    for m in _TOKEN.finditer(sql):
+        kind = m.lastgroup
+        if kind in ('space', 'comment'):
+            continue
+        out.append((kind, m.group()))
+    return out
+
+
+def has_open_comment(sql: str) -> bool:
+    """True when a /* comment runs to the end of `sql` (SQLite accepts it)."""
+    return any(m.lastgroup == 'comment' and m.group().startswith('/*') and not m.group().endswith('*/')
+               for m in _TOKEN.finditer(sql))
+
+
+def first_statement(sql: str) -> str:
+    """Text up to the first top-level ';' (strings and comments respected)."""
+    for m in _TOKEN.finditer(sql):
+        if m.lastgroup == 'op' and m.group() == ';':
+            return sql[:m.start()]
+    return sql
+
+
+def has_top_level_limit(tokens: List[Tuple[str, str]]) -> bool:
+    depth = 0
+    for kind, text in tokens:
+        if text == '(':
+            depth += 1
+        elif text == ')':
+            depth -= 1
+        elif depth == 0 and kind == 'word' and text.lower() == 'limit':
+            return True
+    return False
+
+
+def clamp_limit(sql: str, max_rows: int, params: Optional[Dict[str, Any]] = None) -> str:
+    """`sql` with its outermost LIMIT capped at max_rows.
+
+    A row count above max_rows is rewritten in place when it is an integer
+    literal (LIMIT n, LIMIT n OFFSET m, LIMIT m, n). A bound :param within
+    the cap is kept. Any other form (an oversized parameter, an expression,
+    a negative count) is wrapped as SELECT * FROM (...) LIMIT max_rows.
+    """
+    tokens = [m for m in _TOKEN.finditer(sql) if m.lastgroup not in ('space', 'comment')]
+    depth = 0
+    for i, m in enumerate(tokens):
+        if m.group() == '(':
+            depth += 1
+        elif m.group() == ')':
+            depth -= 1
+        elif depth == 0 and m.lastgroup == 'word' and m.group().lower() == 'limit':
+            break
+    else:
+        return sql
+    clause = tokens[i + 1:]
+    shape = [t.group().lower() if t.lastgroup in ('word', 'op') else t.lastgroup for t in clause]
+    if shape in (['number'], ['param'], ['number', 'offset', 'number'], ['param', 'offset', 'number']):
+        count = clause[0]
+    elif shape in (['number', ',', 'number'], ['number', ',', 'param']):
+        count = clause[2]
+    else:
+        count = None
+    if count is not None and count.lastgroup == 'number' and count.group().isdigit():
+        if int(count.group()) <= max_rows:
+            return sql
+        return f"{sql[:count.start()]}{int(max_rows)}{sql[count.end():]}"
+    if count is not None and count.lastgroup == 'param':
+        value = (params or {}).get(count.group()[1:])
+        if isinstance(value, int) and 0 <= value <= max_rows:
+            return sql
+    return f"SELECT * FROM (\n{sql}\n) LIMIT {int(max_rows)}"
+
+
+def _unquote(text: str) -> str:
+    if text[:1] in '"`[':
+        return text[1:-1]
+    return text
+
+
+def table_aliases(tokens: List[Tuple[str, str]]) -> Dict[str, str]:
+    """Map every FROM/JOIN item's alias (or bare name) to the table/CTE it names."""
+    aliases: Dict[str, str] = {}
+    in_from = {}  # depth → inside a FROM clause at that depth
+    depth = 0
+    expect_table = False
+    i = 0
+    while i < len(tokens):
+        kind, text = tokens[i]
+        low = text.lower()
+        if text == '(':
+            depth += 1
+            expect_table = False
+        elif text == ')':
+            in_from[depth] = False
+            depth -= 1
+        elif kind == 'word' and low in ('from', 'join'):
+            in_from[depth] = True
+            expect_table = True
+        elif text == ',' and in_from.get(depth):
+            expect_table = True
+        elif kind == 'word' and low in _FROM_ENDS:
+            in_from[depth] = False
+            expect_table = False
+        elif expect_table and kind in ('word', 'ident'):
+            name = _unquote(text).lower()
+            alias = name
+            j = i + 1
+            if j < len(tokens) and tokens[j][1].lower() == 'as':
+                j += 1
+            if j < len(tokens) and tokens[j][0] in ('word', 'ident') and tokens[j][1].lower() not in _CLAUSE_WORDS:
+                alias = _unquote(tokens[j][1]).lower()
+                i = j
+            aliases.setdefault(alias, name)
+            aliases.setdefault(name, name)
+            expect_table = False
+        i += 1
+    return aliases
+
+
+def _shadow_parent(name: str) -> Optional[str]:
+    """The virtual table that owns shadow table `name` (reviews_fts_idx → reviews_fts), if any."""
+    for vtab in VIRTUAL_TABLES:
+        if name.startswith(f"{vtab}_"):
+            return vtab
+    return None
+
+
+class _SchemaValidator(threading.local):
+    """Per-thread in-memory copies of SCHEMA_DDL used to compile candidate SQL.
+
+    One copy per set of missing index tables, built without them, so SQL
+    that reads one fails with "no such table".
+    """
+
+    def __init__(self):
+        self.conns: Dict[FrozenSet[str], sqlite3.Connection] = {}
+        self.denied: List[str] = []
+        self.tables: FrozenSet[str] = frozenset()
+
+    def _conn(self, missing: FrozenSet[str]) -> sqlite3.Connection:
+        conn = self.conns.get(missing)
+        if conn is None:
+            conn = sqlite3.connect(':memory:')
+            conn.executescript(schema_ddl(missing))
+            conn.set_authorizer(self._authorize)
+            self.conns[missing] = conn
+        return conn
+
+    def _authorize(self, action, arg1, arg2, db_name, trigger) -> int:
+        if action == sqlite3.SQLITE_SELECT or action == sqlite3.SQLITE_RECURSIVE:
+            return sqlite3.SQLITE_OK
+        if action == sqlite3.SQLITE_READ:
+            # CTE and subquery columns are reported with no database name; virtual
+            # tables (FTS5) read their own shadow tables, e.g. reviews_fts_idx, but
+            # only for a statement that names the virtual table and not the shadow
+            if db_name is None or arg1 in ALLOWED_TABLES or \
+                    (_shadow_parent(arg1) in self.tables and arg1 not in self.tables):
+                return sqlite3.SQLITE_OK
+            self.denied.append(f"table '{arg1}' is not allowed")
+            return sqlite3.SQLITE_DENY
+        if action == sqlite3.SQLITE_FUNCTION:
+            if arg2 and arg2.lower() in BANNED_FUNCTIONS:
+                self.denied.append(f"function '{arg2}' is not allowed")
+                return sqlite3.SQLITE_DENY
+            return sqlite3.SQLITE_OK
+        self.denied.append("only read-only SELECT statements are allowed")
+        return sqlite3.SQLITE_DENY
+
+    def compile(self, sql: str, params: Optional[Dict[str, Any]] = None, missing: Iterable[str] = ()) -> None:
+        self.denied = []
+        self.tables = frozenset(table_aliases(tokenize(sql)).values())
+        try:
+            self._conn(frozenset(missing)).execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        except sqlite3.Error as e:
+            reason = self.denied[0] if self.denied else str(e)
+            raise SQLValidationError(reason) from None
+
+
+_validator = _SchemaValidator()
+
+
+def validate_sql(sql: str, max_rows: int, params: Optional[Dict[str, Any]] = None,
+                 missing: Iterable[str] = ()) -> str:
+    """Return a safe, LIMITed single SELECT or raise SQLValidationError.
+
+    The statement is compiled by SQLite itself against an in-memory copy of
+    the schema with an authorizer installed, so the check sees the real
+    parse: every table read, function call and statement type. Only reads of
+    whitelisted tables (and CTEs) pass; unknown tables/columns and syntax
+    errors fail here instead of at execution time. A LIMIT is appended when
+    the outermost query has none, and a larger one is capped at max_rows
+    (clamp_limit). Placeholders are allowed only for the
+    names in `params`. Index tables in `missing` (whitelisted, but not built
+    in this database) are unknown tables too.
+    """
+    sql = first_statement(sql.replace('`', '')).strip()
+    tokens = tokenize(sql)
+    if not tokens:
+        raise SQLValidationError("empty statement")
+    if tokens[0][1].lower() not in ('select', 'with', 'values'):
+        raise SQLValidationError("only read-only SELECT statements are allowed")
+    if has_open_comment(sql):
+        # An appended or wrapping LIMIT would land inside it
+        raise SQLValidationError("unterminated /* comment")
+    _validator.compile(sql, params, missing)
+    if not has_top_level_limit(tokens):
+        sql = f"{sql}\nLIMIT {int(max_rows)}"
+    else:
+        sql = clamp_limit(sql, max_rows, params)
+    return sql
+
+
+_LOOP = re.compile(r"^(SCAN|SEARCH) (\S+)(.*)$")
+_NAMED_SUBQUERY = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (\S+)")
+_VTAB_CONSTRAINED = re.compile(r"VIRTUAL TABLE INDEX \d+:\S")
+
+
+def estimate_cost(plan: List[Tuple[int, int, int, str]], table_rows: Dict[str, int],
+                  aliases: Dict[str, str],
+                  search_rows: Optional[Callable[[str, str], Optional[float]]] = None) -> Tuple[float, List[str]]:
+    """Estimated row visits for an EXPLAIN QUERY PLAN, plus notable full scans.
+
+    Loops listed under the same parent are nested, so their row factors
+    multiply; subqueries and materialized CTEs add their own cost. A SCAN
+    is a full pass over the table (or over a CTE's estimated rows), an
+    equality SEARCH costs ~log2(rows) per outer row (one row out for primary
+    keys) and a range SEARCH, like a virtual table scan with constraints, a
+    third of the rows.
+
+    `search_rows(table, detail)` may supply the rows one SEARCH returns
+    (e.g. from index statistics); each of them then costs a rowid lookup
+    unless the index is covering.
+    """
+    children: Dict[int, List[Tuple[int, str]]] = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    named_rows: Dict[str, float] = {}
+    notes: List[str] = []
+
+    def rows_of(name: str) -> float:
+        target = aliases.get(name.lower(), name.lower())
+        if target in named_rows:
+            return named_rows[target]
+        if name.lower() in named_rows:
+            return named_rows[name.lower()]
+        return float(table_rows.get(target, 1))
+
+    def walk(parent: int) -> Tuple[float, float]:
+        """(output rows, total cost) of the loops and subqueries under parent."""
+        out_rows, cost = 1.0, 0.0
+        loops: List[str] = []
+        for node_id, detail in children.get(parent, []):
+            m = _LOOP.match(detail)
+            if m:
+                kind, name, rest = m.groups()
+                if name == 'CONSTANT':
+                    continue
+                n = rows_of(name)
+                per_lookup = search_rows(aliases.get(name.lower(), name.lower()), rest) \
+                    if search_rows is not None and kind == 'SEARCH' else None
+                if kind == 'SCAN' and _VTAB_CONSTRAINED.search(rest):
+                    # R*Tree/FTS lookup with constraints: treat like a range search
+                    lookup = factor = max(1.0, n / 3)
+                elif kind == 'SCAN':
+                    lookup = factor = n
+                    if loops and n >= LARGE_TABLE_ROWS:
+                        notes.append(f"full scan of {name} ({int(n)} rows) nested inside {', '.join(loops)}")
+                elif per_lookup is not None:
+                    depth = max(1.0, math.log2(max(n, 2)))
+                    factor = max(1.0, per_lookup)
+                    lookup = depth + factor * (1.0 if 'COVERING' in rest or 'PRIMARY KEY' in rest else depth)
+                    if 'AUTOMATIC' in rest:
+                        cost += n
+                elif '=' in rest and '<' not in rest and '>' not in rest:
+                    lookup = max(1.0, math.log2(max(n, 2)))
+                    factor = 1.0 if 'PRIMARY KEY' in rest else lookup
+                    if 'AUTOMATIC' in rest:
+                        cost += n
+                else:
+                    lookup = factor = max(1.0, n / 3)
+                cost += out_rows * lookup
+                out_rows *= factor
+                loops.append(name)
+                continue
+            sub_rows, sub_cost = walk(node_id)
+            named = _NAMED_SUBQUERY.match(detail)
+            if named:
+                named_rows[named.group(1).lower()] = sub_rows
+            if detail.startswith('CORRELATED'):
+                sub_cost *= out_rows
+            cost += sub_cost
+        return out_rows, cost
+
+    _, total = walk(0)
+    return total, notes
+
+
+def check_cost(sql: str, plan: List[Tuple[int, int, int, str]], table_rows: Dict[str, int],
+               max_cost: float = MAX_QUERY_COST) -> float:
+    """Raise SQLValidationError when the plan's estimated cost exceeds max_cost."""
+    cost, notes = estimate_cost(plan, table_rows, table_aliases(tokenize(sql)))
+    if cost > max_cost:
+        detail = "; ".join(notes) if notes else "unindexed scans over large tables"
+        raise SQLValidationError(f"query too expensive (~{cost:.2g} row visits): {detail}")
+    return cost
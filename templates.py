@@ -0,0 +1,395 @@
+# templates.py
+"""Parameterized SQL templates learned from answered questions.
+
+"Available 2BHKs under $2500 in London" and "available 3BHKs under $4000 in
+Bradford" need the same SQL with different literals. extract() finds the
+entities in a question and replaces them with slots: cities (matched
+against properties.city), enum values from models.py, BHK/bedroom counts
+and other numbers. That gives the skeleton
+
+    <property_status> <bhk> under $<num> in <city>
+
+plus the values. After the model answers a question, learn() turns each
+value that appears as exactly one literal in the SQL into a named
+parameter (:city0, :bhk0, ...). A value the SQL does not use, or uses more
+than once, stays fixed: the template only serves questions with the same
+value. match() finds a template for a new question's skeleton and fills its
+parameters, so the question is answered without a model call.
+
+    python templates.py            # learned templates, most used first
+    python templates.py --clear
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+
+from cache import fingerprint, normalize_question
+from sql_guard import _TOKEN
+
+load_dotenv()
+
+TEMPLATE_PATH = os.getenv("TEMPLATE_PATH", ".nlsql_templates.db")
+# Only answers the model was at least this sure of are learned
+TEMPLATE_MIN_CONFIDENCE = float(os.getenv("TEMPLATE_MIN_CONFIDENCE", "0.8"))
+
+_WORD = re.compile(r"[A-Za-z0-9']+")
+# The whole "2BHKs" / "2 bedroom" becomes one <bhk> slot, so the wordings share a skeleton
+_BHK = re.compile(r"\b(\d+)\s*-?\s*(?:bhk|bed(?:room)?)s?\b", re.I)
+_NUMBER = re.compile(r"(?<![\w.])(\d{1,3}(?:,\d{3})+|\d+)(\.\d+)?(?![\w.])")
+_PRIORITY = {"city": 0, "enum": 1, "bhk": 2, "num": 3}
+
+
+@dataclass
+class Entity:
+    slot: str           # city0, bhk0, property_types0, ...
+    value: Any
+    start: int
+    end: int
+
+
+@dataclass
+class Extraction:
+    skeleton: str
+    entities: List[Entity] = field(default_factory=list)
+
+    def values(self) -> Dict[str, Any]:
+        return {e.slot: e.value for e in self.entities}
+
+
+_enum_words: Optional[List[Tuple[re.Pattern, str, str]]] = None
+
+
+def enum_words() -> List[Tuple[re.Pattern, str, str]]:
+    """(pattern, value, enum name) for every value of a models.py Enum column."""
+    global _enum_words
+    if _enum_words is None:
+        from sqlalchemy import Enum
+
+        from models import Base
+
+        words = []
+        for table in Base.metadata.sorted_tables:
+            for col in table.columns:
+                if isinstance(col.type, Enum):
+                    for value in col.type.enums:
+                        pattern = re.compile(r"\b" + value.replace("_", "[ _]") + r"(?=s?\b)", re.I)
+                        words.append((pattern, value, col.type.name or col.name))
+        _enum_words = words
+    return _enum_words
+
+
+_cities: Dict[str, str] = {}
+_cities_version: Any = None
+
+
+def cities() -> Dict[str, str]:
+    """Lower-cased city → properties.city spelling, cached per data_version."""
+    global _cities, _cities_version
+    import db
+
+    version = db.data_version()
+    if version is None or version != _cities_version:
+        with db.get_query_engine().connect() as conn:
+            rows = conn.exec_driver_sql("SELECT DISTINCT city FROM properties WHERE city IS NOT NULL").fetchall()
+        _cities = {city.lower(): city for (city,) in rows}
+        _cities_version = version
+    return _cities
+
+
+def _spans(question: str, known_cities: Dict[str, str]) -> List[Tuple[int, int, str, str, Any]]:
+    """Candidate (start, end, kind, slot kind, value) spans; overlaps are resolved by the caller."""
+    spans = []
+    words = list(_WORD.finditer(question))
+    longest = max((len(c.split()) for c in known_cities), default=0)
+    for i in range(len(words)):
+        for n in range(min(longest, len(words) - i), 0, -1):
+            start, end = words[i].start(), words[i + n - 1].end()
+            city = known_cities.get(" ".join(question[start:end].lower().split()))
+            if city is not None:
+                spans.append((start, end, "city", "city", city))
+                break
+    for pattern, value, enum in enum_words():
+        for m in pattern.finditer(question):
+            spans.append((m.start(), m.end(), "enum", enum, value))
+    for m in _BHK.finditer(question):
+        spans.append((m.start(), m.end(), "bhk", "bhk", int(m.group(1))))
+    for m in _NUMBER.finditer(question):
+        text = m.group(1).replace(",", "") + (m.group(2) or "")
+        spans.append((m.start(), m.end(), "num", "num", float(text) if m.group(2) else int(text)))
+    return spans
+
+
+def extract(question: str, known_cities: Optional[Dict[str, str]] = None) -> Extraction:
+    """The question's skeleton and the entities taken out of it."""
+    if known_cities is None:
+        known_cities = cities()
+    chosen: List[Tuple[int, int, str, str, Any]] = []
+    for span in sorted(_spans(question, known_cities), key=lambda s: (_PRIORITY[s[2]], s[0])):
+        if all(span[1] <= c[0] or span[0] >= c[1] for c in chosen):
+            chosen.append(span)
+    chosen.sort()
+    counts: Dict[str, int] = {}
+    entities, parts, pos = [], [], 0
+    for start, end, _, slot_kind, value in chosen:
+        slot = f"{slot_kind}{counts.get(slot_kind, 0)}"
+        counts[slot_kind] = counts.get(slot_kind, 0) + 1
+        entities.append(Entity(slot, value, start, end))
+        parts.append(question[pos:start] + f"<{slot_kind}>")
+        pos = end
+    parts.append(question[pos:])
+    return Extraction(normalize_question("".join(parts)), entities)
+
+
+@dataclass
+class _Literal:
+    start: int
+    end: int
+    value: Any      # str for string literals, int/float for numbers
+
+
+def _literals(sql: str) -> List[_Literal]:
+    out = []
+    for m in _TOKEN.finditer(sql):
+        if m.lastgroup == "string":
+            out.append(_Literal(m.start(), m.end(), m.group()[1:-1].replace("''", "'")))
+        elif m.lastgroup == "number":
+            text = m.group()
+            try:
+                out.append(_Literal(m.start(), m.end(), int(text) if text.isdigit() else float(text)))
+            except ValueError:
+                pass
+    return out
+
+
+# How a question value is written into the SQL literal
+_CASES = {"": lambda s: s, "lower": str.lower, "upper": str.upper}
+
+
+def _binding(value: Any, literal: Any) -> Optional[Dict[str, str]]:
+    """How `literal` is derived from `value` (case, LIKE wildcards, number as text), or None."""
+    if isinstance(value, str):
+        if not isinstance(literal, str):
+            return None
+        for wrap in ("{}", "%{}", "{}%", "%{}%"):
+            for case, fn in _CASES.items():
+                if literal == wrap.format(fn(value)):
+                    return {"case": case, "wrap": wrap}
+        return None
+    if isinstance(literal, str):
+        # Years and other numbers compared as text, e.g. strftime('%Y', ...) = '2024'
+        return {"case": "", "wrap": "{}", "text": "1"} if literal == str(value) else None
+    if isinstance(literal, (int, float)) and float(literal) == float(value):
+        return {"case": "", "wrap": "{}"}
+    return None
+
+
+def _bind(value: Any, binding: Dict[str, str]) -> Any:
+    if binding.get("text"):
+        value = str(value)
+    if isinstance(value, str):
+        value = binding["wrap"].format(_CASES[binding["case"]](value))
+    return value
+
+
+@dataclass
+class Template:
+    key: str
+    skeleton: str
+    sql: str
+    params: Dict[str, Dict[str, str]]    # slot → binding (the parameter is named after the slot)
+    fixed: Dict[str, Any]                # slot → the only value this template serves
+    confidence: float = 0.0
+    hits: int = 0
+
+    def bind(self, extraction: Extraction) -> Optional[Dict[str, Any]]:
+        """Parameters for a question with this skeleton, or None if a fixed value differs."""
+        values = extraction.values()
+        if any(values.get(slot) != value for slot, value in self.fixed.items()):
+            return None
+        return {slot: _bind(values[slot], binding) for slot, binding in self.params.items()}
+
+
+def parameterize(extraction: Extraction, sql: str) -> Optional[Template]:
+    """A template from a question's entities and its SQL, or None if no entity maps to a literal."""
+    literals = _literals(sql)
+    matches: Dict[str, List[Tuple[int, Dict[str, str]]]] = {}
+    for entity in extraction.entities:
+        for i, lit in enumerate(literals):
+            binding = _binding(entity.value, lit.value)
+            if binding is not None:
+                matches.setdefault(entity.slot, []).append((i, binding))
+    claimed: Dict[int, int] = {}
+    for found in matches.values():
+        if len(found) == 1:
+            claimed[found[0][0]] = claimed.get(found[0][0], 0) + 1
+    params: Dict[str, Dict[str, str]] = {}
+    by_literal: Dict[int, str] = {}
+    for slot, found in matches.items():
+        if len(found) == 1 and claimed[found[0][0]] == 1:
+            params[slot] = found[0][1]
+            by_literal[found[0][0]] = slot
+    if not params:
+        return None
+    fixed = {e.slot: e.value for e in extraction.entities if e.slot not in params}
+    parts, pos = [], 0
+    for i, lit in enumerate(literals):
+        if i in by_literal:
+            parts.append(sql[pos:lit.start] + f":{by_literal[i]}")
+            pos = lit.end
+    parts.append(sql[pos:])
+    key = fingerprint(extraction.skeleton, fixed)
+    return Template(key, extraction.skeleton, "".join(parts), params, fixed)
+
+
+def render(sql: str, params: Optional[Dict[str, Any]]) -> str:
+    """`sql` with its :name parameters written out as SQL literals (for logs and display)."""
+    if not params:
+        return sql
+    parts, pos = [], 0
+    for m in _TOKEN.finditer(sql):
+        if m.lastgroup == "param" and m.group()[1:] in params:
+            value = params[m.group()[1:]]
+            literal = "'" + value.replace("'", "''") + "'" if isinstance(value, str) else repr(value)
+            parts.append(sql[pos:m.start()] + literal)
+            pos = m.end()
+    parts.append(sql[pos:])
+    return "".join(parts)
+
+
+class TemplateStore:
+    """Learned templates in a SQLite file, keyed by skeleton and prompt fingerprint."""
+
+    def __init__(self, path: str = TEMPLATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "learned": 0}
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS templates (
+                    key TEXT NOT NULL,
+                    prompt_fingerprint TEXT NOT NULL,
+                    skeleton TEXT NOT NULL,
+                    sql TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    fixed TEXT NOT NULL,
+                    confidence REAL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (key, prompt_fingerprint)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_templates_skeleton ON templates(skeleton, prompt_fingerprint)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, event: str) -> None:
+        with self._lock:
+            self._stats[event] += 1
+
+    def match(self, extraction: Extraction, prompt_fp: str) -> Optional[Tuple[Template, Dict[str, Any]]]:
+        """The most used template for the skeleton that serves these values, with its parameters."""
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    """SELECT key, skeleton, sql, params, fixed, confidence, hits FROM templates
+                       WHERE skeleton = ? AND prompt_fingerprint = ? ORDER BY hits DESC""",
+                    (extraction.skeleton, prompt_fp)).fetchall()
+                for key, skeleton, sql, params, fixed, confidence, hits in rows:
+                    template = Template(key, skeleton, sql, json.loads(params), json.loads(fixed), confidence, hits)
+                    bound = template.bind(extraction)
+                    if bound is not None:
+                        conn.execute("UPDATE templates SET hits = hits + 1 WHERE key = ? AND prompt_fingerprint = ?",
+                                     (key, prompt_fp))
+                        self._count("hits")
+                        return template, bound
+        except sqlite3.Error as e:
+            print(f"Template store read failed: {e}")
+        self._count("misses")
+        return None
+
+    def learn(self, extraction: Extraction, sql: str, confidence: Optional[float], prompt_fp: str) -> Optional[Template]:
+        """Store the template for an answered question; None when it has no parameter to learn."""
+        template = parameterize(extraction, sql)
+        if template is None:
+            return None
+        template.confidence = confidence or 0.0
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    """INSERT OR REPLACE INTO templates
+                       (key, prompt_fingerprint, skeleton, sql, params, fixed, confidence, hits, created_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?)""",
+                    (template.key, prompt_fp, template.skeleton, template.sql, json.dumps(template.params),
+                     json.dumps(template.fixed, default=str), template.confidence, time.time()))
+        except sqlite3.Error as e:
+            print(f"Template store write failed: {e}")
+            return None
+        self._count("learned")
+        return template
+
+    def templates(self) -> List[Tuple[str, str, int]]:
+        """(skeleton, sql, hits), most used first."""
+        with self._connect() as conn:
+            return conn.execute("SELECT skeleton, sql, hits FROM templates ORDER BY hits DESC").fetchall()
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM templates")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/learn counters for this process and the share of questions that skipped the model."""
+        with self._lock:
+            s = dict(self._stats)
+        lookups = s["hits"] + s["misses"]
+        s["bypass_rate"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+        return s
+
+
+_store: Optional[TemplateStore] = None
+_store_lock = threading.Lock()
+
+
+def get_template_store() -> TemplateStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TemplateStore()
+        return _store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="List or clear the learned NL→SQL templates.")
+    parser.add_argument("--path", default=TEMPLATE_PATH)
+    parser.add_argument("--clear", action="store_true", help="Forget every template")
+    args = parser.parse_args()
+
+    store = TemplateStore(args.path)
+    if args.clear:
+        store.clear()
+        print(f"Cleared {args.path}")
+        return
+    rows = store.templates()
+    print(f"{len(rows)} template(s), {sum(hits for _, _, hits in rows)} hit(s) in {args.path}")
+    for skeleton, sql, hits in rows:
+        print(f"\n[{hits} hits] {skeleton}\n{sql}")
+
+
+if __name__ == "__main__":
+    main()
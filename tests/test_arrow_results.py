@@ -0,0 +1,40 @@
+import sqlite3
+
+import pyarrow as pa
+import pytest
+
+from arrow_results import BatchBuilder
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE payments (payment_id INTEGER PRIMARY KEY, amount DECIMAL(10, 2), payment_date DATE)")
+    conn.executemany("INSERT INTO payments (amount, payment_date) VALUES (?, ?)",
+                     [(10.5, "2026-01-03"), (4, "2026-01-20"), (7.25, "2026-02-01")])
+    yield conn
+    conn.close()
+
+
+def build(conn, sql):
+    cur = conn.execute(sql)
+    return BatchBuilder([d[0] for d in cur.description]).build(cur.fetchall())
+
+
+def test_computed_value_aliased_to_date_column(conn):
+    batch = build(conn, "SELECT strftime('%Y-%m', payment_date) AS payment_date, SUM(amount) AS amount "
+                        "FROM payments GROUP BY 1 ORDER BY 1")
+    assert batch.schema.field("payment_date").type == pa.string()
+    assert batch.to_pylist() == [{"payment_date": "2026-01", "amount": 14.5},
+                                 {"payment_date": "2026-02", "amount": 7.25}]
+
+
+def test_text_literal_aliased_to_date_column(conn):
+    batch = build(conn, "SELECT 'n/a' AS start_date")
+    assert batch.to_pylist() == [{"start_date": "n/a"}]
+
+
+def test_base_columns_keep_model_types(conn):
+    batch = build(conn, "SELECT payment_date, amount FROM payments ORDER BY payment_id")
+    assert batch.schema.field("payment_date").type == pa.date32()
+    assert batch.schema.field("amount").type == pa.float64()
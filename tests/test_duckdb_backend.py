@@ -0,0 +1,103 @@
+import sqlite3
+
+import pyarrow as pa
+import pytest
+from sqlalchemy import create_engine
+
+pytest.importorskip("duckdb")
+
+import duckdb_backend
+from models import Base
+
+
+@pytest.fixture(scope="module")
+def engine(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("duckdb")
+    path = str(tmp / "rental.db")
+    eng = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(eng)
+    eng.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO payments (payment_id, booking_id, tenant_id, amount, payment_date, status, method) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, i, i % 5 + 1, None if i % 4 == 0 else 100.0 + i, f"2026-0{i % 9 + 1}-1{i % 10}",
+          "successful" if i % 3 else "failed", "upi") for i in range(1, 201)])
+    conn.commit()
+    conn.close()
+    engine = duckdb_backend.Engine(path, source="parquet", directory=str(tmp / "parquet"))
+    engine.mirror.sync()
+    return engine
+
+
+def _sqlite_rows(engine, sql, params=None):
+    conn = sqlite3.connect(engine.db_path)
+    try:
+        return [tuple(r) for r in conn.execute(sql, params or {}).fetchall()]
+    finally:
+        conn.close()
+
+
+def _duckdb_rows(engine, sql, params=None):
+    table = pa.Table.from_batches(list(engine.batches(duckdb_backend.translate(sql), params)))
+    return [tuple(r.values()) for r in table.to_pylist()]
+
+
+@pytest.mark.parametrize("sql", [
+    # Integer division on every cursor, not just the parent connection
+    "SELECT COUNT(*) / 7 AS n FROM payments",
+    "SELECT tenant_id, COUNT(*) / 3 AS thirds, SUM(payment_id) / 7 AS s FROM payments GROUP BY tenant_id ORDER BY 1",
+    # NULLs first ascending, last descending
+    "SELECT payment_id, amount FROM payments ORDER BY amount, payment_id LIMIT 60",
+    "SELECT payment_id, amount FROM payments ORDER BY amount DESC, payment_id LIMIT 60",
+    "SELECT strftime('%Y-%m', payment_date) AS month, COUNT(*) AS n, ROUND(SUM(amount), 2) AS total "
+    "FROM payments WHERE status = 'successful' GROUP BY month ORDER BY month",
+])
+def test_duckdb_matches_sqlite(engine, sql):
+    assert _duckdb_rows(engine, sql) == _sqlite_rows(engine, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    # Date functions and modifiers
+    "SELECT payment_id, date(payment_date, '+1 month'), date(payment_date, 'start of month', '-1 day'), "
+    "datetime(payment_date, '+36 hours'), strftime('%Y', payment_date) FROM payments ORDER BY payment_id LIMIT 20",
+    "SELECT CAST(julianday('2026-12-31') - julianday(payment_date) AS INTEGER) AS days FROM payments "
+    "ORDER BY payment_id LIMIT 20",
+    # CAST keeps SQLite's conversions, LIKE is case-insensitive
+    "SELECT CAST(amount AS INTEGER), CAST('12abc' AS INTEGER), CAST(' -3.5e1x' AS REAL), CAST(method AS INTEGER), "
+    "CAST(payment_id AS TEXT) || '#' FROM payments "
+    "WHERE status LIKE 'SUCC%' ORDER BY payment_id LIMIT 20",
+    # Scalar min/max are NULL when any argument is, total() of nothing is 0.0
+    "SELECT payment_id, max(amount, 150), min(amount, 150), iif(amount > 200, 'big', 'small') FROM payments "
+    "ORDER BY payment_id LIMIT 20",
+    "SELECT total(amount), total(CASE WHEN 0 THEN amount END), COUNT(amount) FROM payments",
+    # A column neither grouped nor aggregated, as SQLite allows
+    "SELECT tenant_id, method, COUNT(*) AS n FROM payments GROUP BY tenant_id ORDER BY tenant_id",
+])
+def test_translated_functions_match_sqlite(engine, sql):
+    assert _duckdb_rows(engine, sql) == _sqlite_rows(engine, sql)
+
+
+def test_named_parameters_are_translated(engine):
+    sql = "SELECT COUNT(*) FROM payments WHERE tenant_id = :tenant AND status = :status"
+    params = {"tenant": 3, "status": "successful"}
+    assert "$tenant" in duckdb_backend.translate(sql)
+    assert _duckdb_rows(engine, sql, params) == _sqlite_rows(engine, sql, params)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT rowid FROM payments",
+    "SELECT * FROM payments WHERE method GLOB 'u*'",
+    "SELECT strftime('%s', payment_date) FROM payments",
+    "SELECT date(payment_date, 'weekday 0') FROM payments",
+    "SELECT date(payment_date, '+' || tenant_id || ' days') FROM payments",
+    "SELECT tenant_id, MAX(amount) FROM payments",
+])
+def test_untranslatable_sqlite_behaviour_is_refused(sql):
+    with pytest.raises(duckdb_backend.Untranslatable):
+        duckdb_backend.translate(sql)
+
+
+def test_every_cursor_gets_sqlite_settings(engine):
+    for _ in range(3):
+        assert _duckdb_rows(engine, "SELECT 5 / 2 AS q") == [(2,)]
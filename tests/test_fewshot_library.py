@@ -0,0 +1,21 @@
+import os
+
+from fewshot_library import FewShotLibrary
+
+
+def test_index_is_saved_only_when_rows_are_appended(tmp_path):
+    path = str(tmp_path / "fewshots.jsonl")
+    lib = FewShotLibrary(path)
+    assert os.path.exists(lib.index_path)
+    os.utime(lib.index_path, ns=(0, 0))
+
+    # A complete index is loaded, not rewritten
+    again = FewShotLibrary(path)
+    assert again.n_indexed == len(again.examples)
+    assert os.stat(lib.index_path).st_mtime_ns == 0
+
+    again.add("How many users are there?", "SELECT COUNT(*) FROM users")
+    assert os.stat(lib.index_path).st_mtime_ns > 0
+    os.utime(lib.index_path, ns=(0, 0))
+    assert FewShotLibrary(path).n_indexed == len(again.examples)
+    assert os.stat(lib.index_path).st_mtime_ns == 0
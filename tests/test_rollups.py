@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine
+
+import rollups
+from models import Base
+
+QUERIES = [
+    "SELECT tenant_id, SUM(amount) AS total, COUNT(*) AS n FROM payments "
+    "WHERE status = 'successful' GROUP BY tenant_id ORDER BY tenant_id",
+    "SELECT u.first_name, u.last_name, SUM(p.amount) AS total FROM payments p JOIN users u ON u.user_id = p.tenant_id "
+    "WHERE p.status = 'successful' GROUP BY u.user_id ORDER BY total DESC, u.user_id LIMIT 3",
+    "SELECT strftime('%Y-%m', payment_date) AS month, SUM(amount), AVG(amount), COUNT(amount) FROM payments "
+    "WHERE status = 'successful' GROUP BY month ORDER BY month",
+    "SELECT pr.landlord_id, strftime('%Y', pay.payment_date) AS year, SUM(pay.amount) FROM payments pay "
+    "JOIN bookings b ON pay.booking_id = b.booking_id JOIN properties pr ON b.property_id = pr.property_id "
+    "WHERE pay.status = 'successful' GROUP BY 1, 2 ORDER BY 1, 2",
+    "SELECT p.property_type, AVG(r.rating) AS avg_rating, COUNT(*) FROM reviews r "
+    "JOIN properties p ON r.property_id = p.property_id GROUP BY p.property_type ORDER BY 1",
+]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / "rental.db")
+    eng = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(eng)
+    eng.dispose()
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO users (user_id, first_name, last_name, email, role) VALUES (?, ?, ?, ?, ?)",
+                     [(i, f"F{i}", f"L{i}", f"u{i}@x", "landlord" if i <= 3 else "tenant") for i in range(1, 13)])
+    conn.executemany("INSERT INTO properties (property_id, landlord_id, property_type, city) VALUES (?, ?, ?, ?)",
+                     [(i, i % 3 + 1, ("apartment", "house", "studio")[i % 3], "London") for i in range(1, 10)])
+    conn.executemany("INSERT INTO bookings (booking_id, property_id, tenant_id, status) VALUES (?, ?, ?, ?)",
+                     [(i, i % 9 + 1, i % 9 + 4, "confirmed") for i in range(1, 31)])
+    conn.executemany(
+        "INSERT INTO payments (payment_id, booking_id, tenant_id, amount, payment_date, status, method) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(i, i % 30 + 1, i % 9 + 4, None if i % 11 == 0 else 50.25 * (i % 7 + 1),
+          f"202{i % 2 + 5}-{i % 12 + 1:02d}-0{i % 9 + 1}",
+          ("successful", "successful", "failed", "refunded")[i % 4], "upi") for i in range(1, 301)])
+    conn.executemany("INSERT INTO reviews (review_id, property_id, tenant_id, rating) VALUES (?, ?, ?, ?)",
+                     [(i, i % 9 + 1, i % 9 + 4, i % 5 + 1) for i in range(1, 61)])
+    conn.commit()
+    rollups.install(conn)
+    yield conn
+    conn.close()
+
+
+def _rows(conn, sql):
+    return [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in conn.execute(sql)]
+
+
+def _assert_equivalent(conn, sql):
+    routed = rollups.rewrite(sql, rollups.installed(conn))
+    assert routed is not None and "rollup_" in routed
+    assert _rows(conn, routed) == _rows(conn, sql)
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_rewrite_returns_the_same_rows(conn, sql):
+    _assert_equivalent(conn, sql)
+
+
+@pytest.mark.parametrize("sql", QUERIES)
+def test_rewrite_stays_equivalent_after_writes(conn, sql):
+    conn.execute("INSERT INTO payments (payment_id, booking_id, tenant_id, amount, payment_date, status) "
+                 "VALUES (1000, 3, 5, 999.5, '2026-03-01', 'successful')")
+    conn.execute("UPDATE payments SET status = 'successful' WHERE status = 'failed' AND payment_id % 4 = 0")
+    conn.execute("UPDATE payments SET amount = amount * 2 WHERE payment_id % 5 = 0")
+    conn.execute("DELETE FROM payments WHERE payment_id % 13 = 0")
+    conn.execute("UPDATE bookings SET property_id = 1 WHERE booking_id IN (2, 4)")
+    conn.execute("UPDATE properties SET landlord_id = 2, property_type = 'villa' WHERE property_id = 3")
+    conn.execute("INSERT INTO reviews (review_id, property_id, tenant_id, rating) VALUES (1000, 3, 4, 5)")
+    conn.commit()
+    assert all(rollups.check(conn, rollups.ROLLUPS[name]) == 0 for name in rollups.installed(conn))
+    _assert_equivalent(conn, sql)
+
+
+@pytest.mark.parametrize("sql", [
+    # Not the rollup's filter
+    "SELECT tenant_id, SUM(amount) FROM payments GROUP BY tenant_id",
+    "SELECT tenant_id, SUM(amount) FROM payments WHERE status = 'failed' GROUP BY tenant_id",
+    # Needs fact columns the rollup does not store
+    "SELECT tenant_id, SUM(amount) FROM payments WHERE status = 'successful' AND amount > 100 GROUP BY tenant_id",
+    "SELECT method, SUM(amount) FROM payments WHERE status = 'successful' GROUP BY method",
+    "SELECT tenant_id, MAX(amount) FROM payments WHERE status = 'successful' GROUP BY tenant_id",
+    "SELECT COUNT(DISTINCT tenant_id) FROM payments WHERE status = 'successful'",
+    # No aggregate
+    "SELECT tenant_id FROM payments WHERE status = 'successful'",
+])
+def test_queries_a_rollup_cannot_answer_are_left_alone(conn, sql):
+    assert rollups.rewrite(sql, rollups.installed(conn)) is None
+
+
+def test_only_available_rollups_are_used(conn):
+    assert rollups.rewrite(QUERIES[0], []) is None
+    assert rollups.rewrite(QUERIES[0], ["rollup_landlord_revenue"]) is None
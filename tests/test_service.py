@@ -0,0 +1,67 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+import service
+
+
+def _scope(path, spec_version):
+    return {"type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"", "headers": [(b"content-type", b"application/json")],
+            "server": ("test", 80), "client": ("test", 1)}
+
+
+async def _disconnecting_request(path, body, spec_version):
+    """One request whose client goes away before reading any of the body."""
+    messages = [{"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if spec_version == "2.4":
+            raise OSError("connection reset")
+        await asyncio.sleep(0)
+
+    try:
+        await service.app(_scope(path, spec_version), receive, send)
+    except Exception:
+        pass  # ClientDisconnect
+
+
+@pytest.mark.parametrize("spec_version", ["2.3", "2.4"])
+@pytest.mark.parametrize("path,body", [("/execute", {"sql": "SELECT 1"}), ("/export", {"sql": "SELECT 1"})])
+def test_slot_released_when_client_disconnects_before_body(monkeypatch, spec_version, path, body):
+    async def checked_sql(sql, *args, **kwargs):
+        return sql
+
+    monkeypatch.setattr(service, "_checked_sql", checked_sql)
+    free = service._inflight._value
+
+    async def run():
+        # More requests than there are slots: a leak would turn the last ones into 503s
+        for _ in range(service.SERVICE_MAX_INFLIGHT + 1):
+            await _disconnecting_request(path, body, spec_version)
+
+    asyncio.run(run())
+    assert service._inflight._value == free
+
+
+def test_sql_checks_run_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def record(name, result):
+        def fn(*args, **kwargs):
+            threads.append((name, threading.current_thread()))
+            return result(*args) if callable(result) else result
+        return fn
+
+    monkeypatch.setattr(service.db, "missing_indexes", record("missing_indexes", frozenset()))
+    monkeypatch.setattr(service, "validate_sql", record("validate_sql", lambda sql, *args: sql))
+    monkeypatch.setattr(service, "_passes_cost_guard", record("cost_guard", True))
+    assert asyncio.run(service._checked_sql("SELECT 1")) == "SELECT 1"
+    assert [name for name, _ in threads] == ["missing_indexes", "validate_sql", "cost_guard"]
+    assert all(thread is not threading.main_thread() for _, thread in threads)
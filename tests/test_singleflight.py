@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from singleflight import FlightCancelled, SingleFlight
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def _run_concurrently(flight, key, fn, callers, **kwargs):
+    """Start `callers` threads on flight.do(key, fn); returns (threads, results)."""
+    results = []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn, **kwargs))
+        except BaseException as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    runs = []
+
+    def fn(call):
+        runs.append(call)
+        release.wait(5)
+        return {"rows": 3}
+
+    threads, results = _run_concurrently(flight, "q", fn, 8)
+    # Everyone has joined the one in-progress call before it finishes
+    _wait_for(lambda: runs and runs[0].participants == 8)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(runs) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert all(value is results[0][0] for value, _ in results)
+
+    # The finished call is unpublished, so the next caller runs fn again
+    assert flight.do("q", fn) == ({"rows": 3}, False)
+    assert len(runs) == 2
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    started = []
+
+    def fn(call):
+        started.append(call)
+        release.wait(5)
+        return len(started)
+
+    a, _ = _run_concurrently(flight, "a", fn, 1)
+    b, _ = _run_concurrently(flight, "b", fn, 1)
+    _wait_for(lambda: len(started) == 2)
+    release.set()
+    for t in a + b:
+        t.join(5)
+
+
+def test_error_is_raised_in_every_caller():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    runs = []
+
+    def fn(call):
+        runs.append(call)
+        release.wait(5)
+        raise ValueError("no such table: nope")
+
+    threads, results = _run_concurrently(flight, "q", fn, 4)
+    _wait_for(lambda: runs and runs[0].participants == 4)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert len(runs) == 1
+    assert len(results) == 4 and all(isinstance(e, ValueError) for e in results)
+
+
+def test_cancelled_waiter_leaves_without_stopping_the_work():
+    flight = SingleFlight("test", poll_interval=0.01)
+    release = threading.Event()
+    idle = threading.Event()
+    runs = []
+
+    def fn(call):
+        call.on_idle = idle.set
+        runs.append(call)
+        release.wait(5)
+        return "done"
+
+    leader, results = _run_concurrently(flight, "q", fn, 1)
+    _wait_for(lambda: runs)
+    cancelled = threading.Event()
+    waiter, waiter_results = _run_concurrently(flight, "q", fn, 1, cancelled=cancelled)
+    _wait_for(lambda: runs[0].participants == 2)
+    cancelled.set()
+    waiter[0].join(5)
+    assert isinstance(waiter_results[0], FlightCancelled)
+    assert not idle.is_set()
+
+    # Once the last caller leaves as well, the work is told to stop
+    runs[0].leave()
+    assert idle.is_set()
+    release.set()
+    leader[0].join(5)
+    assert results == [("done", False)]
+
+
+def test_do_async_coalesces_and_cancels_only_when_everyone_left():
+    flight = SingleFlight("test")
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.05)
+        return "rows"
+
+    async def coalesced():
+        results = await asyncio.gather(*(flight.do_async("q", work) for _ in range(5)))
+        assert len(runs) == 1
+        assert sorted(shared for _, shared in results) == [False] + [True] * 4
+
+    async def cancelled():
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        first = asyncio.ensure_future(flight.do_async("slow", slow))
+        second = asyncio.ensure_future(flight.do_async("slow", slow))
+        await started.wait()
+        task = flight._tasks[(id(asyncio.get_running_loop()), "slow")][0]
+        first.cancel()
+        await asyncio.sleep(0)
+        assert not task.cancelled() and not task.done()
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await asyncio.sleep(0)
+        assert task.cancelled()
+
+    asyncio.run(coalesced())
+    asyncio.run(cancelled())
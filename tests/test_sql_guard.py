@@ -0,0 +1,79 @@
+import pytest
+
+from prompts import FEWSHOTS, fewshots, instructions, schema_ddl
+from sql_guard import SQLValidationError, validate_sql
+
+
+def test_missing_index_table_is_rejected():
+    for sql in ("SELECT COUNT(*) FROM booking_intervals",
+                "SELECT b.booking_id FROM bookings b JOIN booking_intervals bi ON bi.booking_id = b.booking_id"):
+        assert validate_sql(sql, 10).endswith("LIMIT 10")
+        with pytest.raises(SQLValidationError, match="no such table: booking_intervals"):
+            validate_sql(sql, 10, missing={"booking_intervals"})
+
+
+def test_cte_may_shadow_missing_index_table():
+    sql = "WITH booking_intervals AS (SELECT 1 AS x) SELECT x FROM booking_intervals"
+    assert validate_sql(sql, 10, missing={"booking_intervals"}).startswith(sql)
+
+
+def test_match_on_missing_fts_table_is_rejected():
+    sql = "SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH 'nois*'"
+    validate_sql(sql, 10, missing={"booking_intervals"})
+    with pytest.raises(SQLValidationError, match="no such table: reviews_fts"):
+        validate_sql(sql, 10, missing={"properties_fts", "reviews_fts"})
+
+
+@pytest.mark.parametrize("missing", [{"booking_intervals"}, {"properties_fts", "reviews_fts"},
+                                     {"booking_intervals", "properties_fts", "reviews_fts"}])
+def test_prompt_parts_leave_out_missing_index_tables(missing):
+    prompt = schema_ddl(missing) + instructions(missing)
+    assert not any(table in prompt for table in missing)
+    assert all(table in schema_ddl() + instructions() for table in missing)
+    examples = fewshots(missing)
+    assert len(examples) == len(FEWSHOTS)
+    for ex in examples:
+        assert not any(table in ex["sql"] for table in missing)
+        validate_sql(ex["sql"], 10, missing=missing)
+
+
+@pytest.mark.parametrize("sql,params,expected", [
+    ("SELECT * FROM users LIMIT 100000000", None, "SELECT * FROM users LIMIT 1000"),
+    ("SELECT * FROM users LIMIT 100000000 OFFSET 5", None, "SELECT * FROM users LIMIT 1000 OFFSET 5"),
+    ("SELECT * FROM users LIMIT 5, 100000000", None, "SELECT * FROM users LIMIT 5, 1000"),
+    ("SELECT * FROM users LIMIT 20", None, "SELECT * FROM users LIMIT 20"),
+    ("SELECT * FROM users LIMIT :n", {"n": 20}, "SELECT * FROM users LIMIT :n"),
+    ("SELECT * FROM users LIMIT :n", {"n": 10 ** 8}, "SELECT * FROM (\nSELECT * FROM users LIMIT :n\n) LIMIT 1000"),
+    ("SELECT * FROM users LIMIT -1", None, "SELECT * FROM (\nSELECT * FROM users LIMIT -1\n) LIMIT 1000"),
+])
+def test_top_level_limit_is_capped(sql, params, expected):
+    assert validate_sql(sql, 1000, params) == expected
+
+
+def test_inner_limits_are_left_alone():
+    sql = "WITH t AS (SELECT * FROM users LIMIT 100000000) SELECT * FROM t LIMIT 20"
+    assert validate_sql(sql, 1000) == sql
+
+
+@pytest.mark.parametrize("sql", ["SELECT * FROM payments /* trailing",
+                                 "SELECT * FROM payments LIMIT :n /* trailing"])
+def test_unterminated_comment_is_rejected(sql):
+    with pytest.raises(SQLValidationError, match="unterminated"):
+        validate_sql(sql, 5, {"n": 10 ** 8})
+    assert validate_sql(sql + " */", 5, {"n": 10 ** 8}).endswith("LIMIT 5")
+
+
+@pytest.mark.parametrize("sql", ["SELECT * FROM properties_fts_data",
+                                 "SELECT * FROM reviews_fts_idx",
+                                 "SELECT d.* FROM reviews_fts f JOIN reviews_fts_data d ON d.id = f.rowid"])
+def test_shadow_tables_cannot_be_read_directly(sql):
+    with pytest.raises(SQLValidationError, match="is not allowed"):
+        validate_sql(sql, 5)
+
+
+def test_virtual_tables_still_read_their_shadow_tables():
+    for sql in ("SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH 'nois*'",
+                "SELECT p.property_id FROM properties p JOIN properties_fts f ON f.rowid = p.property_id "
+                "WHERE properties_fts MATCH 'garden'",
+                "SELECT booking_id FROM booking_intervals WHERE start_day <= 5 AND end_day >= 3"):
+        assert validate_sql(sql, 5).endswith("LIMIT 5")
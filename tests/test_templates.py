@@ -0,0 +1,86 @@
+import pytest
+
+import db
+import nlsql
+import templates
+from prompts import FEWSHOTS
+
+TOP_TENANTS = FEWSHOTS[0]
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = templates.TemplateStore(str(tmp_path / "templates.db"))
+    monkeypatch.setattr(templates, "_store", store)
+    monkeypatch.setattr(templates, "cities", lambda: {"london": "London", "bradford": "Bradford"})
+    monkeypatch.setattr(nlsql, "prompt_fingerprint", lambda: "fp")
+    monkeypatch.setattr(db, "missing_indexes", lambda: frozenset())
+    return store
+
+
+def test_large_top_n_from_template_is_capped(store):
+    assert store.learn(templates.extract(TOP_TENANTS["nl"]), TOP_TENANTS["sql"], 1.0, "fp") is not None
+
+    data = nlsql._templated("Who are the top 50000 tenants by total rent paid?")
+    assert data["params"] == {"num0": 50000}
+    assert data["sql"].endswith(f"\n) LIMIT {nlsql.MAX_RESULT_ROWS}")
+
+    data = nlsql._templated("Who are the top 5 tenants by total rent paid?")
+    assert data["params"] == {"num0": 5}
+    assert data["sql"].endswith("LIMIT :num0")
+
+
+CITIES = {"london": "London", "bradford": "Bradford", "new york": "New York"}
+LISTINGS_SQL = ("SELECT property_id, title, rent_price FROM properties WHERE status = 'available' "
+                "AND bedrooms = 2 AND rent_price < 2500 AND city = 'London' ORDER BY rent_price")
+
+
+def test_extract_turns_entities_into_slots():
+    a = templates.extract("Available 2BHKs under $2,500 in London", CITIES)
+    b = templates.extract("available 3 bedroom under $4000 in bradford", CITIES)
+    assert a.skeleton == b.skeleton == "<property_status> <bhk> under $<num> in <city>"
+    assert a.values() == {"property_status0": "available", "bhk0": 2, "num0": 2500, "city0": "London"}
+    assert b.values() == {"property_status0": "available", "bhk0": 3, "num0": 4000, "city0": "Bradford"}
+    # Multi-word cities are one slot
+    assert templates.extract("Show villas in New York", CITIES).values() == {
+        "property_types0": "villa", "city0": "New York"}
+
+
+def test_learned_template_binds_new_values(store):
+    learned = store.learn(templates.extract("Available 2BHKs under $2,500 in London", CITIES), LISTINGS_SQL, 0.9, "fp")
+    assert learned.sql == ("SELECT property_id, title, rent_price FROM properties WHERE status = :property_status0 "
+                           "AND bedrooms = :bhk0 AND rent_price < :num0 AND city = :city0 ORDER BY rent_price")
+    assert learned.fixed == {}
+
+    template, params = store.match(templates.extract("available 3 bedroom under $4000 in bradford", CITIES), "fp")
+    assert params == {"property_status0": "available", "bhk0": 3, "num0": 4000, "city0": "Bradford"}
+    assert templates.render(template.sql, params) == (
+        "SELECT property_id, title, rent_price FROM properties WHERE status = 'available' "
+        "AND bedrooms = 3 AND rent_price < 4000 AND city = 'Bradford' ORDER BY rent_price")
+    # Templates are tied to the prompt they were learned under
+    assert store.match(templates.extract("available 3 bedroom under $4000 in bradford", CITIES), "other") is None
+    assert store.stats()["hits"] == 1 and store.stats()["learned"] == 1
+
+
+def test_binding_keeps_case_and_like_wildcards(store):
+    sql = "SELECT COUNT(*) FROM properties WHERE LOWER(city) LIKE '%london%' AND property_type = 'villa'"
+    learned = store.learn(templates.extract("How many villas in London?", CITIES), sql, 0.9, "fp")
+    assert learned.params == {"property_types0": {"case": "", "wrap": "{}"},
+                              "city0": {"case": "lower", "wrap": "%{}%"}}
+    _, params = store.match(templates.extract("How many houses in New York?", CITIES), "fp")
+    assert params == {"property_types0": "house", "city0": "%new york%"}
+
+
+def test_value_used_twice_stays_fixed(store):
+    sql = "SELECT p.title FROM properties p WHERE p.bedrooms = 2 AND p.bathrooms = 2 AND p.city = 'London'"
+    learned = store.learn(templates.extract("2BHK in London", CITIES), sql, 0.9, "fp")
+    assert learned.params.keys() == {"city0"}
+    assert learned.fixed == {"bhk0": 2}
+    assert store.match(templates.extract("2BHK in Bradford", CITIES), "fp")[1] == {"city0": "Bradford"}
+    assert store.match(templates.extract("3BHK in Bradford", CITIES), "fp") is None
+
+
+def test_nothing_is_learned_without_a_parameter(store):
+    question = templates.extract("How many users are there?", CITIES)
+    assert store.learn(question, "SELECT COUNT(*) FROM users", 0.9, "fp") is None
+    assert store.templates() == []
@@ -0,0 +1,161 @@
+# text_search.py
+"""FTS5 full-text indexes over property text and review comments.
+
+properties_fts (title, description) and reviews_fts (comment) are
+external-content FTS5 tables: they index the base tables' text without
+storing a second copy, and their rowid is the base row's primary key.
+A "mentions a balcony" question then becomes an index lookup ranked by
+bm25 instead of a LIKE '%balcony%' scan:
+
+    SELECT p.property_id, p.title
+    FROM properties_fts
+    JOIN properties p ON p.property_id = properties_fts.rowid
+    WHERE properties_fts MATCH 'balcon*'
+    ORDER BY bm25(properties_fts)
+
+Tokens are stemmed (porter) and case/diacritic-folded. Triggers on the
+base tables keep the indexes in sync.
+
+    python text_search.py --install    # create and fill the indexes, add their triggers
+    python text_search.py --check      # FTS5 integrity check against the base tables
+"""
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+TOKENIZE = "porter unicode61 remove_diacritics 2"
+
+
+@dataclass(frozen=True)
+class TextIndex:
+    name: str
+    table: str
+    pk: str
+    columns: Tuple[str, ...]
+
+    def ddl(self) -> str:
+        return (f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.name} USING fts5({', '.join(self.columns)}, "
+                f"content='{self.table}', content_rowid='{self.pk}', tokenize='{TOKENIZE}')")
+
+
+INDEX_LIST = [
+    TextIndex("properties_fts", "properties", "property_id", ("title", "description")),
+    TextIndex("reviews_fts", "reviews", "review_id", ("comment",)),
+]
+INDEXES: Dict[str, TextIndex] = {ix.name: ix for ix in INDEX_LIST}
+
+
+def trigger_ddl(ix: TextIndex) -> Dict[str, str]:
+    """Trigger name → CREATE TRIGGER statement (the external-content pattern from the FTS5 docs)."""
+    cols = ", ".join(ix.columns)
+    new = ", ".join(f"NEW.{c}" for c in ix.columns)
+    old = ", ".join(f"OLD.{c}" for c in ix.columns)
+    insert = f"INSERT INTO {ix.name} (rowid, {cols}) VALUES (NEW.{ix.pk}, {new})"
+    delete = f"INSERT INTO {ix.name} ({ix.name}, rowid, {cols}) VALUES ('delete', OLD.{ix.pk}, {old})"
+    prefix = f"trg_{ix.name}"
+    return {
+        f"{prefix}_ins": f"CREATE TRIGGER {prefix}_ins AFTER INSERT ON {ix.table} BEGIN\n  {insert};\nEND",
+        f"{prefix}_del": f"CREATE TRIGGER {prefix}_del AFTER DELETE ON {ix.table} BEGIN\n  {delete};\nEND",
+        f"{prefix}_upd": (f"CREATE TRIGGER {prefix}_upd AFTER UPDATE OF {ix.pk}, {cols} ON {ix.table} BEGIN\n"
+                          f"  {delete};\n  {insert};\nEND"),
+    }
+
+
+def refresh(conn: sqlite3.Connection, ix: TextIndex) -> None:
+    conn.execute(f"INSERT INTO {ix.name} ({ix.name}) VALUES ('rebuild')")
+
+
+def install(conn: sqlite3.Connection, names: Optional[List[str]] = None) -> List[str]:
+    """Create, fill and start maintaining the indexes (all by default) in one transaction."""
+    names = list(INDEXES) if names is None else names
+    with conn:
+        for name in names:
+            ix = INDEXES[name]
+            conn.execute(ix.ddl())
+            for trigger, ddl in trigger_ddl(ix).items():
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                conn.execute(ddl)
+            refresh(conn, ix)
+    return names
+
+
+def installed(conn) -> List[str]:
+    """Indexes whose table and triggers all exist."""
+    present = {name for (name,) in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')").fetchall()}
+    return [name for name, ix in INDEXES.items() if name in present and set(trigger_ddl(ix)) <= present]
+
+
+def drop_triggers(conn: sqlite3.Connection) -> List[str]:
+    """Stop maintaining every installed index (e.g. before a bulk load); returns their names."""
+    names = installed(conn)
+    with conn:
+        for name in names:
+            for trigger in trigger_ddl(INDEXES[name]):
+                conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    return names
+
+
+def drop(conn: sqlite3.Connection) -> None:
+    drop_triggers(conn)
+    with conn:
+        for name in INDEXES:
+            conn.execute(f"DROP TABLE IF EXISTS {name}")
+
+
+def ensure(path: str) -> None:
+    """Install the indexes a SQLite file does not have yet (init_db.py --migrate)."""
+    conn = sqlite3.connect(path)
+    try:
+        missing = [name for name in INDEXES if name not in installed(conn)]
+        if missing:
+            started = time.perf_counter()
+            install(conn, missing)
+            print(f"Built {', '.join(missing)} on {path} in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+def check(conn: sqlite3.Connection, ix: TextIndex) -> bool:
+    """FTS5 integrity check, including agreement with the base table."""
+    try:
+        conn.execute(f"INSERT INTO {ix.name} ({ix.name}, rank) VALUES ('integrity-check', 1)")
+    except sqlite3.DatabaseError as e:
+        print(f"{ix.name}: {e}")
+        return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the FTS5 indexes over property and review text.")
+    parser.add_argument("--db", default=None, help="SQLite file (default: DATABASE_URL)")
+    parser.add_argument("--install", action="store_true", help="Create/rebuild the indexes and their triggers")
+    parser.add_argument("--drop", action="store_true", help="Remove the indexes and their triggers")
+    parser.add_argument("--check", action="store_true", help="Run the FTS5 integrity check")
+    args = parser.parse_args()
+
+    if args.db is None:
+        from db import _sqlite_path
+
+        args.db = _sqlite_path()
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.drop:
+            drop(conn)
+            print(f"Dropped full-text indexes from {args.db}")
+        if args.install:
+            started = time.perf_counter()
+            install(conn)
+            print(f"Installed {len(INDEXES)} full-text index(es) on {args.db} in {time.perf_counter() - started:.1f}s")
+        for name in installed(conn):
+            rows = conn.execute(f"SELECT COUNT(*) FROM {INDEXES[name].table}").fetchone()[0]
+            status = f", {'ok' if check(conn, INDEXES[name]) else 'FAILED'}" if args.check else ""
+            print(f"  {name}: {rows} rows{status}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+# tracing.py
+"""Per-stage timing spans and pipeline metrics.
+
+`span("llm")` times a block and feeds the process-wide histogram for that
+stage; when a Trace is active in the current context (`use_trace`) the span
+is also appended to it. A finished trace is written as one JSON line to
+TRACE_LOG ("stderr" or a file path), and the metrics render in Prometheus
+text format (`render_prometheus`, or served on METRICS_PORT).
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_LOG = os.getenv("TRACE_LOG", "")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Histogram buckets in seconds (Prometheus "le" bounds)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_HELP = {
+    "nlsql_stage_duration_seconds": ("histogram", "Time spent in each pipeline stage"),
+    "nlsql_stage_errors_total": ("counter", "Exceptions raised inside a pipeline stage"),
+    "nlsql_cache_requests_total": ("counter", "Cache lookups by cache and result"),
+    "nlsql_prompt_tokens_total": ("counter", "Estimated prompt tokens sent to the model"),
+    "nlsql_response_tokens_total": ("counter", "Estimated tokens in model responses"),
+    "nlsql_rows_returned_total": ("counter", "Rows returned by executed queries"),
+    "nlsql_questions_total": ("counter", "Questions translated, by outcome"),
+}
+
+_current: contextvars.ContextVar = contextvars.ContextVar("nlsql_trace", default=None)
+
+
+class Trace:
+    """Spans and attributes collected while answering one question."""
+
+    def __init__(self, question: str = ""):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.question = question
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.attrs: Dict[str, Any] = {}
+        self.error: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, attrs: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self._t0) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **attrs,
+            })
+
+    def set(self, **attrs: Any) -> None:
+        with self._lock:
+            self.attrs.update(attrs)
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Milliseconds per stage name (a stage may run more than once)."""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s["name"]] = round(totals.get(s["name"], 0.0) + s["duration_ms"], 3)
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "question": self.question,
+            "started": self.started,
+            "duration_ms": self.duration_ms,
+            "error": self.error,
+            "attrs": dict(self.attrs),
+            "spans": list(self.spans),
+        }
+
+    def finish(self) -> None:
+        """Close the trace and write it to the JSON log (once)."""
+        if self.duration_ms is not None:
+            return
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+        if _logger().handlers:
+            _logger().info(json.dumps(self.to_dict(), default=str))
+
+
+class Metrics:
+    """Thread-safe counters and per-stage duration histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.histograms: Dict[str, List[Any]] = {}  # stage → [bucket counts, sum, count]
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0.0) + value
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            hist = self.histograms.setdefault(stage, [[0] * len(BUCKETS), 0.0, 0])
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[0][i] += 1
+            hist[1] += seconds
+            hist[2] += 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self.histograms.items()}
+        lines: List[str] = []
+
+        def header(name: str) -> None:
+            kind, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        name = "nlsql_stage_duration_seconds"
+        if histograms:
+            header(name)
+        for stage, (buckets, total, count) in sorted(histograms.items()):
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {n}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        seen = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in seen:
+                header(name)
+                seen.add(name)
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _logger() -> logging.Logger:
+    logger = logging.getLogger("nlsql.trace")
+    if TRACE_LOG and not logger.handlers:
+        handler = logging.StreamHandler() if TRACE_LOG == "stderr" else logging.FileHandler(TRACE_LOG)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Make `trace` the target of spans in this context (threads need copy_context)."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time a stage. The yielded dict takes attributes (tokens, rows, ...) for the trace."""
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        attrs["error"] = f"{type(e).__name__}: {e}"
+        metrics.inc("nlsql_stage_errors_total", stage=name)
+        trace = _current.get()
+        if trace is not None and trace.error is None:
+            trace.error = f"{name}: {attrs['error']}"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        metrics.observe(name, duration)
+        trace = _current.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, attrs)
+
+
+def cache_event(cache: str, hit: bool) -> None:
+    metrics.inc("nlsql_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+    trace = _current.get()
+    if trace is not None:
+        trace.set(**{f"{cache}_cache": "hit" if hit else "miss"})
+
+
+def count(name: str, value: float = 1.0, **labels: str) -> None:
+    metrics.inc(name, value, **labels)
+
+
+def render_prometheus() -> str:
+    return metrics.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread (once per process); port 0 disables it."""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+        return _server